@@ -0,0 +1,65 @@
+"""
+Microbenchmark for the COPY row conversion on a wide table.
+
+Compares the per-row path (`df.iterrows` + `generate_copy_row`) with the vectorized
+column converters from `utils.convert`, and prints rows/sec for both.
+
+    python -m benchmarks.bench_convert --rows 20000 --columns 50
+"""
+import time
+import click
+import numpy as np
+import pandas as pd
+
+from utils.convert import compile_converters, encode_copy_buffer
+from utils.db import generate_copy_row
+
+_COLUMN_TYPES = ('bigint', 'numeric', 'text', 'boolean', 'timestamp without time zone')
+
+
+def make_frame(rows: int, columns: int, seed: int = 0) -> tuple[pd.DataFrame, list[tuple[str, str]]]:
+    rng = np.random.default_rng(seed)
+    data = {}
+    selected_columns = []
+    for i in range(columns):
+        dtype = _COLUMN_TYPES[i % len(_COLUMN_TYPES)]
+        name = f"col{i}"
+        if dtype == 'bigint':
+            values = rng.integers(0, 1_000_000, rows).astype(float)
+            values[rng.random(rows) < 0.05] = np.nan
+        elif dtype == 'numeric':
+            values = rng.random(rows) * 1000
+        elif dtype == 'text':
+            values = np.char.add('value ', rng.integers(0, 1000, rows).astype(str)).astype(object)
+        elif dtype == 'boolean':
+            values = rng.random(rows) < 0.5
+        else:
+            values = pd.to_datetime(rng.integers(1_500_000_000, 1_700_000_000, rows), unit='s')
+        data[name] = values
+        selected_columns.append((name, dtype))
+    return pd.DataFrame(data), selected_columns
+
+def bench_iterrows(df: pd.DataFrame, selected_columns: list[tuple[str, str]]) -> float:
+    start = time.perf_counter()
+    rows = df.where(pd.notnull(df), None).fillna('NULL')
+    ''.join(generate_copy_row(row, selected_columns) for _, row in rows.iterrows())
+    return time.perf_counter() - start
+
+def bench_vectorized(df: pd.DataFrame, selected_columns: list[tuple[str, str]]) -> float:
+    start = time.perf_counter()
+    encode_copy_buffer(df, selected_columns, compile_converters(selected_columns))
+    return time.perf_counter() - start
+
+@click.command()
+@click.option('--rows', type=int, default=20000, show_default=True, help='Number of rows')
+@click.option('--columns', type=int, default=50, show_default=True, help='Number of columns')
+def main(rows: int, columns: int):
+    df, selected_columns = make_frame(rows, columns)
+    before = bench_iterrows(df, selected_columns)
+    after = bench_vectorized(df, selected_columns)
+    print(f"iterrows + generate_copy_row: {rows / before:12,.0f} rows/sec")
+    print(f"vectorized converters:        {rows / after:12,.0f} rows/sec")
+    print(f"speedup:                      {before / after:12.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+End-to-end load benchmark against a throwaway local PostgreSQL.
+
+A cluster is created with initdb in a temporary directory, started with pg_ctl on a Unix
+socket only, and removed afterwards. The PostgreSQL binaries are taken from `--pg-bin`, the
+`PG_BIN` environment variable or the PATH.
+
+    python -m benchmarks.bench_load --rows 1000000 --engine copy --engine insert --workers 1 --workers 4 --output load.json
+"""
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator
+import click
+
+from benchmarks.generate import DEFAULT_COLUMNS, create_table_statement, generate_csv, parse_columns
+from benchmarks.results import peak_rss_mb, write_results
+from db import connect, get_db, truncate_table
+from loader import load_parts, load_rows
+from utils.reader import split_byte_ranges
+
+_PORT = 55432
+
+
+def _pg_command(pg_bin: str|None, name: str) -> str:
+    command = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+    if not command or not os.path.exists(command):
+        raise click.ClickException(f"{name} not found, pass --pg-bin or set PG_BIN")
+    return command
+
+@contextmanager
+def local_postgres(pg_bin: str|None) -> Iterator[str]:
+    """
+    Runs a throwaway PostgreSQL cluster and points the `DB_*` environment variables at it.
+
+    Args:
+        pg_bin (str|None): The directory with initdb and pg_ctl, the PATH when None.
+
+    Yields:
+        str: The data directory of the cluster.
+    """
+    directory = tempfile.mkdtemp(prefix='csv2pg-bench-')
+    data = os.path.join(directory, 'data')
+    pg_ctl = _pg_command(pg_bin, 'pg_ctl')
+    options = f"-k {directory} -p {_PORT} -c listen_addresses='' -c fsync=off -c synchronous_commit=off"
+    try:
+        subprocess.run([_pg_command(pg_bin, 'initdb'), '-D', data, '-U', 'postgres', '--auth=trust', '-E', 'UTF8'],
+                       check=True, capture_output=True, text=True)
+        subprocess.run([pg_ctl, '-D', data, '-o', options, '-l', os.path.join(directory, 'log'), '-w', 'start'],
+                       check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise click.ClickException(f"Could not start PostgreSQL: {e.stderr.strip() or e.stdout.strip()}") from e
+    environ = {key: os.environ.get(key) for key in ('DB_HOST', 'DB_PORT', 'DB_NAME', 'DB_USER', 'DB_PASSWORD')}
+    # Set before the workers are spawned, so they connect to the same cluster
+    os.environ.update({'DB_HOST': directory, 'DB_PORT': str(_PORT), 'DB_NAME': 'postgres', 'DB_USER': 'postgres', 'DB_PASSWORD': ''})
+    try:
+        yield data
+    finally:
+        for key, value in environ.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        subprocess.run([pg_ctl, '-D', data, '-m', 'fast', '-w', 'stop'], capture_output=True)
+        shutil.rmtree(directory, ignore_errors=True)
+
+def run_load(csv_file: str, selected_columns: list[tuple[str, str]], checkpoint_file: str, workers: int, **load_options) -> float:
+    """
+    Loads the file into the `public.bench` table once, emptying it first.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        selected_columns (list[tuple[str, str]]): The columns of the file.
+        checkpoint_file (str): The checkpoint file path.
+        workers (int): The number of worker processes, 1 to load in this process.
+        **load_options: Passed on to `load_rows`.
+
+    Returns:
+        float: The seconds the load took.
+    """
+    with get_db() as conn:
+        truncate_table(conn, 'public', 'bench')
+    start = time.perf_counter()
+    if workers > 1:
+        parts = [(byte_range, -1, byte_range[0]) for byte_range in split_byte_ranges(csv_file, workers)]
+        _, errors = load_parts(csv_file, selected_columns, 'public', 'bench', checkpoint_file, parts, **load_options)
+        if errors:
+            raise click.ClickException('\n'.join(errors))
+    else:
+        with connect(load_options.get('engine', 'copy')) as conn:
+            load_rows(conn, csv_file, selected_columns, 'public', 'bench', checkpoint_file, **load_options)
+    return time.perf_counter() - start
+
+@click.command()
+@click.option('--rows', type=int, default=500000, show_default=True, help='Number of rows')
+@click.option('--columns', 'spec', type=str, default=DEFAULT_COLUMNS, show_default=True, help='Column types, e.g. bigint:2,text:3')
+@click.option('--null-ratio', type=float, default=0.05, show_default=True, help='Fraction of null values')
+@click.option('--quote-ratio', type=float, default=0.01, show_default=True, help='Fraction of text values that need quoting')
+@click.option('--text-width', type=int, default=16, show_default=True, help='Characters per text value')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed')
+@click.option('--engine', 'engines', type=click.Choice(['copy', 'insert', 'prepared']), multiple=True, default=['copy'], show_default=True, help='Engines to run, repeatable')
+@click.option('--workers', 'worker_counts', type=click.IntRange(min=1), multiple=True, default=[1], show_default=True, help='Worker counts to run, repeatable')
+@click.option('--batch-size', type=click.IntRange(min=1), default=1000, show_default=True, help='Rows per batch')
+@click.option('--adaptive-batch', is_flag=True, help='Adapt the batch size to the measured throughput')
+@click.option('--pipeline', is_flag=True, help='Read, encode and send in separate threads')
+@click.option('--in-flight', type=click.IntRange(min=1), default=8, show_default=True, help='Batches the prepared engine sends before waiting for their results')
+@click.option('--chunk-rows', type=int, default=100000, show_default=True, help='Rows per chunk')
+@click.option('--repeat', type=click.IntRange(min=1), default=1, show_default=True, help='Runs per case, the fastest is kept')
+@click.option('--pg-bin', type=str, envvar='PG_BIN', default=None, help='Directory with initdb and pg_ctl')
+@click.option('--output', type=str, default=None, help='JSON file to write the results to')
+def main(rows: int, spec: str, null_ratio: float, quote_ratio: float, text_width: int, seed: int, engines: tuple[str, ...],
+         worker_counts: tuple[int, ...], batch_size: int, adaptive_batch: bool, pipeline: bool, in_flight: int, chunk_rows: int, repeat: int, pg_bin: str|None, output: str|None):
+    params = {'rows': rows, 'columns': spec, 'null_ratio': null_ratio, 'quote_ratio': quote_ratio, 'text_width': text_width, 'seed': seed,
+              'batch_size': batch_size, 'adaptive_batch': adaptive_batch, 'pipeline': pipeline, 'in_flight': in_flight, 'chunk_rows': chunk_rows, 'repeat': repeat}
+    selected_columns = parse_columns(spec)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, local_postgres(pg_bin):
+        csv_file = os.path.join(directory, 'bench.csv')
+        checkpoint_file = os.path.join(directory, 'checkpoint.txt')
+        size = generate_csv(csv_file, selected_columns, rows, seed, null_ratio, quote_ratio, text_width)
+        with get_db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(create_table_statement(selected_columns, 'bench'))
+            conn.commit()
+        for engine, workers in itertools.product(engines, worker_counts):
+            seconds = min(run_load(csv_file, selected_columns, checkpoint_file, workers, engine=engine, batch_size=batch_size,
+                                   adaptive_batch=adaptive_batch, pipeline=pipeline, in_flight=in_flight, chunk_rows=chunk_rows)
+                          for _ in range(repeat))
+            case = f"{engine}_workers{workers}"
+            results[case] = {'seconds': seconds, 'rows_per_sec': rows / seconds, 'mb_per_sec': size / 1024 ** 2 / seconds}
+            print(f"{case:20} {rows / seconds:14,.0f} rows/sec {size / 1024 ** 2 / seconds:10,.1f} MB/sec")
+    results['memory'] = peak_rss_mb()
+    print(f"peak RSS {results['memory']['peak_rss_mb']:,.1f} MB, child processes {results['memory']['children_peak_rss_mb']:,.1f} MB")
+    if output:
+        write_results(output, 'load', {**params, 'file_mb': size / 1024 ** 2}, results)
+
+if __name__ == '__main__':
+    main()
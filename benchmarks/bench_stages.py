@@ -0,0 +1,83 @@
+"""
+Microbenchmarks for the parse, convert and serialize stages of a load, without a database.
+
+- parse: `read_csv_chunks`, splitting the file on row boundaries and parsing it with pandas.
+- convert: `encode_copy_columns`, converting and escaping every column to COPY text.
+- serialize: `join_copy_columns`, joining the values into the COPY buffer.
+
+    python -m benchmarks.bench_stages --rows 200000 --output stages.json
+"""
+import os
+import tempfile
+import time
+import click
+
+from benchmarks.generate import DEFAULT_COLUMNS, generate_csv, parse_columns
+from benchmarks.results import peak_rss_mb, write_results
+from utils.convert import compile_converters, encode_copy_columns, join_copy_columns
+from utils.reader import read_csv_chunks
+
+
+def run_stages(csv_file: str, selected_columns: list[tuple[str, str]], chunk_rows: int) -> dict[str, float]:
+    """
+    Runs every stage over the whole file once.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        selected_columns (list[tuple[str, str]]): The columns of the file.
+        chunk_rows (int): The number of rows per chunk.
+
+    Returns:
+        dict[str, float]: The seconds spent in each stage, and the number of rows.
+    """
+    converters = compile_converters(selected_columns)
+    seconds = {'parse': 0.0, 'convert': 0.0, 'serialize': 0.0}
+    rows = 0
+    chunks = read_csv_chunks(csv_file, chunk_rows)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        seconds['parse'] += time.perf_counter() - start
+        if chunk is None:
+            break
+        df, _ = chunk
+        start = time.perf_counter()
+        columns = encode_copy_columns(df, selected_columns, converters)
+        seconds['convert'] += time.perf_counter() - start
+        start = time.perf_counter()
+        join_copy_columns(columns)
+        seconds['serialize'] += time.perf_counter() - start
+        rows += len(df)
+    return {**seconds, 'rows': rows}
+
+@click.command()
+@click.option('--rows', type=int, default=200000, show_default=True, help='Number of rows')
+@click.option('--columns', 'spec', type=str, default=DEFAULT_COLUMNS, show_default=True, help='Column types, e.g. bigint:2,text:3')
+@click.option('--null-ratio', type=float, default=0.05, show_default=True, help='Fraction of null values')
+@click.option('--quote-ratio', type=float, default=0.01, show_default=True, help='Fraction of text values that need quoting')
+@click.option('--text-width', type=int, default=16, show_default=True, help='Characters per text value')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed')
+@click.option('--chunk-rows', type=int, default=100000, show_default=True, help='Rows per chunk')
+@click.option('--repeat', type=click.IntRange(min=1), default=3, show_default=True, help='Runs per stage, the fastest is kept')
+@click.option('--output', type=str, default=None, help='JSON file to write the results to')
+def main(rows: int, spec: str, null_ratio: float, quote_ratio: float, text_width: int, seed: int, chunk_rows: int, repeat: int, output: str|None):
+    params = {'rows': rows, 'columns': spec, 'null_ratio': null_ratio, 'quote_ratio': quote_ratio, 'text_width': text_width,
+              'seed': seed, 'chunk_rows': chunk_rows, 'repeat': repeat}
+    selected_columns = parse_columns(spec)
+    with tempfile.TemporaryDirectory() as directory:
+        csv_file = os.path.join(directory, 'bench.csv')
+        size = generate_csv(csv_file, selected_columns, rows, seed, null_ratio, quote_ratio, text_width)
+        runs = [run_stages(csv_file, selected_columns, chunk_rows) for _ in range(repeat)]
+
+    results = {}
+    for stage in ('parse', 'convert', 'serialize'):
+        seconds = min(run[stage] for run in runs)
+        results[stage] = {'seconds': seconds, 'rows_per_sec': rows / seconds, 'mb_per_sec': size / 1024 ** 2 / seconds}
+        print(f"{stage:10} {rows / seconds:14,.0f} rows/sec {size / 1024 ** 2 / seconds:10,.1f} MB/sec")
+    results['memory'] = peak_rss_mb()
+    print(f"peak RSS   {results['memory']['peak_rss_mb']:14,.1f} MB")
+    if output:
+        write_results(output, 'stages', {**params, 'file_mb': size / 1024 ** 2}, results)
+
+if __name__ == '__main__':
+    main()
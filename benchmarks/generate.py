@@ -0,0 +1,142 @@
+"""
+Deterministic synthetic CSV generator for the benchmarks.
+
+The same options and seed always produce the same file, byte for byte.
+
+    python -m benchmarks.generate -o data.csv --rows 1000000 --columns bigint:4,text:4,jsonb:1 --null-ratio 0.05
+"""
+import click
+import numpy as np
+import pandas as pd
+
+# Postgres data types the generator knows how to fill
+COLUMN_TYPES = ('bigint', 'integer', 'numeric', 'double precision', 'text', 'boolean', 'date', 'timestamp without time zone', 'jsonb')
+DEFAULT_COLUMNS = 'bigint:2,numeric:2,text:3,boolean:1,timestamp without time zone:1,jsonb:1'
+# Rows generated and written at a time
+BLOCK_ROWS = 100000
+
+_LETTERS = np.frombuffer(b'abcdefghijklmnopqrstuvwxyz ', dtype=np.uint8)
+
+
+def parse_columns(spec: str) -> list[tuple[str, str]]:
+    """
+    Parses a column spec such as `bigint:2,text:3` into column names and data types.
+
+    Args:
+        spec (str): Comma separated data types, each optionally followed by `:<count>`.
+
+    Returns:
+        list[tuple[str, str]]: The `(name, data_type)` of every column, named `c0`, `c1`, ...
+    """
+    columns: list[tuple[str, str]] = []
+    for item in spec.split(','):
+        data_type, _, count = item.strip().partition(':')
+        if data_type not in COLUMN_TYPES:
+            raise ValueError(f"Unsupported column type: {data_type}")
+        for _ in range(int(count or 1)):
+            columns.append((f"c{len(columns)}", data_type))
+    return columns
+
+def _text(rng: np.random.Generator, rows: int, width: int, quote_ratio: float) -> np.ndarray:
+    letters = _LETTERS[rng.integers(0, len(_LETTERS), (rows, max(width, 1)))]
+    values = letters.view(f'S{max(width, 1)}').ravel().astype(str).astype(object)
+    # Some values get a quote, a comma and a newline so they have to be quoted in the CSV
+    quoted = np.flatnonzero(rng.random(rows) < quote_ratio)
+    values[quoted] = [f'say "{value[:width // 2]}",\n{value[width // 2:]}' for value in values[quoted]]
+    return values
+
+def _column(rng: np.random.Generator, data_type: str, rows: int, start: int, width: int, quote_ratio: float) -> np.ndarray|pd.Series:
+    if data_type == 'bigint':
+        return np.arange(start, start + rows) * 7919 + rng.integers(0, 7919, rows)
+    if data_type == 'integer':
+        return rng.integers(-2 ** 31, 2 ** 31, rows)
+    if data_type == 'numeric':
+        return np.round(rng.random(rows) * 100000, 2)
+    if data_type == 'double precision':
+        return rng.standard_normal(rows)
+    if data_type == 'text':
+        return _text(rng, rows, width, quote_ratio)
+    if data_type == 'boolean':
+        return rng.random(rows) < 0.5
+    if data_type == 'date':
+        return pd.to_datetime(rng.integers(0, 20000, rows), unit='D').strftime('%Y-%m-%d')
+    if data_type == 'timestamp without time zone':
+        return pd.to_datetime(rng.integers(1_000_000_000, 1_700_000_000, rows), unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    names = _text(rng, rows, min(width, 16), 0)
+    return np.array([f'{{"id": {i}, "name": "{name}", "tags": ["a", "b"]}}' for i, name in zip(range(start, start + rows), names)], dtype=object)
+
+def generate_block(columns: list[tuple[str, str]], rows: int, start: int, seed: int, null_ratio: float = 0.0,
+                   quote_ratio: float = 0.0, text_width: int = 16) -> pd.DataFrame:
+    """
+    Generates the rows `start` to `start + rows` of a synthetic table.
+
+    Each block has its own random stream derived from `seed` and `start`, so a block does not
+    depend on the blocks before it.
+
+    Args:
+        columns (list[tuple[str, str]]): The columns from `parse_columns`.
+        rows (int): The number of rows.
+        start (int): The number of the first row.
+        seed (int): The random seed.
+        null_ratio (float): The fraction of null values in every column but the first.
+        quote_ratio (float): The fraction of text values with quotes, commas and newlines.
+        text_width (int): The number of characters of text values.
+
+    Returns:
+        pd.DataFrame: The rows.
+    """
+    rng = np.random.default_rng([seed, start])
+    data = {}
+    for i, (name, data_type) in enumerate(columns):
+        values = pd.Series(_column(rng, data_type, rows, start, text_width, quote_ratio))
+        if i and null_ratio:
+            values = values.astype(object).mask(rng.random(rows) < null_ratio)
+        data[name] = values
+    return pd.DataFrame(data)
+
+def generate_csv(csv_file: str, columns: list[tuple[str, str]], rows: int, seed: int = 0, null_ratio: float = 0.0,
+                 quote_ratio: float = 0.0, text_width: int = 16) -> int:
+    """
+    Writes a synthetic CSV file, one block of rows at a time.
+
+    Args:
+        csv_file (str): The path of the CSV file to write.
+        columns (list[tuple[str, str]]): The columns from `parse_columns`.
+        rows (int): The number of rows.
+        seed (int): The random seed.
+        null_ratio (float): The fraction of null values, written as empty fields.
+        quote_ratio (float): The fraction of text values with quotes, commas and newlines.
+        text_width (int): The number of characters of text values.
+
+    Returns:
+        int: The size of the file in bytes.
+    """
+    with open(csv_file, 'w', newline='') as f:
+        f.write(','.join(name for name, _ in columns) + '\n')
+        for start in range(0, rows, BLOCK_ROWS):
+            block = generate_block(columns, min(BLOCK_ROWS, rows - start), start, seed, null_ratio, quote_ratio, text_width)
+            block.to_csv(f, header=False, index=False, lineterminator='\n')
+        return f.tell()
+
+def create_table_statement(columns: list[tuple[str, str]], table: str, schema: str = 'public') -> str:
+    """
+    Returns the CREATE TABLE statement for the generated columns.
+    """
+    return f"CREATE TABLE {schema}.{table} ({', '.join(f'{name} {data_type}' for name, data_type in columns)})"
+
+@click.command()
+@click.option('-o', '--output', 'csv_file', type=str, required=True, help='CSV file to write')
+@click.option('--rows', type=int, default=100000, show_default=True, help='Number of rows')
+@click.option('--columns', 'spec', type=str, default=DEFAULT_COLUMNS, show_default=True, help='Column types, e.g. bigint:2,text:3')
+@click.option('--null-ratio', type=float, default=0.0, show_default=True, help='Fraction of null values')
+@click.option('--quote-ratio', type=float, default=0.0, show_default=True, help='Fraction of text values that need quoting')
+@click.option('--text-width', type=int, default=16, show_default=True, help='Characters per text value')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed')
+def main(csv_file: str, rows: int, spec: str, null_ratio: float, quote_ratio: float, text_width: int, seed: int):
+    columns = parse_columns(spec)
+    size = generate_csv(csv_file, columns, rows, seed, null_ratio, quote_ratio, text_width)
+    print(f"Wrote {rows:,} rows, {size / 1024 ** 2:.1f} MB to {csv_file}")
+    print(create_table_statement(columns, 'bench'))
+
+if __name__ == '__main__':
+    main()
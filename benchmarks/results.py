@@ -0,0 +1,105 @@
+"""
+Benchmark result files, and a comparison of two of them.
+
+    python -m benchmarks.results baseline.json candidate.json --threshold 0.1
+
+Exits with 1 when a throughput metric of the candidate is more than `threshold` below the baseline.
+"""
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+from typing import Any
+import click
+
+# Metrics where a lower value is a regression
+THROUGHPUT_SUFFIXES = ('rows_per_sec', 'mb_per_sec')
+
+
+def peak_rss_mb() -> dict[str, float]:
+    """
+    Returns the peak resident set size of this process and of its finished child processes.
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return {
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        'children_peak_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    }
+
+def _git_commit() -> str|None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(output: str, benchmark: str, params: dict[str, Any], results: dict[str, Any]):
+    """
+    Writes benchmark results to a JSON file, with what is needed to compare runs.
+
+    Args:
+        output (str): The JSON file path.
+        benchmark (str): The name of the benchmark.
+        params (dict[str, Any]): The options the benchmark ran with.
+        results (dict[str, Any]): The measurements, keyed by case.
+    """
+    with open(output, 'w') as f:
+        json.dump({
+            'benchmark': benchmark,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'params': params,
+            'results': results
+        }, f, indent=2)
+
+def _metrics(results: dict[str, Any], prefix: str = '') -> dict[str, float]:
+    metrics: dict[str, float] = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(_metrics(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and key.endswith(THROUGHPUT_SUFFIXES):
+            metrics[f"{prefix}{key}"] = value
+    return metrics
+
+def compare_results(baseline: dict[str, Any], candidate: dict[str, Any], threshold: float) -> list[tuple[str, float, float, bool]]:
+    """
+    Compares the throughput metrics of two result files.
+
+    Args:
+        baseline (dict[str, Any]): The loaded baseline results.
+        candidate (dict[str, Any]): The loaded results to check.
+        threshold (float): The relative drop counted as a regression, e.g. 0.1 for 10%.
+
+    Returns:
+        list[tuple[str, float, float, bool]]: The metric, baseline value, candidate value and
+            whether it regressed, for every metric in both files.
+    """
+    before = _metrics(baseline['results'])
+    after = _metrics(candidate['results'])
+    return [(metric, before[metric], after[metric], after[metric] < before[metric] * (1 - threshold))
+            for metric in before if metric in after]
+
+@click.command()
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+@click.argument('candidate', type=click.Path(exists=True, dir_okay=False))
+@click.option('--threshold', type=float, default=0.1, show_default=True, help='Relative throughput drop counted as a regression')
+def main(baseline: str, candidate: str, threshold: float):
+    with open(baseline) as f:
+        before = json.load(f)
+    with open(candidate) as f:
+        after = json.load(f)
+    regressed = False
+    for metric, old, new, worse in compare_results(before, after, threshold):
+        regressed |= worse
+        print(f"{'REGRESSION' if worse else 'ok':10} {metric:50} {old:14,.1f} -> {new:14,.1f} ({new / old - 1 if old else 0:+.1%})")
+    sys.exit(1 if regressed else 0)
+
+if __name__ == '__main__':
+    main()
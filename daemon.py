@@ -0,0 +1,303 @@
+import collections
+import datetime
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
+
+from scheduler import load_file
+from utils.catalog import CatalogCache
+from utils.client import daemon_running
+from utils.file import RunState, file_fingerprint
+from utils.stats import merge_stats
+
+# Options of a job, passed on to `load_rows`, the checkpoint ones default to those of the daemon
+JOB_OPTIONS = ('engine', 'chunk_rows', 'batch_size', 'adaptive_batch', 'target_latency', 'max_batch_bytes', 'pipeline', 'in_flight', 'on_error',
+               'checkpoint_interval', 'checkpoint_rows')
+# Finished jobs kept for status requests, the oldest are dropped first
+JOB_HISTORY = 10000
+# Longest a status request waits for a job to finish
+MAX_WAIT_SECONDS = 60
+
+
+class LoadDaemon:
+    """
+    Loads files submitted as jobs, up to `workers` at a time, over a pool of warm connections.
+
+    Table columns are looked up through one catalog cache shared by all jobs. The status and
+    checkpoint of every file are kept in a run state file, as with `scheduler.load_files`: a file
+    already loaded into a table is not loaded into it again unless it changed, and a file whose load
+    failed or was interrupted is resumed from its checkpoint when it is submitted again. A file is
+    loaded by one job at a time, submitting it again while its job is queued or running returns
+    that job. The pool holds psycopg2 connections, a job with the prepared engine opens a psycopg 3
+    connection of its own.
+    """
+
+    def __init__(self, pool, state: RunState, workers: int, checkpoint_interval: float = 5.0, checkpoint_rows: int|None = None,
+                 on_done: Callable[[dict[str, Any]], None]|None = None):
+        self.pool = pool
+        self.state = state
+        self.workers = workers
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_rows = checkpoint_rows
+        self.on_done = on_done
+        self.cache = CatalogCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.jobs: collections.OrderedDict[int, dict[str, Any]] = collections.OrderedDict()
+        # The queued or running job of each file
+        self.active: dict[str, dict[str, Any]] = {}
+        self.stats: dict[str, Any] = merge_stats([])
+        self.finished: collections.Counter[str] = collections.Counter()
+        self.load_seconds = 0.0
+        self.started = time.perf_counter()
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self._next_id = 1
+        self._changed = threading.Condition()
+
+    def submit(self, load: dict[str, Any]) -> dict[str, Any]:
+        """
+        Queues a job.
+
+        Args:
+            load (dict[str, Any]): The `file`, `schema` and `table`, and `options` from `JOB_OPTIONS`.
+
+        Returns:
+            dict[str, Any]: The job, with its `id` and the `queued` status, or the job already queued or running for the file.
+
+        Raises:
+            ValueError: If the job is not valid, or the file is being loaded into another table.
+        """
+        if not isinstance(load, dict):
+            raise ValueError("A job is a JSON object with a file, schema and table")
+        missing = [key for key in ('file', 'schema', 'table') if not isinstance(load.get(key), str) or not load[key]]
+        if missing:
+            raise ValueError(f"A job needs {', '.join(missing)}")
+        options = load.get('options') or {}
+        unknown = sorted(set(options) - set(JOB_OPTIONS))
+        if unknown:
+            raise ValueError(f"Unknown job options {', '.join(unknown)}")
+        # Relative paths are relative to the client, which sends absolute ones
+        csv_file = os.path.abspath(load['file'])
+        if not os.path.isfile(csv_file):
+            raise ValueError(f"File {csv_file} not found")
+        with self._changed:
+            active = self.active.get(csv_file)
+            if active:
+                if (active['schema'], active['table']) != (load['schema'], load['table']):
+                    raise ValueError(f"File {csv_file} is being loaded into {active['schema']}.{active['table']} by job {active['id']}")
+                return dict(active)
+            job = {'id': self._next_id, 'file': csv_file, 'schema': load['schema'], 'table': load['table'], 'options': options,
+                   'status': 'queued', 'submitted_at': datetime.datetime.now(datetime.timezone.utc).isoformat()}
+            self._next_id += 1
+            self.jobs[job['id']] = job
+            self.active[csv_file] = job
+            self._drop_history()
+        self.executor.submit(self._run, job)
+        return dict(job)
+
+    def _drop_history(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(len(finished) - JOB_HISTORY, 0)]:
+            del self.jobs[job_id]
+
+    def _update(self, job: dict[str, Any], **values):
+        with self._changed:
+            job.update(values)
+            self._changed.notify_all()
+
+    def _run(self, job: dict[str, Any]):
+        self._update(job, status='running', started_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+        load = {'file': job['file'], 'schema': job['schema'], 'table': job['table']}
+        try:
+            entry = self.state.get(job['file'])
+            if entry and (entry.get('fingerprint'), entry.get('schema'), entry.get('table')) != (file_fingerprint(job['file']), job['schema'], job['table']):
+                # A new file dropped under the name of one loaded before, or the file loaded into another table
+                self.state.remove(job['file'])
+                entry = {}
+            if entry.get('status') == 'done':
+                result = {'status': 'done', 'rows': 0, 'skipped': 0, 'elapsed': 0.0, 'already_loaded': True}
+            else:
+                options = dict(job['options'])
+                checkpoint_interval = options.pop('checkpoint_interval', self.checkpoint_interval)
+                checkpoint_rows = options.pop('checkpoint_rows', self.checkpoint_rows)
+                result = load_file(self.pool, self.state, self.cache, load, checkpoint_interval, checkpoint_rows, **options)
+        except Exception as e:
+            result = {'status': 'failed', 'error': f"{job['file']} failed: {e}", 'elapsed': 0.0}
+        stats = result.pop('stats', None)
+        with self._changed:
+            if stats:
+                self.stats = merge_stats([self.stats, stats])
+            job.update({key: result.get(key) for key in ('status', 'rows', 'skipped', 'elapsed', 'error', 'already_loaded') if key in result})
+            job['finished_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            del self.active[job['file']]
+            self.finished[job['status']] += 1
+            self.load_seconds += job.get('elapsed') or 0
+            if job.get('rows') and job.get('elapsed'):
+                job['rows_per_sec'] = job['rows'] / job['elapsed']
+            self._changed.notify_all()
+        if self.on_done:
+            self.on_done(dict(job))
+
+    def job(self, job_id: int, wait: float = 0) -> dict[str, Any]|None:
+        """
+        Returns a job, waiting up to `wait` seconds for it to finish, or None if there is no such job.
+        """
+        deadline = time.monotonic() + min(wait, MAX_WAIT_SECONDS)
+        with self._changed:
+            while (job := self.jobs.get(job_id)) and job['status'] not in ('done', 'failed') and time.monotonic() < deadline:
+                self._changed.wait(deadline - time.monotonic())
+            return dict(job) if job else None
+
+    def list_jobs(self) -> list[dict[str, Any]]:
+        """
+        Returns the queued, running and most recent finished jobs, oldest first.
+        """
+        with self._changed:
+            return [dict(job) for job in self.jobs.values()]
+
+    def metrics(self) -> dict[str, Any]:
+        """
+        Returns the number of jobs per status and the rows, bytes and time per stage of the jobs that ran.
+
+        `rows_per_sec` is over the uptime of the daemon, `load_rows_per_sec` over the time spent in jobs.
+        """
+        with self._changed:
+            statuses = collections.Counter(job['status'] for job in self.jobs.values())
+            stats = {'stages': {name: dict(totals) for name, totals in self.stats['stages'].items()}, 'counters': dict(self.stats['counters'])}
+            jobs = {'queued': statuses['queued'], 'running': statuses['running'], 'done': self.finished['done'], 'failed': self.finished['failed']}
+            loading = self.load_seconds
+        uptime = time.perf_counter() - self.started
+        rows = stats['counters'].get('rows', 0)
+        return {
+            'started_at': self.started_at.isoformat(),
+            'uptime': uptime,
+            'workers': self.workers,
+            'jobs': jobs,
+            'rows': rows,
+            'skipped': stats['counters'].get('skipped', 0),
+            'input_bytes': stats['counters'].get('input_bytes', 0),
+            'rows_per_sec': rows / uptime if uptime else None,
+            'load_rows_per_sec': rows / loading if loading else None,
+            **stats
+        }
+
+    def close(self):
+        """
+        Waits for the running jobs to finish, the queued ones are cancelled.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+class _Handler(BaseHTTPRequestHandler):
+    server: 'LoadServer'
+
+    def _reply(self, status: int, body: Any):
+        data = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        daemon = self.server.daemon
+        if parts == ['health']:
+            return self._reply(200, {'status': 'ok'})
+        if parts == ['metrics']:
+            return self._reply(200, daemon.metrics())
+        if parts == ['jobs']:
+            return self._reply(200, daemon.list_jobs())
+        if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+            try:
+                wait = float(parse_qs(url.query).get('wait', ['0'])[0])
+            except ValueError:
+                return self._reply(400, {'error': "wait is a number of seconds"})
+            job = daemon.job(int(parts[1]), wait)
+            return self._reply(200, job) if job else self._reply(404, {'error': f"No job {parts[1]}"})
+        self._reply(404, {'error': f"No such path {url.path}"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path.strip('/') != 'jobs':
+            return self._reply(404, {'error': f"No such path {self.path}"})
+        try:
+            load = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'null')
+            job = self.server.daemon.submit(load)
+        except ValueError as e:
+            return self._reply(400, {'error': str(e)})
+        self._reply(202, job)
+
+    def log_message(self, format: str, *args: Any):
+        # Jobs are logged when they finish, requests are not
+        pass
+
+class LoadServer(ThreadingHTTPServer):
+    """
+    Serves the job API of a `LoadDaemon` over HTTP, on a Unix socket only accessible to its user.
+
+        POST /jobs            {"file": ..., "schema": ..., "table": ..., "options": {...}} queues a job
+        GET  /jobs            lists the jobs
+        GET  /jobs/<id>?wait= returns a job, waiting up to `wait` seconds for it to finish
+        GET  /metrics         returns the jobs per status, rows, throughput and time per stage
+        GET  /health          answers while the daemon runs
+    """
+    address_family = socket.AF_UNIX
+    daemon_threads = True
+
+    def __init__(self, daemon: LoadDaemon, address: str):
+        self.daemon = daemon
+        if os.path.exists(address):
+            if daemon_running(address):
+                raise Exception(f"A daemon is already serving on {address}")
+            # Left behind by a daemon that did not shut down
+            os.remove(address)
+        os.makedirs(os.path.dirname(os.path.abspath(address)), exist_ok=True)
+        super().__init__(address, _Handler)
+
+    def server_bind(self):
+        # Only the user running the daemon can submit jobs, the socket is never accessible to others, even before a chmod
+        umask = os.umask(0o077)
+        try:
+            socketserver.TCPServer.server_bind(self)
+        finally:
+            os.umask(umask)
+        self.server_name, self.server_port = 'localhost', 0
+
+    def get_request(self) -> tuple[socket.socket, Any]:
+        request, address = self.socket.accept()
+        return request, address or ('local', 0)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+def serve(pool, address: str, state_file: str, workers: int, checkpoint_interval: float = 5.0, checkpoint_rows: int|None = None,
+          on_ready: Callable[[LoadServer], None]|None = None, on_done: Callable[[dict[str, Any]], None]|None = None):
+    """
+    Runs the load daemon until interrupted, then waits for the running jobs.
+
+    Args:
+        pool: The connection pool from `get_pool`, with at least `workers` connections.
+        address (str): The Unix socket path.
+        state_file (str): The run state file.
+        workers (int): The number of jobs run at a time.
+        checkpoint_interval (float): The number of seconds between commits and checkpoints.
+        checkpoint_rows (int|None): The number of rows between commits and checkpoints.
+        on_ready (Callable[[LoadServer], None]|None): Called once the server listens.
+        on_done (Callable[[dict[str, Any]], None]|None): Called with every job as it finishes.
+    """
+    daemon = LoadDaemon(pool, RunState(state_file), workers, checkpoint_interval, checkpoint_rows, on_done)
+    with LoadServer(daemon, address) as server:
+        if on_ready:
+            on_ready(server)
+        try:
+            server.serve_forever()
+        finally:
+            daemon.close()
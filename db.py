@@ -1,24 +1,104 @@
 from contextlib import contextmanager
+import io
+import logging
 import psycopg2
+import psycopg2.pool
 from dotenv import load_dotenv
 import os
+from typing import Any, BinaryIO, Iterator
+
+from utils.catalog import CatalogCache
+from utils.db import generate_copy_statement
 
 load_dotenv()
 
+def _connect_params() -> dict:
+  return {
+    'host': os.getenv("DB_HOST"),
+    'port': os.getenv("DB_PORT") or 5432,
+    'database': os.getenv("DB_NAME"),
+    'user': os.getenv("DB_USER"),
+    'password': os.getenv("DB_PASSWORD")
+  }
+
 @contextmanager
 def get_db():
-  conn = psycopg2.connect(
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT") or 5432,
-    database=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD")
-  )
+  conn = psycopg2.connect(**_connect_params())
   try:
     yield conn
   finally:
     conn.close()
 
+@contextmanager
+def get_pipeline_db():
+  """
+  Opens a psycopg 3 connection, which the prepared engine uses for pipeline mode.
+  """
+  try:
+    import psycopg
+  except ImportError as e:
+    raise Exception("The prepared engine needs psycopg 3, install it with pip install \"psycopg[binary]\"") from e
+  # A batch failing in pipeline mode makes psycopg log a warning, the error itself is raised and handled
+  logging.getLogger('psycopg').setLevel(logging.ERROR)
+  params = _connect_params()
+  conn = psycopg.connect(dbname=params.pop('database'), **params)
+  try:
+    yield conn
+  finally:
+    conn.close()
+
+def connect(engine: str):
+  """
+  Opens the connection used to load rows with an engine, see `get_db` and `get_pipeline_db`.
+  """
+  return get_pipeline_db() if engine == 'prepared' else get_db()
+
+@contextmanager
+def get_pool(size: int):
+  """
+  Opens a pool of `size` connections shared by threads, closed on exit.
+
+  The connections are opened up front and kept open between uses. psycopg2 closes a connection put
+  back into a pool that already holds its minimum number of connections, so the minimum is `size`.
+  """
+  pool = psycopg2.pool.ThreadedConnectionPool(size, size, **_connect_params())
+  try:
+    yield pool
+  finally:
+    pool.closeall()
+
+@contextmanager
+def pooled_connection(pool):
+  """
+  Borrows a connection from a pool. It is rolled back before going back to the pool, and
+  discarded if it was closed.
+
+  A connection can be dropped while it sits in the pool, by a server restart or an idle timeout,
+  and psycopg2 only notices when it is used. It is checked with `SELECT 1` when it is borrowed,
+  and a dropped one is discarded for a fresh connection.
+  """
+  # Every connection of the pool can have been dropped, the last try opens a new one
+  for attempt in range(pool.maxconn + 1):
+    conn = pool.getconn()
+    try:
+      with conn.cursor() as cursor:
+        cursor.execute("SELECT 1;")
+      conn.rollback()
+      break
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+      pool.putconn(conn, close=True)
+      if attempt == pool.maxconn:
+        raise
+  try:
+    yield conn
+  finally:
+    if not conn.closed:
+      try:
+        conn.rollback()
+      except psycopg2.Error:
+        pass
+    pool.putconn(conn, close=bool(conn.closed))
+
 def get_all_schemas(conn: psycopg2.extensions.connection) -> list[tuple[str]]:
     with conn.cursor() as cursor:
         cursor.execute("SELECT schema_name FROM information_schema.schemata ORDER BY schema_name;")
@@ -35,14 +115,365 @@ def get_all_tables(conn: psycopg2.extensions.connection, schema: str) -> list[tu
         return tables
         
 
-def truncate_table(conn: psycopg2.extensions.connection, schema: str, table: str):
+def truncate_table(conn: psycopg2.extensions.connection, schema: str, table: str, commit: bool = True):
     with conn.cursor() as cursor:
         cursor.execute(f"TRUNCATE TABLE {schema}.{table};")
-        conn.commit()
+        if commit:
+            conn.commit()
         
 
-def get_all_columns(conn: psycopg2.extensions.connection, schema: str, table: str) -> list[tuple[str, str]]:
+# pg_class.xmin changes when columns are added or retyped, pg_attribute.xmin when they are renamed or dropped
+_DDL_MARKER = "c.xmin::text || ':' || (SELECT max(a.xmin::text::bigint) FROM pg_attribute a WHERE a.attrelid = c.oid)"
+
+_TABLE_META_QUERY = f"""
+SELECT n.oid IS NOT NULL, c.oid, {_DDL_MARKER},
+       (SELECT coalesce(json_agg(json_build_array(a.attname, format_type(a.atttypid, NULL)) ORDER BY a.attnum), '[]')
+        FROM pg_attribute a WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped)
+FROM (SELECT to_regnamespace(quote_ident(%(schema)s)) AS oid) n
+LEFT JOIN pg_class c ON c.oid = to_regclass(quote_ident(%(schema)s) || '.' || quote_ident(%(table)s))
+"""
+
+def get_table_columns(conn: psycopg2.extensions.connection, schema: str, table: str, cache: CatalogCache|None = None) -> list[tuple[str, str]]:
+    """
+    Resolves a table and its columns with a single `pg_catalog` query.
+
+    With a cache, a cached entry is used after checking in one query that the table still has the
+    same OID and that its `pg_class` and `pg_attribute` rows have not changed since.
+
+    Args:
+        conn: The database connection.
+        schema (str): The schema name.
+        table (str): The table name.
+        cache (CatalogCache|None): The cache of table columns.
+
+    Returns:
+        list[tuple[str, str]]: The column names and data types, in table order.
+
+    Raises:
+        Exception: If the schema or the table does not exist.
+    """
+    params = conn.get_dsn_parameters()
+    database = f"{params.get('host')}:{params.get('port')}/{params.get('dbname')}"
+    entry = cache.get(database, schema, table) if cache else None
+    with conn.cursor() as cursor:
+        if entry:
+            cursor.execute(f"SELECT {_DDL_MARKER} FROM pg_class c WHERE c.oid = %s AND c.oid = to_regclass(quote_ident(%s) || '.' || quote_ident(%s))",
+                           (entry['oid'], schema, table))
+            row = cursor.fetchone()
+            if row and row[0] == entry['marker']:
+                return [(column[0], column[1]) for column in entry['columns']]
+        cursor.execute(_TABLE_META_QUERY, {'schema': schema, 'table': table})
+        schema_exists, oid, marker, columns = cursor.fetchone()
+    if not schema_exists:
+        raise Exception("Provided schema does not exist")
+    if oid is None:
+        raise Exception(f"Provided table does not exist in schema {schema}")
+    columns = [(column[0], column[1]) for column in columns]
+    if cache:
+        cache.put(database, schema, table, oid, marker, columns)
+    return columns
+
+_COLUMN_DETAILS_QUERY = """
+SELECT a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull, a.atthasdef OR a.attidentity <> '' OR a.attgenerated <> ''
+FROM pg_attribute a
+WHERE a.attrelid = to_regclass(quote_ident(%(schema)s) || '.' || quote_ident(%(table)s)) AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY a.attnum
+"""
+
+def get_column_details(conn: psycopg2.extensions.connection, schema: str, table: str) -> list[dict[str, Any]]:
+    """
+    Reads the columns of a table with their type modifiers and NOT NULL constraints, for validating a file.
+
+    Returns:
+        list[dict[str, Any]]: The `name`, `type` with its modifiers such as `character varying(20)`,
+            `not_null` and `has_default` of every column, in table order. Identity and generated
+            columns count as having a default.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(_COLUMN_DETAILS_QUERY, {'schema': schema, 'table': table})
+        return [{'name': name, 'type': data_type, 'not_null': not_null, 'has_default': has_default}
+                for name, data_type, not_null, has_default in cursor.fetchall()]
+
+# Constraints backed by an index or checked row by row with triggers, the ones worth dropping for a bulk load.
+# Foreign keys come first, so they are dropped before the keys they may reference and added back after them.
+_REBUILT_CONSTRAINTS_QUERY = """
+SELECT quote_ident(con.conname), pg_get_constraintdef(con.oid)
+FROM pg_constraint con
+WHERE con.conrelid = to_regclass(quote_ident(%(schema)s) || '.' || quote_ident(%(table)s))
+  AND con.contype IN ('f', 'p', 'u', 'x') AND con.coninhcount = 0
+ORDER BY con.contype = 'f' DESC, con.conname
+"""
+
+_REBUILT_INDEXES_QUERY = """
+SELECT quote_ident(n.nspname) || '.' || quote_ident(c.relname), pg_get_indexdef(i.indexrelid)
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE i.indrelid = to_regclass(quote_ident(%(schema)s) || '.' || quote_ident(%(table)s))
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid AND con.conrelid = i.indrelid)
+ORDER BY c.relname
+"""
+
+def drop_indexes_and_constraints(conn: psycopg2.extensions.connection, schema: str, table: str) -> list[str]:
+    """
+    Drops the indexes, keys and foreign keys of a table, without committing.
+
+    Args:
+        conn: The database connection.
+        schema (str): The schema name.
+        table (str): The table name.
+
+    Returns:
+        list[str]: The statements creating them again, in the order they should run.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(_REBUILT_CONSTRAINTS_QUERY, {'schema': schema, 'table': table})
+        constraints = cursor.fetchall()
+        cursor.execute(_REBUILT_INDEXES_QUERY, {'schema': schema, 'table': table})
+        indexes = cursor.fetchall()
+        for name, _ in constraints:
+            cursor.execute(f"ALTER TABLE {schema}.{table} DROP CONSTRAINT {name};")
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {name};")
+    creates = [f"{definition};" for _, definition in indexes]
+    creates += [f"ALTER TABLE {schema}.{table} ADD CONSTRAINT {name} {definition};" for name, definition in reversed(constraints)]
+    return creates
+
+def create_staging_table(conn: psycopg2.extensions.connection, schema: str, table: str, selected_columns: list[tuple[str, str]]) -> str:
+    """
+    Creates an unlogged table with the selected columns of a table and no constraints, without committing.
+
+    Args:
+        conn: The database connection.
+        schema (str): The schema name.
+        table (str): The table the staging table is a clone of.
+        selected_columns (list[tuple[str, str]]): The columns of the staging table.
+
+    Returns:
+        str: The staging table name, in the same schema.
+    """
+    staging_table = f"_csv2pg_staging_{table}"[:63]
+    columns = ','.join(column[0] for column in selected_columns)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {schema}.{staging_table};")
+        cursor.execute(f"CREATE UNLOGGED TABLE {schema}.{staging_table} AS SELECT {columns} FROM {schema}.{table} WITH NO DATA;")
+    return staging_table
+
+_UNIQUE_KEY_QUERY = """
+SELECT EXISTS (
+  SELECT 1 FROM pg_index i
+  WHERE i.indrelid = to_regclass(quote_ident(%(schema)s) || '.' || quote_ident(%(table)s))
+    AND i.indisunique AND i.indpred IS NULL AND i.indexprs IS NULL
+    AND (SELECT array_agg(a.attname::text ORDER BY a.attname) FROM pg_attribute a
+         WHERE a.attrelid = i.indrelid AND a.attnum = ANY ((i.indkey::int2[])[0:i.indnkeyatts - 1]))
+      = (SELECT array_agg(c ORDER BY c) FROM unnest(%(columns)s::text[]) c)
+)
+"""
+
+def has_unique_key(conn: psycopg2.extensions.connection, schema: str, table: str, columns: list[str]) -> bool:
+    """
+    Checks that a table has a unique index on exactly these columns, which `ON CONFLICT` needs.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(_UNIQUE_KEY_QUERY, {'schema': schema, 'table': table, 'columns': columns})
+        return cursor.fetchone()[0]
+
+_PARTITIONED_TABLE_QUERY = """
+SELECT p.partstrat,
+       array(SELECT a.attname::text FROM unnest(p.partattrs::int2[]) WITH ORDINALITY k(attnum, ord)
+             LEFT JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = k.attnum ORDER BY k.ord),
+       current_setting('TimeZone')
+FROM pg_partitioned_table p
+WHERE p.partrelid = to_regclass(quote_ident(%(schema)s) || '.' || quote_ident(%(table)s))
+"""
+
+_PARTITIONS_QUERY = """
+SELECT n.nspname, c.relname, c.relkind, pg_get_expr(c.relpartbound, c.oid)
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE i.inhparent = to_regclass(quote_ident(%(schema)s) || '.' || quote_ident(%(table)s))
+ORDER BY n.nspname, c.relname
+"""
+
+PARTITION_STRATEGIES = {'r': 'range', 'l': 'list', 'h': 'hash'}
+
+def get_partitioning(conn: psycopg2.extensions.connection, schema: str, table: str) -> dict[str, Any]|None:
+    """
+    Reads how a table is partitioned, from `pg_partitioned_table` and `pg_inherits`.
+
+    Only the partitions directly under the table are returned. A partition that is partitioned
+    itself is loaded as a whole and routes its rows on the server. Foreign table partitions are left out.
+
+    Args:
+        conn: The database connection.
+        schema (str): The schema name.
+        table (str): The table name.
+
+    Returns:
+        dict[str, Any]|None: The `strategy` ('range', 'list' or 'hash'), the `key_columns`, None for
+            expressions, the `time_zone` the bounds are written in and the `partitions` with their
+            `schema`, `table` and `bound`. None if the table is not partitioned.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(_PARTITIONED_TABLE_QUERY, {'schema': schema, 'table': table})
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        strategy, key_columns, time_zone = row
+        cursor.execute(_PARTITIONS_QUERY, {'schema': schema, 'table': table})
+        partitions = [{'schema': nspname, 'table': relname, 'bound': bound} for nspname, relname, relkind, bound in cursor.fetchall() if relkind != 'f']
+    return {'strategy': PARTITION_STRATEGIES[strategy], 'key_columns': key_columns, 'time_zone': time_zone, 'partitions': partitions}
+
+def get_max_prepared_transactions(conn: psycopg2.extensions.connection) -> int:
+    """
+    Returns `max_prepared_transactions`, the number of transactions the server can keep prepared, 0 when two-phase commit is disabled.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SHOW max_prepared_transactions;")
+        return int(cursor.fetchone()[0])
+
+def list_prepared_transactions(conn: psycopg2.extensions.connection, prefix: str) -> list[str]:
+    """
+    Returns the ids of the prepared transactions of the current database that start with `prefix`.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT gid FROM pg_prepared_xacts WHERE database = current_database() AND left(gid, length(%(prefix)s)) = %(prefix)s ORDER BY prepared;",
+                       {'prefix': prefix})
+        return [gid for gid, in cursor.fetchall()]
+
+def finish_prepared_transaction(conn: psycopg2.extensions.connection, gid: str, commit: bool):
+    """
+    Commits or rolls back a prepared transaction, on a connection in autocommit mode.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("COMMIT PREPARED %s;" if commit else "ROLLBACK PREPARED %s;", (gid,))
+
+def estimate_rows(conn: psycopg2.extensions.connection, schema: str, table: str) -> int:
+    """
+    Returns the number of rows of a table estimated by the planner, or counts them if it was never analyzed.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE oid = to_regclass(quote_ident(%(schema)s) || '.' || quote_ident(%(table)s));",
+                       {'schema': schema, 'table': table})
+        rows = cursor.fetchone()[0]
+        if rows < 0:
+            cursor.execute(f"SELECT count(*) FROM {schema}.{table};")
+            rows = cursor.fetchone()[0]
+    return int(rows)
+
+def iter_column_text(conn: psycopg2.extensions.connection, schema: str, table: str, columns: list[str], chunk_rows: int = 100000) -> Iterator[list[tuple]]:
+    """
+    Reads columns of every row of a table as text, through a server-side cursor.
+
+    Args:
+        conn: The database connection, in a transaction until the rows are read.
+        schema (str): The schema name.
+        table (str): The table name.
+        columns (list[str]): The columns to read.
+        chunk_rows (int): The number of rows fetched at a time.
+
+    Yields:
+        list[tuple]: The text values of up to `chunk_rows` rows, None for nulls.
+    """
+    with conn.cursor(name='csv2pg_rows') as cursor:
+        cursor.itersize = chunk_rows
+        cursor.execute(f"SELECT {','.join(f'{column}::text' for column in columns)} FROM {schema}.{table};")
+        while rows := cursor.fetchmany(chunk_rows):
+            yield rows
+
+_EXPORT_LAYOUT_QUERY = """
+SELECT c.relkind, pg_relation_size(c.oid) / current_setting('block_size')::bigint,
+       (SELECT a.attname FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = c.oid AND i.indisprimary AND i.indnkeyatts = 1 AND a.atttypid IN ('int2'::regtype, 'int4'::regtype, 'int8'::regtype))
+FROM pg_class c WHERE c.oid = to_regclass(quote_ident(%(schema)s) || '.' || quote_ident(%(table)s))
+"""
+
+def get_export_layout(conn: psycopg2.extensions.connection, schema: str, table: str) -> dict[str, Any]:
+    """
+    Returns what an export can split a table on.
+
+    Args:
+        conn: The database connection.
+        schema (str): The schema name.
+        table (str): The table name.
+
+    Returns:
+        dict[str, Any]: The `kind` of relation from `pg_class.relkind`, the number of heap `pages`, and
+        `key_column`, the single integer column of the primary key or None.
+
+    Raises:
+        Exception: If the table does not exist.
+    """
     with conn.cursor() as cursor:
-        cursor.execute(f"SELECT column_name, data_type FROM information_schema.columns WHERE table_schema = '{schema}' AND table_name = '{table}';")
-        columns = cursor.fetchall()
-        return columns
\ No newline at end of file
+        cursor.execute(_EXPORT_LAYOUT_QUERY, {'schema': schema, 'table': table})
+        row = cursor.fetchone()
+    if row is None:
+        raise Exception("Provided table does not exist")
+    kind, pages, key_column = row
+    return {'kind': kind, 'pages': int(pages), 'key_column': key_column}
+
+def get_key_bounds(conn: psycopg2.extensions.connection, schema: str, table: str, column: str) -> tuple[int|None, int|None]:
+    """
+    Returns the smallest and largest values of an indexed column, None for an empty table.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT min({column}), max({column}) FROM {schema}.{table};")
+        return cursor.fetchone()
+
+def export_snapshot(conn: psycopg2.extensions.connection) -> str:
+    """
+    Starts a read only repeatable read transaction and exports its snapshot.
+
+    Other connections importing the snapshot with `import_snapshot` see the same rows, as long as
+    this transaction stays open.
+
+    Returns:
+        str: The snapshot identifier.
+    """
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_export_snapshot();")
+        return cursor.fetchone()[0]
+
+def import_snapshot(conn: psycopg2.extensions.connection, snapshot: str):
+    """
+    Starts a read only repeatable read transaction seeing the snapshot exported by `export_snapshot`.
+    """
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    with conn.cursor() as cursor:
+        cursor.execute("SET TRANSACTION SNAPSHOT %s;", (snapshot,))
+
+def copy_to(cursor: psycopg2.extensions.cursor, query: str, f: BinaryIO) -> int:
+    """
+    Writes the rows of a query to a file as CSV, without a header, with COPY ... TO STDOUT.
+
+    Returns:
+        int: The number of rows written.
+    """
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", f)
+    return cursor.rowcount
+
+# Temporary table the copy engine loads a batch into before merging it with `ON CONFLICT`
+MERGE_TABLE = 'csv2pg_merge'
+
+def create_merge_table(conn: psycopg2.extensions.connection, schema: str, table: str, selected_columns: list[tuple[str, str]]):
+    """
+    Creates the temporary table `merge_rows` loads batches into, with the selected columns of a table.
+    """
+    columns = ','.join(column[0] for column in selected_columns)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS pg_temp.{MERGE_TABLE};")
+        cursor.execute(f"CREATE TEMPORARY TABLE {MERGE_TABLE} AS SELECT {columns} FROM {schema}.{table} WITH NO DATA;")
+
+def merge_rows(cursor: psycopg2.extensions.cursor, data: str, selected_columns: list[tuple[str, str]], table: str, schema: str, on_conflict: str):
+    """
+    Copies a batch into the table of `create_merge_table`, then inserts it into a table with an `ON CONFLICT` clause.
+    """
+    columns = ','.join(column[0] for column in selected_columns)
+    copy_rows(cursor, data, selected_columns, MERGE_TABLE, 'pg_temp')
+    cursor.execute(f"INSERT INTO {schema}.{table} ({columns}) SELECT {columns} FROM pg_temp.{MERGE_TABLE} {on_conflict}; TRUNCATE pg_temp.{MERGE_TABLE};")
+
+def copy_rows(cursor: psycopg2.extensions.cursor, data: str, selected_columns: list[tuple[str, str]], table: str, schema: str):
+    buffer = io.StringIO(data)
+    cursor.copy_expert(generate_copy_statement(selected_columns, table, schema), buffer)
@@ -0,0 +1,249 @@
+import csv
+import io
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from db import copy_to, export_snapshot, get_db, get_export_layout, get_key_bounds, import_snapshot
+from utils.compression import open_output, strip_compression_extension
+from utils.db import generate_export_query
+from utils.file import RunState
+from utils.stats import RunStats
+
+SPLITS = ('auto', 'ctid', 'key', 'none')
+# Ranges planned per worker, so workers finishing early pick up more of the table and a resume redoes less
+RANGES_PER_WORKER = 4
+# Smallest range worth its own COPY, 1024 blocks are 8MB with the default block size
+MIN_RANGE_PAGES = 1024
+MIN_RANGE_KEYS = 10000
+# Size of the blocks part files are copied into the output with
+APPEND_BLOCK_SIZE = 1024 * 1024
+
+
+def choose_split(layout: dict[str, Any], split: str = 'auto', server_version: int = 140000) -> str|None:
+    """
+    Chooses how to split the rows of a table into ranges.
+
+    `auto` splits a table or materialized view on heap blocks, which needs TID range scans from
+    PostgreSQL 14, and otherwise on an integer primary key, such as that of a partitioned table.
+
+    Args:
+        layout (dict[str, Any]): The layout from `get_export_layout`.
+        split (str): `auto`, `ctid`, `key` or `none`.
+        server_version (int): The server version number, like 140005.
+
+    Returns:
+        str|None: `ctid` or `key`, or None to export the table in one range.
+
+    Raises:
+        ValueError: If the table cannot be split as asked.
+    """
+    has_heap = layout['kind'] in ('r', 'm')
+    if split == 'ctid' and not has_heap:
+        raise ValueError("Only tables and materialized views can be split on ctid")
+    if split == 'key' and not layout['key_column']:
+        raise ValueError("The table has no single integer primary key column to split on")
+    if split == 'auto':
+        if has_heap and server_version >= 140000:
+            return 'ctid'
+        return 'key' if layout['key_column'] else None
+    return None if split == 'none' else split
+
+def plan_ranges(split: str|None, parts: int, pages: int = 0, key_bounds: tuple[int|None, int|None] = (None, None)) -> list[tuple[int|None, int|None]]:
+    """
+    Splits a table into up to `parts` ranges of heap blocks or of key values.
+
+    The first range has no lower bound and the last no upper bound, so the ranges cover rows
+    added beyond the blocks or keys seen when planning.
+
+    Args:
+        split (str|None): `ctid`, `key`, or None for a single range.
+        parts (int): The largest number of ranges.
+        pages (int): The number of heap blocks of the table, with `ctid`.
+        key_bounds (tuple[int|None, int|None]): The smallest and largest keys from `get_key_bounds`, with `key`.
+
+    Returns:
+        list[tuple[int|None, int|None]]: The first block or key of each range and the one it stops before.
+    """
+    if split == 'ctid':
+        start, size, smallest = 0, pages, MIN_RANGE_PAGES
+    elif split == 'key' and key_bounds[0] is not None:
+        start, size, smallest = key_bounds[0], key_bounds[1] - key_bounds[0] + 1, MIN_RANGE_KEYS
+    else:
+        return [(None, None)]
+    count = max(1, min(parts, size // smallest))
+    bounds = [None] + [start + size * i // count for i in range(1, count)] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def encode_header(selected_columns: list[tuple[str, str]]) -> bytes:
+    """
+    Returns the CSV header line of the exported columns, quoted like COPY quotes values.
+    """
+    line = io.StringIO()
+    csv.writer(line, lineterminator='\n').writerow([column for column, _ in selected_columns])
+    return line.getvalue().encode('utf-8')
+
+def part_file(output_file: str, index: int) -> str:
+    """
+    Returns the path of the file the range `index` of an export is written to.
+    """
+    return f"{output_file}.part{index:05d}"
+
+def resume_plan(state: RunState, output_file: str, schema: str, table: str, columns: list[str]) -> dict[str, Any]:
+    """
+    Returns the plan of an interrupted export to resume, or an empty one to plan the export again.
+
+    A resumed export runs under a new snapshot. A range of keys holds the same rows under any
+    snapshot, so every row is exported once, in its version at the time its range was exported.
+    An update writes the new version of a row into another heap block, so ranges of blocks exported
+    under different snapshots could miss an updated row or hold it twice. An export split on ctid
+    starts over, its part files and finished ranges are discarded.
+
+    Args:
+        state (RunState): The state file of the export.
+        output_file (str): The CSV file to write.
+        schema (str): The schema name.
+        table (str): The table name.
+        columns (list[str]): The names of the exported columns.
+
+    Returns:
+        dict[str, Any]: The plan, with the `split` and the `ranges`, or an empty dict.
+
+    Raises:
+        Exception: If the state file is for another export.
+    """
+    plan = state.get(output_file)
+    if not plan:
+        return {}
+    if (plan['schema'], plan['table'], plan['columns']) != (schema, table, columns):
+        raise Exception(f"The state file {state.file_path} is for an export of {plan['schema']}.{plan['table']} ({', '.join(plan['columns'])})")
+    if plan['split'] != 'ctid':
+        return plan
+    for index in range(len(plan['ranges'])):
+        path = part_file(output_file, index)
+        state.remove(path)
+        if os.path.exists(path):
+            os.remove(path)
+    state.remove(output_file)
+    return {}
+
+def assemble_output(output_file: str, selected_columns: list[tuple[str, str]], part_files: list[str], compression: str|None = None):
+    """
+    Writes the header and joins the part files into the output, then removes them.
+
+    Compressed streams written one after the other read as a single stream, so compressed parts
+    are joined as they are, without compressing them again.
+
+    Args:
+        output_file (str): The output file, replaced once complete.
+        selected_columns (list[tuple[str, str]]): The exported columns.
+        part_files (list[str]): The part files, in order.
+        compression (str|None): The compression of the parts, from `detect_compression`.
+    """
+    temp_file = f"{output_file}.tmp"
+    with open_output(temp_file, compression) as f:
+        f.write(encode_header(selected_columns))
+    with open(temp_file, 'ab') as out:
+        for path in part_files:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out, APPEND_BLOCK_SIZE)
+    os.replace(temp_file, output_file)
+    for path in part_files:
+        os.remove(path)
+
+def export_table(output_file: str, schema: str, table: str, selected_columns: list[tuple[str, str]], workers: int = 1, split: str = 'auto',
+                 compression: str|None = None, state_file: str|None = None, stats: RunStats|None = None,
+                 on_progress: Callable[[int], None]|None = None) -> dict[str, Any]:
+    """
+    Exports the rows of a table to a CSV file with a header, over several connections.
+
+    The table is split into ranges of heap blocks or primary key values, and `workers` threads each
+    COPY ranges to their own part file over their own connection. All of them import the snapshot
+    of one transaction, so together they see the table at a single point in time. Finished ranges
+    are recorded in the state file. A rerun with the same state file exports only the others of
+    a table split on its key, under a new snapshot, and starts a table split on ctid over, see
+    `resume_plan`. The parts are joined into the output at the end.
+
+    Args:
+        output_file (str): The CSV file to write.
+        schema (str): The schema name.
+        table (str): The table name.
+        selected_columns (list[tuple[str, str]]): The columns to export, in order.
+        workers (int): The number of connections exporting ranges at a time.
+        split (str): How to split the table, see `choose_split`.
+        compression (str|None): The compression of the output, None for a plain CSV file.
+        state_file (str|None): The file the plan and finished ranges are kept in, defaults to <output>_export_state.json
+            named like the output without its extensions.
+        stats (RunStats|None): Collects the time spent copying, and the rows and bytes written, shared by the workers.
+        on_progress (Callable[[int], None]|None): Called with the number of rows of every range written.
+
+    Returns:
+        dict[str, Any]: The `rows` written by this run and the earlier ones, the `split`, the number of `ranges` and of
+        `resumed` ranges written by earlier runs, and the `snapshot`.
+
+    Raises:
+        Exception: If the state file is for another export, or a range fails.
+    """
+    stats = stats or RunStats()
+    state = RunState(state_file or f"{os.path.splitext(strip_compression_extension(output_file))[0]}_export_state.json")
+    columns = [column for column, _ in selected_columns]
+    with get_db() as conn:
+        snapshot = export_snapshot(conn)
+        plan = resume_plan(state, output_file, schema, table, columns)
+        if not plan:
+            layout = get_export_layout(conn, schema, table)
+            chosen = choose_split(layout, split, conn.server_version)
+            bounds = get_key_bounds(conn, schema, table, layout['key_column']) if chosen == 'key' else (None, None)
+            ranges = plan_ranges(chosen, workers * RANGES_PER_WORKER, layout['pages'], bounds)
+            plan = {'schema': schema, 'table': table, 'columns': columns, 'split': chosen, 'key_column': layout['key_column'], 'ranges': ranges}
+            state.update(output_file, **plan)
+        part_files = [part_file(output_file, index) for index in range(len(plan['ranges']))]
+        pending: queue.Queue[int] = queue.Queue()
+        for index, path in enumerate(part_files):
+            if state.get(path).get('status') != 'done':
+                pending.put(index)
+        resumed = len(part_files) - pending.qsize()
+        lock = threading.Lock()
+        failed = threading.Event()
+
+        def run():
+            try:
+                with get_db() as worker_conn:
+                    import_snapshot(worker_conn, snapshot)
+                    with worker_conn.cursor() as cursor:
+                        while not failed.is_set():
+                            try:
+                                index = pending.get_nowait()
+                            except queue.Empty:
+                                return
+                            lower, upper = plan['ranges'][index]
+                            query = generate_export_query(selected_columns, table, schema, plan['split'], plan['key_column'], lower, upper)
+                            temp_file = f"{part_files[index]}.tmp"
+                            with stats.stage('copy'), open_output(temp_file, compression) as f:
+                                rows = copy_to(cursor, query, f)
+                            os.replace(temp_file, part_files[index])
+                            state.update(part_files[index], status='done', rows=rows)
+                            stats.count('rows', rows)
+                            stats.count('output_bytes', os.path.getsize(part_files[index]))
+                            if on_progress:
+                                with lock:
+                                    on_progress(rows)
+            except BaseException:
+                # The other workers stop after their current range
+                failed.set()
+                raise
+
+        threads = min(workers, pending.qsize())
+        if threads:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                futures = [executor.submit(run) for _ in range(threads)]
+            for future in futures:
+                future.result()
+    rows = sum(state.get(path).get('rows', 0) for path in part_files)
+    with stats.stage('assemble'):
+        assemble_output(output_file, selected_columns, part_files, compression)
+    os.remove(state.file_path)
+    return {'rows': rows, 'split': plan['split'], 'ranges': len(part_files), 'resumed': resumed, 'snapshot': snapshot}
@@ -0,0 +1,859 @@
+import cProfile
+import contextlib
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Iterable, Iterator
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from db import (connect, copy_rows, create_merge_table, create_staging_table, drop_indexes_and_constraints, estimate_rows, finish_prepared_transaction,
+                get_db, has_unique_key, iter_column_text, list_prepared_transactions, merge_rows, truncate_table)
+from utils.batch import BatchSizer
+from utils.compression import detect_compression
+from utils.convert import Converter, compile_converters, convert_column, encode_copy_columns, join_copy_columns
+from utils.db import generate_conflict_clause, generate_prepared_insert, generate_query_string, generate_row
+from utils.file import Checkpointer, log_error, part_checkpoint_file, read_checkpoint
+from utils.keys import KeyFilter, create_key_index
+from utils.partitions import PartitionRouter
+from utils.pipeline import threaded
+from utils.reader import COLUMNAR_FORMATS, detect_format, read_chunks
+from utils.stats import RunStats
+
+# Errors caused by the content of a row, as opposed to the connection or the statement
+ROW_ERRORS: tuple[type[Exception], ...] = (psycopg2.DataError, psycopg2.IntegrityError, ValueError, TypeError, OverflowError)
+try:
+    import psycopg
+    ROW_ERRORS += (psycopg.DataError, psycopg.IntegrityError)
+except ImportError:
+    pass
+# Chunks read ahead of the encoder, and batches encoded ahead of the writer, in a pipelined load
+PIPELINE_CHUNKS = 2
+PIPELINE_BATCHES = 8
+
+Batch = str|list[tuple[str|None, ...]]
+
+def encode_batch(rows: pd.DataFrame, selected_columns: list[tuple[str, str]], table: str, schema: str, engine: str, converters: list[Converter],
+                 stats: RunStats|None = None, on_conflict: str|None = None) -> Batch:
+    """
+    Encodes a batch of CSV rows for the selected engine.
+
+    Args:
+        rows (pd.DataFrame): The rows of the batch.
+        selected_columns (list[tuple[str, str]]): The list of selected columns to insert.
+        table (str): The table name.
+        schema (str): The schema name.
+        engine (str): Either 'copy', 'insert' or 'prepared'.
+        converters (list[Converter]): The column converters used by the copy and prepared engines.
+        stats (RunStats|None): Collects the time spent converting and serializing the rows.
+        on_conflict (str|None): The `ON CONFLICT` clause added to the INSERT statement.
+
+    Returns:
+        Batch: The COPY data, the INSERT statement, or the text parameters of every row for the prepared engine.
+    """
+    stats = stats or RunStats()
+    if engine == 'copy':
+        with stats.stage('convert'):
+            columns = encode_copy_columns(rows, selected_columns, converters)
+        with stats.stage('serialize'):
+            return join_copy_columns(columns)
+    if engine == 'prepared':
+        with stats.stage('convert'):
+            values = [convert_column(rows[column], converter).tolist() if column in rows.columns else [None] * len(rows)
+                      for (column, _), converter in zip(selected_columns, converters)]
+        with stats.stage('serialize'):
+            return list(zip(*values))
+    with stats.stage('convert'):
+        # -- Ensure the data is in the correct order and handle missing values
+        rows = rows.where(pd.notnull(rows), None)
+        # -- Replace NaN values with 'NULL' for the SQL query
+        rows = rows.fillna('NULL')
+        batch = [generate_row(row, selected_columns) for _, row in rows.iterrows()]
+    with stats.stage('serialize'):
+        query = generate_query_string(batch, selected_columns, table, schema)
+        return f"{query[:-1]} {on_conflict};" if query and on_conflict else query
+
+def send_batch(cursor, data: Batch, selected_columns: list[tuple[str, str]], table: str, schema: str, engine: str, stats: RunStats|None = None,
+               on_conflict: str|None = None) -> int:
+    """
+    Sends a batch encoded by `encode_batch`.
+
+    With an `ON CONFLICT` clause, the copy engine copies the batch into the temporary table of
+    `db.create_merge_table` and inserts it from there, the prepared engine adds it to its INSERT.
+
+    The prepared engine runs a server-side prepared INSERT for every row, sending them all before
+    waiting for their results. In pipeline mode, it does not wait for them at all and errors come up
+    when the pipeline is synchronized.
+
+    Returns:
+        int: The number of characters sent.
+    """
+    with (stats or RunStats()).stage('send'):
+        if engine == 'copy' and on_conflict:
+            merge_rows(cursor, data, selected_columns, table, schema, on_conflict)
+        elif engine == 'copy':
+            copy_rows(cursor, data, selected_columns, table, schema)
+        elif engine == 'prepared':
+            statement = generate_prepared_insert(selected_columns, table, schema)
+            cursor.executemany(f"{statement} {on_conflict}" if on_conflict else statement, data)
+            return sum(len(value) for row in data for value in row if value is not None)
+        else:
+            cursor.execute(data)
+    return len(data)
+
+def insert_batch(cursor, rows: pd.DataFrame, selected_columns: list[tuple[str, str]], table: str, schema: str, engine: str, converters: list[Converter],
+                 stats: RunStats|None = None, on_conflict: str|None = None) -> int:
+    """
+    Sends a batch of CSV rows to the database using the selected engine.
+
+    Args:
+        cursor: The database cursor.
+        rows (pd.DataFrame): The rows of the batch.
+        selected_columns (list[tuple[str, str]]): The list of selected columns to insert.
+        table (str): The table name.
+        schema (str): The schema name.
+        engine (str): Either 'copy', 'insert' or 'prepared'.
+        converters (list[Converter]): The column converters used by the copy and prepared engines.
+        stats (RunStats|None): Collects the time spent converting, serializing and sending the rows.
+        on_conflict (str|None): The `ON CONFLICT` clause the rows are inserted with.
+
+    Returns:
+        int: The number of characters sent.
+    """
+    data = encode_batch(rows, selected_columns, table, schema, engine, converters, stats, on_conflict)
+    return send_batch(cursor, data, selected_columns, table, schema, engine, stats, on_conflict)
+
+def _send_with_savepoint(cursor, send: Callable[[], int], stats: RunStats) -> tuple[Exception|None, int]:
+    cursor.execute("SAVEPOINT csv2pg_rows")
+    try:
+        size = send()
+    except ROW_ERRORS as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT csv2pg_rows")
+        cursor.execute("RELEASE SAVEPOINT csv2pg_rows")
+        stats.count('retries')
+        return e, 0
+    cursor.execute("RELEASE SAVEPOINT csv2pg_rows")
+    return None, size
+
+def insert_batch_skipping_errors(cursor, rows: pd.DataFrame, selected_columns: list[tuple[str, str]], table: str, schema: str, engine: str,
+                                 converters: list[Converter], error_file: str, stats: RunStats|None = None, on_conflict: str|None = None,
+                                 failed_rows: list|None = None) -> tuple[int, int]:
+    """
+    Sends a batch of CSV rows, isolating and skipping the rows that fail.
+
+    The batch is sent inside a savepoint. If it fails, it is rolled back to the savepoint and
+    split in halves until the failing rows are found, which takes O(k log n) round trips for k
+    bad rows in a batch of n. Bad rows are written to the error file with their error message,
+    every other row is kept.
+
+    Args:
+        cursor: The database cursor.
+        rows (pd.DataFrame): The rows of the batch.
+        selected_columns (list[tuple[str, str]]): The list of selected columns to insert.
+        table (str): The table name.
+        schema (str): The schema name.
+        engine (str): Either 'copy', 'insert' or 'prepared'.
+        converters (list[Converter]): The column converters used by the copy and prepared engines.
+        error_file (str): The CSV file the bad rows are appended to.
+        stats (RunStats|None): Collects the stage times and counts the batches sent again.
+        on_conflict (str|None): The `ON CONFLICT` clause the rows are inserted with.
+        failed_rows (list|None): Collects the index of every row skipped.
+
+    Returns:
+        tuple[int, int]: The number of rows skipped and the number of characters sent for the rows kept.
+    """
+    stats = stats or RunStats()
+    error, size = _send_with_savepoint(cursor, lambda: insert_batch(cursor, rows, selected_columns, table, schema, engine, converters, stats, on_conflict), stats)
+    if error is None:
+        return 0, size
+    return _bisect_failed_batch(cursor, rows, error, selected_columns, table, schema, engine, converters, error_file, stats, on_conflict, failed_rows)
+
+def _bisect_failed_batch(cursor, rows: pd.DataFrame, error: Exception, selected_columns: list[tuple[str, str]], table: str, schema: str, engine: str,
+                         converters: list[Converter], error_file: str, stats: RunStats, on_conflict: str|None = None,
+                         failed_rows: list|None = None) -> tuple[int, int]:
+    if len(rows) == 1:
+        log_error(error_file, rows.iloc[0], f"Row {rows.index[0]}: {str(error).strip()}")
+        if failed_rows is not None:
+            failed_rows.append(rows.index[0])
+        return 1, 0
+    half = len(rows) // 2
+    first_skipped, first_size = insert_batch_skipping_errors(cursor, rows.iloc[:half], selected_columns, table, schema, engine, converters, error_file, stats,
+                                                             on_conflict, failed_rows)
+    second_skipped, second_size = insert_batch_skipping_errors(cursor, rows.iloc[half:], selected_columns, table, schema, engine, converters, error_file, stats,
+                                                               on_conflict, failed_rows)
+    return first_skipped + second_skipped, first_size + second_size
+
+def _send_skipping_errors(cursor, rows: pd.DataFrame, data: Batch|None, error: Exception|None, selected_columns: list[tuple[str, str]], table: str,
+                          schema: str, engine: str, converters: list[Converter], error_file: str, stats: RunStats, on_conflict: str|None = None,
+                          failed_rows: list|None = None) -> tuple[int, int]:
+    # Sends a batch already encoded by `encode_batch`, then isolates the failing rows like `insert_batch_skipping_errors`
+    if error is None:
+        error, size = _send_with_savepoint(cursor, lambda: send_batch(cursor, data, selected_columns, table, schema, engine, stats, on_conflict), stats)
+        if error is None:
+            return 0, size
+    return _bisect_failed_batch(cursor, rows, error, selected_columns, table, schema, engine, converters, error_file, stats, on_conflict, failed_rows)
+
+def _commit(conn, checkpointer: Checkpointer, index: int, position: int, stats: RunStats):
+    with stats.stage('commit'):
+        conn.commit()
+    with stats.stage('checkpoint'):
+        checkpointer.save(index, position)
+    stats.count('commits')
+
+def load_rows(conn, csv_file: str, selected_columns: list[tuple[str, str]], schema: str, table: str, checkpoint_file: str,
+              last_checkpoint: int = -1, offset: int|None = None, engine: str = 'copy', chunk_rows: int = 100000, batch_size: int = 1000,
+              adaptive_batch: bool = False, target_latency: float = 0.5, max_batch_bytes: int|None = None,
+              byte_range: tuple[int, int]|None = None, fingerprint: dict[str, Any]|None = None, checkpoint_interval: float = 5.0,
+              checkpoint_rows: int|None = None, on_error: str = 'abort', error_file: str|None = None,
+              pipeline: bool = False, in_flight: int = 8, commit: bool = True, key_filter: KeyFilter|None = None, stats: RunStats|None = None,
+              checkpointer: Checkpointer|None = None, on_progress: Callable[[int], None]|None = None) -> dict[str, Any]:
+    """
+    Loads the rows of a CSV file, or of a byte range of it, into a table.
+
+    Batches are sent one at a time and committed together with a checkpoint of the byte offset
+    of the next unread row, so a failed load resumes by seeking straight past the committed rows.
+    Newline-delimited JSON, Parquet and Arrow IPC files are loaded the same way, see `read_chunks`,
+    only the selected columns of Parquet and Arrow files are read and their checkpoints are row counts.
+    With `pipeline`, commits and checkpoints still only cover the batches sent by this thread.
+
+    The prepared engine sends its batches in libpq pipeline mode, up to `in_flight` of them before
+    waiting for their results, so a failing row may be reported with a later batch. With
+    `on_error='skip'`, the rows of a batch are still sent without waiting, but every batch is
+    confirmed before the next one is sent.
+
+    With a `key_filter`, the rows already in the table are dropped from each batch before it is
+    encoded, and the others are inserted with an `ON CONFLICT` clause on its key columns, through
+    a temporary table for the copy engine. The rows are added to the filter once they are sent.
+
+    Args:
+        conn: The database connection, from `db.connect` for the engine.
+        csv_file (str): The path to the CSV file.
+        selected_columns (list[tuple[str, str]]): The list of selected columns to insert.
+        schema (str): The schema name.
+        table (str): The table name.
+        checkpoint_file (str): The checkpoint file.
+        last_checkpoint (int): The last row already loaded, -1 to load every row.
+        offset (int|None): The byte offset of the next unread row, or its row number for Parquet and Arrow files.
+            Without it, rows up to `last_checkpoint` are read and skipped, as with checkpoints from older versions.
+        engine (str): Either 'copy', 'insert' or 'prepared'.
+        chunk_rows (int): The number of CSV rows read into memory at a time.
+        batch_size (int): The number of rows sent per statement, or the first one with `adaptive_batch`.
+        adaptive_batch (bool): Adjust the batch size to the measured throughput, see `BatchSizer`.
+        target_latency (float): The number of seconds sending one batch should take with `adaptive_batch`.
+        max_batch_bytes (int|None): The largest encoded batch with `adaptive_batch`.
+        byte_range (tuple[int, int]|None): Only load the rows in this byte range of the file.
+        fingerprint (dict[str, Any]|None): The `file_fingerprint` stored in the checkpoints.
+        checkpoint_interval (float): The number of seconds between commits and checkpoints.
+        checkpoint_rows (int|None): The number of rows between commits and checkpoints.
+        on_error (str): 'abort' to stop at the first failing batch, 'skip' to write failing rows
+            to `error_file` and keep going.
+        error_file (str|None): The CSV file failing rows are written to when skipping them.
+        pipeline (bool): Read, encode and send in three threads connected by bounded queues, so parsing
+            and encoding the next batches overlaps waiting on the database.
+        in_flight (int): The number of batches the prepared engine sends before waiting for their results.
+        commit (bool): Commit and checkpoint as the rows are sent. Without it, every row is sent in the
+            open transaction and nothing is checkpointed, for loads the caller commits.
+        key_filter (KeyFilter|None): Drops the rows already in the table, see `preload_key_filter`.
+        stats (RunStats|None): Collects the stage times and counters of the load, kept up to date if it fails.
+        checkpointer (Checkpointer|None): Saves the checkpoints instead of one built for `checkpoint_file`.
+        on_progress (Callable[[int], None]|None): Called with the number of bytes read after each batch,
+            compressed bytes for a compressed file.
+
+    Returns:
+        dict[str, Any]: The number of rows loaded, skipped because they failed and dropped because they
+            were already in the table, the batch sizes used and the stats of the load.
+
+    Raises:
+        Exception: If a batch fails, with the row the batch ended at.
+    """
+    converters = compile_converters(selected_columns)
+    checkpointer = checkpointer or Checkpointer(checkpoint_file, schema, table, selected_columns, fingerprint, byte_range, checkpoint_interval, checkpoint_rows)
+    first_row = last_checkpoint + 1 if offset is not None else 0
+    bytes_read = offset if offset is not None else (byte_range[0] if byte_range else 0)
+    sizer = BatchSizer(batch_size, adaptive_batch, target_latency, max_rows=chunk_rows, max_bytes=max_batch_bytes)
+    stats = stats or RunStats()
+    index = last_checkpoint
+    loaded = 0
+    skipped = 0
+    duplicates = 0
+    on_conflict = generate_conflict_clause(selected_columns, key_filter.key_columns, key_filter.action, table) if key_filter else None
+    # Offsets of a compressed file are in its decompressed content and those of a Parquet or Arrow file
+    # are row counts, progress is in bytes of the file itself
+    columnar = detect_format(csv_file) in COLUMNAR_FORMATS
+    compressed = columnar or detect_compression(csv_file) is not None
+    input_read = input_reported = 0 if compressed else bytes_read
+
+    def on_read(position: int):
+        nonlocal input_read
+        stats.count('input_bytes', position - input_read)
+        input_read = position
+
+    def read_rows() -> Iterator[tuple[pd.DataFrame, np.ndarray]]:
+        chunks = read_chunks(csv_file, chunk_rows, byte_range, offset, first_row, on_read, [column for column, _ in selected_columns])
+        for chunk, ends in stats.iterate('read', chunks):
+            if offset is None:
+                keep = chunk.index > last_checkpoint # Skip rows up to the last checkpoint
+                chunk, ends = chunk[keep], ends[keep]
+            yield chunk, ends
+
+    def encode_batches(chunks: Iterable[tuple[pd.DataFrame, np.ndarray]]) -> Iterator[tuple[pd.DataFrame, int, int, Batch|None, Exception|None, pd.Series|None]]:
+        nonlocal duplicates
+        for chunk, ends in chunks:
+            start = 0
+            while start < len(chunk):
+                rows = chunk.iloc[start:start + sizer.rows]
+                start += len(rows)
+                last_row, position = rows.index[-1], int(ends[start - 1])
+                hashes = None
+                try:
+                    if key_filter:
+                        with stats.stage('filter'):
+                            kept, hashes = key_filter.filter(rows, converters)
+                        duplicates += len(rows) - len(kept)
+                        stats.count('duplicates', len(rows) - len(kept))
+                        rows = kept
+                    data = encode_batch(rows, selected_columns, table, schema, engine, converters, stats, on_conflict) if len(rows) else None
+                    yield rows, last_row, position, data, None, hashes
+                except ROW_ERRORS as e:
+                    yield rows, last_row, position, None, e, hashes
+
+    if pipeline:
+        # Reading, encoding and sending run in three threads, a few chunks and batches apart
+        batches = threaded(encode_batches(threaded(read_rows(), PIPELINE_CHUNKS)), PIPELINE_BATCHES)
+    else:
+        batches = encode_batches(read_rows())
+    unconfirmed = 0
+    # Batches that fail are rolled back to a savepoint and sent again, so they are not left in flight
+    in_pipeline = engine == 'prepared' and on_error != 'skip'
+    if on_conflict and engine == 'copy':
+        create_merge_table(conn, schema, table, selected_columns)
+    with conn.cursor() as cursor, conn.pipeline() if in_pipeline else contextlib.nullcontext() as libpq_pipeline:
+        try:
+            for rows, index, position, data, error, hashes in stats.iterate('wait', batches) if pipeline else batches:
+                sent_at = time.perf_counter()
+                failed = size = 0
+                failed_rows: list = []
+                if not len(rows):
+                    pass # Every row of the batch is already in the table
+                elif on_error == 'skip':
+                    failed, size = _send_skipping_errors(cursor, rows, data, error, selected_columns, table, schema, engine, converters, error_file, stats,
+                                                         on_conflict, failed_rows)
+                    skipped += failed
+                elif error:
+                    raise error
+                else:
+                    size = send_batch(cursor, data, selected_columns, table, schema, engine, stats, on_conflict)
+                    if libpq_pipeline:
+                        unconfirmed += 1
+                if hashes is not None:
+                    key_filter.add_sent(hashes, failed_rows)
+                if unconfirmed >= in_flight:
+                    with stats.stage('sync'):
+                        libpq_pipeline.sync()
+                    unconfirmed = 0
+                sizer.update(len(rows), size, time.perf_counter() - sent_at)
+                loaded += len(rows)
+                stats.count('batches')
+                stats.count('rows', len(rows) - failed)
+                stats.count('skipped', failed)
+                stats.count('bytes', size)
+                if not columnar:
+                    stats.count('bytes_read', position - bytes_read)
+                checkpointer.add(len(rows))
+                if commit and checkpointer.due():
+                    _commit(conn, checkpointer, index, position, stats)
+                    unconfirmed = 0
+                if on_progress:
+                    on_progress(input_read - input_reported if compressed else position - bytes_read)
+                input_reported = input_read
+                bytes_read = position
+                stats.report()
+            if commit and checkpointer.pending_rows:
+                _commit(conn, checkpointer, index, bytes_read, stats)
+        except Exception as e:
+            raise Exception(f"Error inserting batch ending at row {index}: {e}") from e
+        finally:
+            close = getattr(batches, 'close', None)
+            if close:
+                close()
+    return {'rows': loaded - skipped, 'skipped': skipped, 'duplicates': duplicates, 'batch_size': sizer.summary(), 'stats': stats.to_dict()}
+
+class _PartitionWriter:
+    """
+    Sends batches of rows to partitions over a connection of its own, in a background thread.
+
+    Batches, prepares and commits are queued in order. The batches between two commits are sent
+    in a two-phase transaction, named after `gid_prefix` and a count, which 'prepare' prepares and
+    'commit' commits. After a failure, the remaining batches are dropped and the error is kept for
+    the reader, prepares and commits still signal that they were handled.
+    """
+
+    def __init__(self, engine: str, selected_columns: list[tuple[str, str]], converters: list[Converter], on_error: str,
+                 error_file: str|None, error_lock: threading.Lock, stats: RunStats, gid_prefix: str):
+        self.engine = engine
+        self.selected_columns = selected_columns
+        self.converters = converters
+        self.on_error = on_error
+        self.error_file = error_file
+        self.error_lock = error_lock
+        self.stats = stats
+        self.gid_prefix = gid_prefix
+        self.transactions = 0
+        self.gid: str|None = None
+        self.prepared: str|None = None
+        self.items: queue.Queue = queue.Queue(PIPELINE_BATCHES)
+        self.error: BaseException|None = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _send(self, cursor, rows: pd.DataFrame, schema: str, table: str):
+        data = encode_batch(rows, self.selected_columns, table, schema, self.engine, self.converters, self.stats)
+        failed = 0
+        if self.on_error == 'skip':
+            error, size = _send_with_savepoint(cursor, lambda: send_batch(cursor, data, self.selected_columns, table, schema, self.engine, self.stats), self.stats)
+            if error is not None:
+                # The error file is shared by every writer
+                with self.error_lock:
+                    failed, size = _bisect_failed_batch(cursor, rows, error, self.selected_columns, table, schema, self.engine, self.converters,
+                                                        self.error_file, self.stats)
+        else:
+            size = send_batch(cursor, data, self.selected_columns, table, schema, self.engine, self.stats)
+        self.stats.count('batches')
+        self.stats.count('rows', len(rows) - failed)
+        self.stats.count('skipped', failed)
+        self.stats.count('bytes', size)
+
+    def _run(self):
+        with contextlib.ExitStack() as stack:
+            conn = cursor = None
+            for kind, payload in iter(self.items.get, None):
+                try:
+                    if self.error is not None:
+                        continue
+                    if conn is None:
+                        conn = stack.enter_context(connect(self.engine))
+                        cursor = stack.enter_context(conn.cursor())
+                    if kind == 'batch':
+                        rows, schema, table = payload
+                        if self.gid is None:
+                            self.transactions += 1
+                            self.gid = f"{self.gid_prefix}{self.transactions}"
+                            conn.tpc_begin(self.gid)
+                        try:
+                            self._send(cursor, rows, schema, table)
+                        except Exception as e:
+                            raise Exception(f"Error inserting batch into {schema}.{table} ending at row {rows.index[-1]}: {e}") from e
+                    elif kind == 'prepare':
+                        if self.gid is not None:
+                            with self.stats.stage('prepare'):
+                                conn.tpc_prepare()
+                            self.prepared, self.gid = self.gid, None
+                    elif self.prepared is not None:
+                        with self.stats.stage('commit'):
+                            conn.tpc_commit()
+                        self.prepared = None
+                except BaseException as e:
+                    self.error = e
+                finally:
+                    if kind != 'batch':
+                        payload.set()
+
+    def put(self, kind: str, payload: Any):
+        self.items.put((kind, payload))
+
+    def close(self, discard: bool = False):
+        if discard and self.error is None:
+            self.error = Exception("The load stopped") # The batches still queued are dropped
+        self.items.put(None)
+        self.thread.join()
+
+def load_partitions(csv_file: str, selected_columns: list[tuple[str, str]], schema: str, table: str, checkpoint_file: str, router: PartitionRouter,
+                    workers: int = 4, last_checkpoint: int = -1, offset: int|None = None, engine: str = 'copy', chunk_rows: int = 100000,
+                    batch_size: int = 1000, fingerprint: dict[str, Any]|None = None, checkpoint_interval: float = 5.0, checkpoint_rows: int|None = None,
+                    on_error: str = 'abort', error_file: str|None = None, pipeline: bool = False, stats: RunStats|None = None,
+                    on_progress: Callable[[int], None]|None = None) -> dict[str, Any]:
+    """
+    Loads the rows of a file into the partitions of a partitioned table directly, over many connections.
+
+    The rows of each chunk are routed with `router` into a buffer per partition, and every full
+    batch is sent straight to its partition, so the server does not route them and partitions load
+    concurrently. Each partition is loaded by one of `workers` connections, each in a thread of its
+    own, so no two connections insert into the same partition. Rows the router cannot place are
+    sent to the parent table.
+
+    At each checkpoint, the buffers are sent and every connection prepares its transaction with
+    `PREPARE TRANSACTION`. The checkpoint is saved with the ids of the prepared transactions, then
+    they are committed with `COMMIT PREPARED`. The server needs `max_prepared_transactions` of at
+    least `workers`. If the load fails before they are all committed, `resolve_prepared` commits
+    those recorded in the checkpoint and rolls back the others, so the committed rows always match
+    the checkpoint and a resume sends each row once. A resume calls it first, in case the process
+    was killed.
+
+    Args:
+        csv_file (str): The path to the file.
+        selected_columns (list[tuple[str, str]]): The list of selected columns to insert.
+        schema (str): The schema name of the partitioned table.
+        table (str): The partitioned table name.
+        checkpoint_file (str): The checkpoint file.
+        router (PartitionRouter): Routes the rows, from `create_partition_router`.
+        workers (int): The number of connections.
+        last_checkpoint (int): The last row already loaded, -1 to load every row.
+        offset (int|None): The position of the next unread row, see `load_rows`.
+        engine (str): Either 'copy', 'insert' or 'prepared'.
+        chunk_rows (int): The number of rows read into memory at a time.
+        batch_size (int): The number of rows sent per statement to a partition.
+        fingerprint (dict[str, Any]|None): The `file_fingerprint` stored in the checkpoints.
+        checkpoint_interval (float): The number of seconds between commits and checkpoints.
+        checkpoint_rows (int|None): The number of rows between commits and checkpoints.
+        on_error (str): 'abort' to stop at the first failing batch, 'skip' to write failing rows
+            to `error_file` and keep going.
+        error_file (str|None): The CSV file failing rows are written to when skipping them.
+        pipeline (bool): Read and route the next chunk in a background thread.
+        stats (RunStats|None): Collects the stage times and counters of the load, kept up to date if it fails.
+        on_progress (Callable[[int], None]|None): Called with the number of bytes of the file read after each chunk.
+
+    Returns:
+        dict[str, Any]: The number of rows loaded and skipped because they failed, the rows sent to each
+            partition and the stats of the load.
+
+    Raises:
+        Exception: If a batch fails, with the partition and the row the batch ended at.
+    """
+    converters = compile_converters(selected_columns)
+    key_converter = converters[[column for column, _ in selected_columns].index(router.key_column)]
+    checkpointer = Checkpointer(checkpoint_file, schema, table, selected_columns, fingerprint, None, checkpoint_interval, checkpoint_rows)
+    first_row = last_checkpoint + 1 if offset is not None else 0
+    stats = stats or RunStats()
+    columnar = detect_format(csv_file) in COLUMNAR_FORMATS
+    compressed = columnar or detect_compression(csv_file) is not None
+    bytes_read = offset or 0
+    input_read = input_reported = 0 if compressed else bytes_read
+
+    def on_read(position: int):
+        nonlocal input_read
+        stats.count('input_bytes', position - input_read)
+        input_read = position
+
+    def read_rows() -> Iterator[tuple[pd.DataFrame, np.ndarray]]:
+        chunks = read_chunks(csv_file, chunk_rows, None, offset, first_row, on_read, [column for column, _ in selected_columns])
+        for chunk, ends in stats.iterate('read', chunks):
+            if offset is None:
+                keep = chunk.index > last_checkpoint # Skip rows up to the last checkpoint
+                chunk, ends = chunk[keep], ends[keep]
+            if len(chunk):
+                yield chunk, ends
+
+    # The parent table comes last, after the partitions
+    targets = [*router.partitions, (schema, table)]
+    error_lock = threading.Lock()
+    # Transaction ids are unique to the run, so one left by an earlier run is never taken for one of this run
+    gid_prefix = f"{prepared_prefix(checkpoint_file)}{uuid.uuid4().hex[:8]}_"
+    writers = [_PartitionWriter(engine, selected_columns, converters, on_error, error_file, error_lock, stats, f"{gid_prefix}{number}_")
+               for number in range(max(1, min(workers, len(targets))))]
+    pending: list[list[pd.DataFrame]] = [[] for _ in targets]
+    pending_rows = [0] * len(targets)
+    routed = [0] * len(targets)
+
+    def check_writers():
+        for writer in writers:
+            if writer.error is not None:
+                raise writer.error
+
+    def send(target: int, force: bool = False):
+        rows = pd.concat(pending[target]) if len(pending[target]) > 1 else pending[target][0]
+        start = 0
+        while len(rows) - start >= batch_size or (force and start < len(rows)):
+            writers[target % len(writers)].put('batch', (rows.iloc[start:start + batch_size], *targets[target]))
+            start += batch_size
+        pending[target] = [rows.iloc[start:]] if start < len(rows) else []
+        pending_rows[target] = max(len(rows) - start, 0)
+
+    def finish(kind: str):
+        done = [threading.Event() for _ in writers]
+        for writer, event in zip(writers, done):
+            writer.put(kind, event)
+        with stats.stage(f'{kind}_wait'):
+            for event in done:
+                event.wait()
+        check_writers()
+
+    def commit(index: int, position: int):
+        for target in range(len(targets)):
+            if pending_rows[target]:
+                send(target, force=True)
+        finish('prepare')
+        with stats.stage('checkpoint'):
+            checkpointer.save(index, position, [writer.prepared for writer in writers if writer.prepared])
+        finish('commit')
+        stats.count('commits')
+
+    chunks = threaded(read_rows(), PIPELINE_CHUNKS) if pipeline else read_rows()
+    index, position = last_checkpoint, bytes_read
+    completed = False
+    try:
+        for chunk, ends in chunks:
+            with stats.stage('route'):
+                routes = router.route(chunk, key_converter)
+                routes[routes < 0] = len(targets) - 1
+                order = np.argsort(routes, kind='stable')
+                boundaries = np.flatnonzero(np.diff(routes[order])) + 1
+                for group in np.split(order, boundaries):
+                    target = int(routes[group[0]])
+                    pending[target].append(chunk.iloc[group])
+                    pending_rows[target] += len(group)
+                    routed[target] += len(group)
+            for target in range(len(targets)):
+                if pending_rows[target] >= batch_size:
+                    send(target)
+            check_writers()
+            index, position = int(chunk.index[-1]), int(ends[-1])
+            if not columnar:
+                stats.count('bytes_read', position - bytes_read)
+            checkpointer.add(len(chunk))
+            if checkpointer.due():
+                commit(index, position)
+            if on_progress:
+                on_progress(input_read - input_reported if compressed else position - bytes_read)
+            input_reported = input_read
+            bytes_read = position
+            stats.report()
+        if checkpointer.pending_rows:
+            commit(index, position)
+        completed = True
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+        for writer in writers:
+            writer.close(discard=not completed)
+        if not completed:
+            # A resume finishes them if the server cannot be reached
+            with contextlib.suppress(Exception):
+                resolve_prepared(checkpoint_file)
+    check_writers()
+    counters = stats.to_dict()['counters']
+    return {
+        'rows': counters.get('rows', 0),
+        'skipped': counters.get('skipped', 0),
+        'partitions': {f"{target_schema}.{target_table}": rows for (target_schema, target_table), rows in zip(targets, routed) if rows},
+        'stats': stats.to_dict(),
+    }
+
+def prepared_prefix(checkpoint_file: str) -> str:
+    """
+    Returns the prefix of the ids of the transactions prepared by a partitioned load, named after its checkpoint file.
+    """
+    return f"csv2pg_{hashlib.sha1(os.path.abspath(checkpoint_file).encode('utf-8')).hexdigest()[:16]}_"
+
+def resolve_prepared(checkpoint_file: str) -> tuple[int, int]:
+    """
+    Finishes the transactions a partitioned load left prepared when it stopped, see `load_partitions`.
+
+    The transactions recorded in the checkpoint were prepared before it was saved and are committed.
+    The others hold rows past the checkpoint and are rolled back.
+
+    Args:
+        checkpoint_file (str): The checkpoint file of the load.
+
+    Returns:
+        tuple[int, int]: The number of transactions committed and rolled back.
+    """
+    checkpointed = set(read_checkpoint(checkpoint_file).get('prepared', []))
+    committed = rolled_back = 0
+    with get_db() as conn:
+        conn.autocommit = True
+        for gid in list_prepared_transactions(conn, prepared_prefix(checkpoint_file)):
+            finish_prepared_transaction(conn, gid, gid in checkpointed)
+            if gid in checkpointed:
+                committed += 1
+            else:
+                rolled_back += 1
+    return committed, rolled_back
+
+def fast_load(conn, strategy: str, csv_file: str, selected_columns: list[tuple[str, str]], schema: str, table: str,
+              checkpoint_file: str, maintenance_workers: int|None = None, stats: RunStats|None = None, **kwargs) -> dict[str, Any]:
+    """
+    Replaces every row of a table with the rows of a CSV file in a single transaction.
+
+    The table is truncated in the same transaction as the load, which lets Postgres skip writing
+    WAL for the new rows with `wal_level=minimal`. If anything fails, the transaction is rolled
+    back and the table is left as it was.
+
+    With the 'staging' strategy, the rows are loaded into an unlogged table without constraints,
+    then copied into the table with one `INSERT ... SELECT`, so the table stays readable until the
+    rows are copied. With the 'rebuild' strategy, the rows are loaded into the table itself. Either
+    way, the indexes, keys and foreign keys of the table are dropped before the rows go into it and
+    are created again after them. The table is analyzed at the end.
+
+    Args:
+        conn: The database connection.
+        strategy (str): Either 'staging' or 'rebuild'.
+        csv_file (str): The path to the CSV file.
+        selected_columns (list[tuple[str, str]]): The list of selected columns to insert.
+        schema (str): The schema name.
+        table (str): The table name.
+        checkpoint_file (str): The checkpoint file, unused as nothing is committed before the end.
+        maintenance_workers (int|None): The `max_parallel_maintenance_workers` used to create the indexes again.
+        stats (RunStats|None): Collects the stage times and counters of the load.
+        **kwargs: Passed on to `load_rows`.
+
+    Returns:
+        dict[str, Any]: The result of `load_rows`.
+    """
+    stats = stats or RunStats()
+    columns = ','.join(column[0] for column in selected_columns)
+    try:
+        with stats.stage('prepare'):
+            if maintenance_workers:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT set_config('max_parallel_maintenance_workers', %s, true);", (str(maintenance_workers),))
+            if strategy == 'staging':
+                target_table = create_staging_table(conn, schema, table, selected_columns)
+            else:
+                truncate_table(conn, schema, table, commit=False)
+                creates = drop_indexes_and_constraints(conn, schema, table)
+                target_table = table
+        result = load_rows(conn, csv_file, selected_columns, schema, target_table, checkpoint_file, commit=False, stats=stats, **kwargs)
+        with stats.stage('finish'), conn.cursor() as cursor:
+            if strategy == 'staging':
+                # The table is only locked from here on, its indexes are built once rather than updated row by row
+                truncate_table(conn, schema, table, commit=False)
+                creates = drop_indexes_and_constraints(conn, schema, table)
+                cursor.execute(f"INSERT INTO {schema}.{table} ({columns}) SELECT {columns} FROM {schema}.{target_table};")
+                cursor.execute(f"DROP TABLE {schema}.{target_table};")
+            for statement in creates:
+                cursor.execute(statement)
+            cursor.execute(f"ANALYZE {schema}.{table};")
+        with stats.stage('commit'):
+            conn.commit()
+        stats.count('commits')
+    except Exception:
+        conn.rollback()
+        raise
+    result['stats'] = stats.to_dict()
+    return result
+
+def preload_key_filter(conn, schema: str, table: str, selected_columns: list[tuple[str, str]], key_columns: list[str], action: str,
+                       index: str = 'hash', error_rate: float = 1e-6, stats: RunStats|None = None) -> KeyFilter:
+    """
+    Reads the rows of a table into the key index of a `KeyFilter`, for loads that skip or update existing rows.
+
+    Only hashes are kept, of the key columns with the 'skip' action, or of every selected column
+    with 'update'. A Bloom filter is sized for twice the rows of the table, so it keeps its error
+    rate while the rows of the file are added.
+
+    Args:
+        conn: A database connection, the rows are read in a transaction left open.
+        schema (str): The schema name.
+        table (str): The table name.
+        selected_columns (list[tuple[str, str]]): The list of selected columns to insert.
+        key_columns (list[str]): The columns of a unique key of the table.
+        action (str): 'skip' to keep the rows in the table, 'update' to overwrite them.
+        index (str): 'hash' for a set of hashes, 'bloom' for a Bloom filter.
+        error_rate (float): The false positive rate of a Bloom filter.
+        stats (RunStats|None): Collects the time spent preloading and counts the rows read.
+
+    Returns:
+        KeyFilter: The filter, to pass to `load_rows`.
+
+    Raises:
+        Exception: If the table has no unique index on the key columns.
+    """
+    stats = stats or RunStats()
+    with stats.stage('preload'):
+        if not has_unique_key(conn, schema, table, key_columns):
+            raise Exception(f"Table {schema}.{table} has no unique index on ({', '.join(key_columns)}), which ON CONFLICT needs")
+        capacity = 2 * estimate_rows(conn, schema, table) if index == 'bloom' else 0
+        key_filter = KeyFilter(selected_columns, key_columns, action, create_key_index(index, capacity, error_rate))
+        for rows in iter_column_text(conn, schema, table, key_filter.indexed_columns):
+            key_filter.add_existing(rows)
+            stats.count('existing_rows', len(rows))
+    return key_filter
+
+def _load_part(part: int, byte_range: tuple[int, int], last_checkpoint: int, offset: int|None, messages: multiprocessing.Queue,
+               stats_interval: float|None = None, profile_file: str|None = None, **kwargs):
+    profiler = cProfile.Profile() if profile_file else None
+    if profiler:
+        profiler.enable()
+    try:
+        with connect(kwargs.get('engine', 'copy')) as conn:
+            result = load_rows(conn, byte_range=byte_range, last_checkpoint=last_checkpoint, offset=offset,
+                               stats=RunStats(stats_interval, f"part {part}"),
+                               on_progress=lambda size: messages.put(('progress', part, size)), **kwargs)
+        messages.put(('done', part, result))
+    except Exception as e:
+        messages.put(('error', part, f"{traceback.format_exc()}\nPart {part} failed: {e}"))
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(part_checkpoint_file(profile_file, part))
+
+def load_parts(csv_file: str, selected_columns: list[tuple[str, str]], schema: str, table: str, checkpoint_file: str,
+               parts: list[tuple[tuple[int, int], int, int|None]], on_progress: Callable[[int, int], None]|None = None, **kwargs) -> tuple[list[dict[str, Any]], list[str]]:
+    """
+    Loads byte ranges of a CSV file in parallel, one process and one connection per range.
+
+    Each range keeps its own checkpoint file next to `checkpoint_file`, so a rerun only
+    loads what is left of the ranges that did not finish.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        selected_columns (list[tuple[str, str]]): The list of selected columns to insert.
+        schema (str): The schema name.
+        table (str): The table name.
+        checkpoint_file (str): The main checkpoint file path.
+        parts (list[tuple[tuple[int, int], int, int|None]]): The byte range, last checkpoint and byte offset of each part.
+        on_progress (Callable[[int, int], None]|None): Called with the part number and the number of bytes it read.
+        **kwargs: Passed on to `load_rows`, except `stats_interval`, the number of seconds between
+            the stats lines of each part, and `profile_file`, a cProfile output path that each part
+            writes its own `_part<N>` variant of.
+
+    Returns:
+        tuple[list[dict[str, Any]], list[str]]: The `load_rows` result of every part that finished, and the error message
+            of every part that failed.
+    """
+    context = multiprocessing.get_context('spawn')
+    messages = context.Queue()
+    processes = []
+    for part, (byte_range, last_checkpoint, offset) in enumerate(parts):
+        if offset == byte_range[1]:
+            processes.append(None) # Finished in a previous run
+            continue
+        process = context.Process(target=_load_part, args=(part, byte_range, last_checkpoint, offset, messages), kwargs={
+            'csv_file': csv_file, 'selected_columns': selected_columns, 'schema': schema, 'table': table,
+            'checkpoint_file': part_checkpoint_file(checkpoint_file, part), **kwargs
+        })
+        process.start()
+        processes.append(process)
+
+    errors: list[str] = []
+    results: list[dict[str, Any]] = []
+    finished = {part for part, process in enumerate(processes) if process is None}
+    while len(finished) < len(processes):
+        try:
+            kind, part, value = messages.get(timeout=1)
+        except queue.Empty:
+            for part, process in enumerate(processes):
+                if part not in finished and process and not process.is_alive() and process.exitcode != 0:
+                    finished.add(part)
+                    errors.append(f"Part {part} exited with code {process.exitcode}")
+            continue
+        if kind == 'progress':
+            if on_progress:
+                on_progress(part, value)
+            continue
+        finished.add(part)
+        if kind == 'error':
+            errors.append(value)
+        else:
+            results.append(value)
+    for process in processes:
+        if process:
+            process.join()
+    return results, errors
@@ -1,17 +1,13 @@
-import traceback
-from typing import Any
-import pandas as pd
-import click
-import survey
-from dotenv import load_dotenv
 import os
+from typing import TYPE_CHECKING
+import click
 
-from db import get_all_schemas, get_all_tables, get_all_columns, get_db, truncate_table
-from utils.db import generate_query_string, generate_row
-from utils.cli import make_bold
-from utils.file import load_and_confirm_checkpoint, save_checkpoint
+from utils.cli import make_bold, parse_size
+from utils.file import load_and_confirm_checkpoint
 
-load_dotenv()
+# pandas, psycopg2 and survey take most of the startup time, they are imported where they are used
+if TYPE_CHECKING:
+    import pandas as pd
 
 def get_db_insert_meta(schema: str|None, table: str|None) -> tuple[str, str, list[tuple[str, str]]]:
     """
@@ -19,33 +15,38 @@ def get_db_insert_meta(schema: str|None, table: str|None) -> tuple[str, str, lis
 
     This function interacts with the user to select a schema and table from the database, and then fetches
     the columns of the selected table. It uses the `get_db` context manager to establish a database connection,
-    and the `survey.routines.select` method to prompt the user for selections.
+    and the `survey.routines.select` method to prompt the user for selections. When both the schema and the
+    table are given, they are resolved with a single catalog query, or from the catalog cache.
 
     Returns:
         tuple[str, str, str]: A tuple containing the selected schema name, table name, and a list of column names.
     """
+    import survey
+    from db import get_all_schemas, get_all_tables, get_db, get_table_columns
+    from utils.catalog import CatalogCache
+
     with get_db() as conn:
-        schemas = get_all_schemas(conn)
-        if not schema:
-            schema_index: int = survey.routines.select('Select schema: ', options=[schema[0] for schema in schemas])
-            schema = schemas[schema_index][0]
-        else:
-            if schema not in [_schemas[0] for _schemas in schemas]:
+        if not schema or not table:
+            schemas = get_all_schemas(conn)
+            if not schema:
+                schema_index: int = survey.routines.select('Select schema: ', options=[schema[0] for schema in schemas])
+                schema = schemas[schema_index][0]
+            elif schema not in [_schemas[0] for _schemas in schemas]:
                 raise Exception("Provided schema does not exist")
-        tables = get_all_tables(conn, schema)
-        if not table:    
-            table_index: int = survey.routines.select('Select table: ', options=[table[0] for table in tables])
-            table = tables[table_index][0]
-        else:
-            if table not in [_tables[0] for _tables in tables]:
-                raise Exception(f"Provided table does not exist in schema {schema}")
-        columns = get_all_columns(conn, schema, table)
+            if not table:
+                tables = get_all_tables(conn, schema)
+                table_index: int = survey.routines.select('Select table: ', options=[table[0] for table in tables])
+                table = tables[table_index][0]
+        columns = get_table_columns(conn, schema, table, CatalogCache())
     return schema, table, columns
 
 def handle_checkpoint(checkpoint_file: str, schema: str|None, table: str|None) -> tuple[str, str, list[tuple[str, str]], int, bool]:
     """
     Handles the checkpoint file to either load a previous state or initialize a new one.
 
+    Transactions a partitioned load left prepared are finished first, see `resolve_prepared`, so that
+    a load the user does not resume leaves no locks behind.
+
     Args:
         checkpoint_file (str): The path to the checkpoint file.
         schema (str): The schema name.
@@ -60,13 +61,22 @@ def handle_checkpoint(checkpoint_file: str, schema: str|None, table: str|None) -
             - bool: A flag indicating whether the checkpoint is valid and confirmed by the user.
     """
     
+    import survey
+    from loader import resolve_prepared
+
+    # Transactions a partitioned load left prepared hold their locks until they are finished, they
+    # are committed or rolled back to match the checkpoint whether the load is resumed or not
+    committed, rolled_back = resolve_prepared(checkpoint_file)
+    if committed or rolled_back:
+        print(f"Committed {committed} and rolled back {rolled_back} transactions the last run left prepared")
+
     saved_schema, saved_table, saved_columns, last_checkpoint, valid_checkpoint = load_and_confirm_checkpoint(checkpoint_file, schema, table)
     if valid_checkpoint and survey.routines.inquire(f"Continue with schema {make_bold(saved_schema)}, table {make_bold(saved_table)}, and columns selected?", default=True):
         return saved_schema, saved_table, saved_columns, last_checkpoint, True
     schema, table, columns = get_db_insert_meta(schema, table)
     return schema, table, columns, -1, False
 
-def validate_and_select_columns(df: pd.DataFrame, columns: list[tuple[str, str]]) -> list[tuple[str, str]]:
+def validate_and_select_columns(df: 'pd.DataFrame', columns: list[tuple[str, str]]) -> list[tuple[str, str]]:
         """
         Validates the schema, table, and columns, and allows the user to select/deselect columns to insert.
 
@@ -77,6 +87,8 @@ def validate_and_select_columns(df: pd.DataFrame, columns: list[tuple[str, str]]
         Returns:
             list[tuple[str, str]]: The list of selected columns to insert.
         """
+        import survey
+
         csv_columns = df.columns
         table_columns = [column[0] for column in columns]
         missing_columns = set(table_columns) - set(csv_columns)
@@ -96,7 +108,7 @@ def validate_and_select_columns(df: pd.DataFrame, columns: list[tuple[str, str]]
         selected_columns = [to_insert_columns[i] for i in selected_columns_index]
         return [column for column in columns if column[0] in selected_columns]
 
-def validate_csv_columns(df: pd.DataFrame, columns: list[tuple[str, str]]) -> bool:
+def validate_csv_columns(df: 'pd.DataFrame', columns: list[tuple[str, str]]) -> bool:
     """
     Check if the columns passed are all part of the CSV file. Returns True if columns is a subset of the CSV columns.
 
@@ -111,40 +123,348 @@ def validate_csv_columns(df: pd.DataFrame, columns: list[tuple[str, str]]) -> bo
     table_columns = [column[0] for column in columns]
     return set(table_columns).issubset(set(csv_columns))
 
+def print_load_result(skipped: int, batch_sizes: dict, error_file: str, duplicates: int = 0):
+    """
+    Prints the rows skipped and, for adaptive loads, the batch sizes chosen.
+
+    Args:
+        skipped (int): The number of rows skipped because they failed.
+        batch_sizes (dict): The `BatchSizer.summary` of the load.
+        error_file (str): The error log file path.
+        duplicates (int): The number of rows not sent because they were already in the table.
+    """
+    if batch_sizes.get('adaptive') and batch_sizes.get('mean') is not None:
+        print(f"\nBatch size: {batch_sizes['min']}-{batch_sizes['max']} rows, {batch_sizes['mean']:.0f} on average, ending at {batch_sizes['last']}")
+    if duplicates:
+        print(f"\nDropped {duplicates} rows already in the table")
+    if skipped:
+        print(f"\nSkipped {skipped} rows that failed to insert, see {error_file}")
+
+def load_many(manifest: str|None, pattern: str|None, schema: str|None, table: str|None, table_from_filename: bool, state_file: str|None,
+              skip_verification: bool, clear_table: bool, workers: int, stats_json: str|None, load_options: dict) -> int|None:
+    """
+    Loads the files of a manifest or a glob pattern, reusing a pool of `workers` connections.
+
+    Args:
+        manifest (str|None): The manifest path, see `scheduler.read_manifest`.
+        pattern (str|None): The file glob pattern, when there is no manifest.
+        schema (str|None): The schema of files that have none in the manifest.
+        table (str|None): The table of files that have none in the manifest.
+        table_from_filename (bool): Load each file into the table named after it.
+        state_file (str|None): The run state file path.
+        skip_verification (bool): Skip the confirmation to begin.
+        clear_table (bool): Truncate the target tables before a fresh run.
+        workers (int): The number of files loaded at a time.
+        stats_json (str|None): The JSON file the run statistics are written to.
+        load_options (dict): Passed on to `load_rows`.
+
+    Returns:
+        int|None: 1 if a file failed to load.
+    """
+    import datetime
+    import time
+    import survey
+    from scheduler import load_files, plan_loads, read_manifest
+    from utils.file import RunState
+    from utils.stats import merge_stats, write_stats_json
+
+    try:
+        entries = read_manifest(manifest) if manifest else [{'file': pattern}]
+        loads = plan_loads(entries, schema, table, table_from_filename)
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    state_file = state_file or f"{os.path.splitext(manifest)[0] if manifest else 'csv2pg'}_state.json"
+    state = RunState(state_file)
+    done = sum(1 for load in loads if state.get(load['file']).get('status') == 'done')
+    print(f"{len(loads)} files, {sum(load['size'] for load in loads) / 1024 ** 2:.1f} MB, {done} already loaded according to {state_file}")
+    if not skip_verification and not survey.routines.inquire(f'Load them with {workers} connections? ', default=False):
+        print('Exiting...')
+        return 1
+
+    def on_done(result: dict):
+        if result['status'] == 'done':
+            print(f"Loaded {result['rows']} rows from {result['file']} into {result['schema']}.{result['table']} in {result['elapsed']:.1f}s"
+                  + (f", skipped {result['skipped']}" if result['skipped'] else ''))
+        else:
+            print(f"\n{result['error']}")
+
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    started = time.perf_counter()
+    results = load_files(loads, state, workers, clear_table, on_done=on_done, **load_options)
+    failed = [result for result in results if result['status'] == 'failed']
+    print(f"{len(results) - len(failed)} files loaded, {len(failed)} failed, run state in {state_file}")
+    if stats_json:
+        elapsed = time.perf_counter() - started
+        stats = merge_stats([result['stats'] for result in results if 'stats' in result])
+        write_stats_json(stats_json, {
+            'status': 'failed' if failed else 'ok',
+            'errors': [result['error'] for result in failed],
+            'manifest': manifest,
+            'state_file': state_file,
+            'engine': load_options['engine'],
+            'workers': workers,
+            'started_at': started_at.isoformat(),
+            'elapsed': elapsed,
+            'rows': stats['counters'].get('rows', 0),
+            'skipped': stats['counters'].get('skipped', 0),
+            'rows_per_sec': stats['counters'].get('rows', 0) / elapsed if elapsed else None,
+            'mb_per_sec': stats['counters'].get('input_bytes', 0) / 1024 ** 2 / elapsed if elapsed else None,
+            'stages': stats['stages'],
+            'counters': stats['counters'],
+            'files': [{key: result.get(key) for key in ('file', 'schema', 'table', 'size', 'status', 'rows', 'skipped', 'elapsed')} for result in results]
+        })
+    return 1 if failed else None
+
+def submit_to_daemon(address: str, csv_file: str, schema: str, table: str, stats_json: str|None, load_options: dict) -> int|None:
+    """
+    Loads a file through a running load daemon, see `serve.py`, and waits for it to finish.
+
+    The daemon loads the columns of the file header that are in the table, through the parent
+    table of a partitioned table.
+
+    Args:
+        address (str): The socket path of the daemon.
+        csv_file (str): The file to load.
+        schema (str): The schema name.
+        table (str): The table name.
+        stats_json (str|None): The JSON file the job is written to.
+        load_options (dict): Passed on to `load_rows` by the daemon.
+
+    Returns:
+        int|None: 1 if the file failed to load.
+    """
+    from utils.client import submit_job, wait_for_job
+    from utils.stats import write_stats_json
+
+    try:
+        job = submit_job(address, {'file': os.path.abspath(csv_file), 'schema': schema, 'table': table, 'options': load_options})
+        print(f"Submitted job {job['id']} to the load daemon on {address}")
+        job = wait_for_job(address, job['id'])
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    if job['status'] == 'done' and job.get('already_loaded'):
+        print(f"{csv_file} was already loaded by the daemon")
+    elif job['status'] == 'done':
+        print(f"Loaded {job['rows']} rows from {csv_file} into {make_bold(schema)}.{make_bold(table)} in {job['elapsed']:.1f}s"
+              + (f", skipped {job['skipped']}" if job['skipped'] else ''))
+    else:
+        print(f"\n{job['error']}")
+    if stats_json:
+        write_stats_json(stats_json, job)
+    return 1 if job['status'] == 'failed' else None
+
+def validate(csv_file: str, schema: str, table: str, selected_columns: list[tuple[str, str]], chunk_rows: int, stats_json: str|None) -> int|None:
+    """
+    Checks the rows of a CSV file against the columns of a table and prints the failures per column.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        schema (str): The schema name.
+        table (str): The table name.
+        selected_columns (list[tuple[str, str]]): The columns loaded from the file.
+        chunk_rows (int): The number of CSV rows read into memory at a time.
+        stats_json (str|None): The JSON file the report is written to.
+
+    Returns:
+        int|None: 1 if a row or a column fails.
+    """
+    import time
+    import survey
+    from db import get_column_details, get_db
+    from utils.stats import write_stats_json
+    from utils.validate import format_validation, validate_file
+
+    with get_db() as conn:
+        columns = get_column_details(conn, schema, table)
+    started = time.perf_counter()
+    progress = survey.graphics.MultiLineProgressControl(max(os.path.getsize(csv_file), 1), color = survey.colors.basic('blue' ), denominate = lambda value: (1024 ** 2, 'MB'))
+    with survey.graphics.MultiLineProgress([progress], prefix = 'Validating '):
+        report = validate_file(csv_file, columns, [column for column, _ in selected_columns], chunk_rows, on_progress=progress.move)
+    elapsed = time.perf_counter() - started
+    failed = report['failed_checks'] or report['missing_columns']
+    print(f"\n{format_validation(report)}\nValidated {csv_file} against {make_bold(schema)}.{make_bold(table)} in {elapsed:.1f}s")
+    if stats_json:
+        write_stats_json(stats_json, {'status': 'failed' if failed else 'ok', 'file': csv_file, 'schema': schema, 'table': table,
+                                      'elapsed': elapsed, 'validation': report})
+    return 1 if failed else None
+
 @click.command()
-@click.option('-f', '--file', 'csv_file', type=str, help='CSV file path', required=True)
+@click.option('-f', '--file', 'csv_file', type=str, help='CSV, NDJSON, Parquet or Arrow file path, or a glob pattern such as "exports/*.csv" to load many files')
+@click.option('--manifest', 'manifest', type=str, default=None, help='JSON or YAML manifest of the files to load and their tables')
+@click.option('--table-from-filename', 'table_from_filename', is_flag=True, help='Load each file of a pattern or manifest into the table named after it')
+@click.option('--state-file', 'state_file', type=str, default=None, help='Run state file of a multi-file load, defaults to <manifest>_state.json or csv2pg_state.json')
 @click.option('--yes', 'skip_verification', is_flag=True, help='Skip confirmation to begin insert')
 @click.option('--schema', 'schema', type=str, help='Schema name')
 @click.option('--table', 'table', type=str, help='Table name')
 @click.option('--clear-table', 'clear_table', is_flag=True, help='Clear the table before inserting data')
 @click.option('--checkpoint-file', 'checkpoint_file', type=str, default=None, help='Checkpoint file path')
 @click.option('--error-file', 'error_file', type=str, default=None, help='Error log file path')
-def main(csv_file: str, skip_verification: bool, clear_table: bool, checkpoint_file: str|None, error_file: str|None, schema: str|None, table: str|None):
-    checkpoint_file = checkpoint_file or f"{os.path.splitext(csv_file)[0]}_checkpoint.txt"
-    error_file = error_file or f"{os.path.splitext(csv_file)[0]}_errors.csv"
+@click.option('--engine', 'engine', type=click.Choice(['copy', 'insert', 'prepared']), default='copy', show_default=True, help='Load rows with COPY FROM STDIN, multi-row INSERT statements, or prepared INSERTs in pipeline mode (needs psycopg 3)')
+@click.option('--in-flight', 'in_flight', type=click.IntRange(min=1), default=8, show_default=True, help='Batches the prepared engine sends before waiting for their results')
+@click.option('--chunk-rows', 'chunk_rows', type=int, default=100000, show_default=True, help='Number of CSV rows read into memory at a time')
+@click.option('--max-memory', 'max_memory', type=str, default=None, help='Memory budget for a chunk, e.g. 512MB (overrides --chunk-rows)')
+@click.option('--workers', 'workers', type=click.IntRange(min=1), default=1, show_default=True, help='Number of processes loading byte ranges of the file in parallel, or of files loaded at a time over as many connections with a pattern or manifest; with --fast-load the rows are loaded over one connection, and this only sets the parallel workers of each index build (max_parallel_maintenance_workers)')
+@click.option('--checkpoint-interval', 'checkpoint_interval', type=float, default=5.0, show_default=True, help='Seconds between commits and checkpoints')
+@click.option('--checkpoint-rows', 'checkpoint_rows', type=click.IntRange(min=1), default=None, help='Rows between commits and checkpoints, whichever of this and --checkpoint-interval comes first')
+@click.option('--batch-size', 'batch_size', type=click.IntRange(min=1), envvar='BATCH_SIZE', default=1000, show_default=True, help='Rows per batch, or the first batch size with --adaptive-batch')
+@click.option('--adaptive-batch', 'adaptive_batch', is_flag=True, help='Grow or shrink batches to keep sending one near --target-latency')
+@click.option('--target-latency', 'target_latency', type=float, default=0.5, show_default=True, help='Seconds sending one batch should take with --adaptive-batch')
+@click.option('--max-batch-bytes', 'max_batch_bytes', type=str, default='64MB', show_default=True, help='Largest encoded batch with --adaptive-batch, e.g. 16MB')
+@click.option('--pipeline', 'pipeline', is_flag=True, help='Read, encode and send rows in separate threads, so parsing overlaps waiting on the database')
+@click.option('--stats-interval', 'stats_interval', type=float, default=None, help='Write a stats line to stderr every this many seconds, and a summary at the end')
+@click.option('--stats-json', 'stats_json', type=str, default=None, help='Write the run statistics to this JSON file at the end of the run')
+@click.option('--profile', 'profile', is_flag=True, help='Profile the load with cProfile, written next to the checkpoint file')
+@click.option('--fast-load', 'fast_load', type=click.Choice(['staging', 'rebuild']), default=None, help='With --clear-table, reload the table in one transaction through an unlogged staging table or straight into it, dropping and rebuilding its indexes and keys around the load')
+@click.option('--conflict-key', 'conflict_key', type=str, default=None, help='Comma separated columns of a unique key of the table, rows whose key is already in the table are dropped before sending and the others inserted with ON CONFLICT')
+@click.option('--on-conflict', 'on_conflict', type=click.Choice(['skip', 'update']), default='skip', show_default=True, help='With --conflict-key, keep the rows already in the table, or update them with the rows of the file that differ')
+@click.option('--key-index', 'key_index', type=click.Choice(['hash', 'bloom']), default='hash', show_default=True, help='With --conflict-key, keep a hash of every existing row in memory, or a Bloom filter for tables too large for it')
+@click.option('--bloom-error-rate', 'bloom_error_rate', type=click.FloatRange(min=0, max=1, min_open=True, max_open=True), default=1e-6, show_default=True, help='False positive rate of --key-index bloom, the fraction of new or changed rows that may be dropped as existing')
+@click.option('--validate-only', 'validate_only', is_flag=True, help='Check every row against the column types and NOT NULL constraints of the table and report the failures, without loading anything')
+@click.option('--partition-routing/--no-partition-routing', 'partition_routing', default=True, show_default=True, help='Send the rows of a range or list partitioned table straight to its partitions, over --workers connections committed together with two-phase commit, which needs max_prepared_transactions on the server')
+@click.option('--daemon', 'use_daemon', is_flag=True, help='Hand a single file loaded with --schema, --table and --yes to the load daemon started with serve.py, and wait for it; the daemon loads a partitioned table through its parent table')
+@click.option('--daemon-socket', 'daemon_socket', type=str, envvar='CSV2PG_SOCKET', default=None, help='Socket of the load daemon used with --daemon, defaults to $CSV2PG_SOCKET or daemon.sock in the catalog cache directory')
+@click.option('--on-error', 'on_error', type=click.Choice(['abort', 'skip']), default='abort', show_default=True, help='Stop at the first failing batch, or write failing rows to the error file and keep going')
+def main(csv_file: str|None, manifest: str|None, table_from_filename: bool, state_file: str|None, skip_verification: bool, clear_table: bool, checkpoint_file: str|None, error_file: str|None, schema: str|None, table: str|None, engine: str, chunk_rows: int, max_memory: str|None, workers: int,
+         in_flight: int, checkpoint_interval: float, checkpoint_rows: int|None, batch_size: int, adaptive_batch: bool, target_latency: float, max_batch_bytes: str, pipeline: bool,
+         stats_interval: float|None, stats_json: str|None, profile: bool, fast_load: str|None, conflict_key: str|None, on_conflict: str, key_index: str,
+         bloom_error_rate: float, validate_only: bool, partition_routing: bool, use_daemon: bool, daemon_socket: str|None, on_error: str):
+    import cProfile
+    import datetime
+    import glob
+    import time
+    import traceback
+
+    # -- With --daemon, a single file is handed to a running daemon, before paying for the imports and the connection
+    if use_daemon:
+        from utils.client import daemon_running, default_socket
+        from utils.compression import strip_compression_extension
+        address = daemon_socket or default_socket()
+        if not (csv_file and schema and table and skip_verification) or manifest or glob.has_magic(csv_file):
+            print("Error: --daemon loads a single file given with -f, --schema, --table and --yes")
+            return 1
+        unsupported = [option for option, used in (
+            ('--workers', workers > 1), ('--clear-table', clear_table), ('--checkpoint-file', checkpoint_file), ('--error-file', error_file),
+            ('--max-memory', max_memory), ('--fast-load', fast_load), ('--conflict-key', conflict_key), ('--validate-only', validate_only),
+            ('--profile', profile), ('--stats-interval', stats_interval)) if used]
+        if unsupported:
+            print(f"Error: The load daemon cannot run a load with {', '.join(unsupported)}, run it without --daemon")
+            return 1
+        # A checkpoint of a load started in a process is resumed in a process
+        local_checkpoint = f"{os.path.splitext(strip_compression_extension(csv_file))[0]}_checkpoint.txt"
+        if os.path.exists(local_checkpoint):
+            print(f"Error: Checkpoint file {local_checkpoint} is resumed by a load in this process, run it without --daemon")
+            return 1
+        if not daemon_running(address):
+            print(f"Error: No load daemon answers on {address}, start one with serve.py")
+            return 1
+        try:
+            batch_bytes = parse_size(max_batch_bytes)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return 1
+        return submit_to_daemon(address, csv_file, schema, table, stats_json, {
+            'engine': engine, 'chunk_rows': chunk_rows, 'batch_size': batch_size, 'adaptive_batch': adaptive_batch,
+            'target_latency': target_latency, 'max_batch_bytes': batch_bytes, 'pipeline': pipeline, 'in_flight': in_flight, 'on_error': on_error,
+            'checkpoint_interval': checkpoint_interval, 'checkpoint_rows': checkpoint_rows
+        })
+
+    import survey
+    from dotenv import load_dotenv
+    from db import connect, get_db, get_max_prepared_transactions, get_partitioning, truncate_table
+    from loader import fast_load as run_fast_load, load_partitions, load_parts, load_rows, preload_key_filter
+    from utils.batch import merge_summaries
+    from utils.compression import detect_compression, strip_compression_extension
+    from utils.file import file_fingerprint, load_part_checkpoints, part_checkpoint_file, read_checkpoint, remove_part_checkpoints, save_checkpoint
+    from utils.partitions import create_partition_router
+    from utils.reader import COLUMNAR_FORMATS, detect_format, estimate_chunk_rows, read_header, split_byte_ranges
+    from utils.stats import RunStats, format_stats, merge_stats, write_stats_json
+
+    load_dotenv()
+
+    # -- Many files are loaded by one process, over a pool of connections
+    if manifest or (csv_file and glob.has_magic(csv_file)):
+        if fast_load or conflict_key or validate_only:
+            print(f"Error: {'--fast-load' if fast_load else '--conflict-key' if conflict_key else '--validate-only'} loads a single file")
+            return 1
+        try:
+            batch_bytes = parse_size(max_batch_bytes)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return 1
+        return load_many(manifest, csv_file, schema, table, table_from_filename, state_file, skip_verification, clear_table, workers, stats_json, {
+            'engine': engine, 'chunk_rows': chunk_rows, 'batch_size': batch_size, 'adaptive_batch': adaptive_batch,
+            'target_latency': target_latency, 'max_batch_bytes': batch_bytes, 'pipeline': pipeline, 'in_flight': in_flight, 'checkpoint_interval': checkpoint_interval,
+            'checkpoint_rows': checkpoint_rows, 'on_error': on_error
+        })
+    if not csv_file:
+        print("Error: Pass a CSV file with -f or a manifest with --manifest")
+        return 1
+    # -- A compressed file is named like the CSV file it contains, orders.csv.gz like orders.csv
+    compression = detect_compression(csv_file) if os.path.exists(csv_file) else None
+    file_format = detect_format(csv_file)
+    file_base = os.path.splitext(strip_compression_extension(csv_file))[0]
+    checkpoint_file = checkpoint_file or f"{file_base}_checkpoint.txt"
+    error_file = error_file or f"{file_base}_errors.csv"
 
     # Step 1: Get the schema, table, and columns to insert
-    schema, table, columns, last_checkpoint, is_checkpoint = handle_checkpoint(checkpoint_file, schema, table)
+    try:
+        schema, table, columns, last_checkpoint, is_checkpoint = handle_checkpoint(checkpoint_file, schema, table)
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
     if is_checkpoint and clear_table:
         print(f"Error: Cannot clear table when using a checkpoint file")
         return 1
+    if fast_load and not clear_table:
+        print("Error: --fast-load replaces every row of the table, pass --clear-table")
+        return 1
+    if fast_load and conflict_key:
+        print("Error: --fast-load replaces every row of the table, there are no conflicts for --conflict-key")
+        return 1
 
-    # Step 2: Read the CSV file
+    # Step 2: Read the CSV header, or the schema of another format, the rows are streamed in chunks later
     try:
-        df: pd.DataFrame = pd.read_csv(csv_file) # type: ignore
+        header = read_header(csv_file)
+        fingerprint = file_fingerprint(csv_file)
+        if max_memory:
+            chunk_rows = estimate_chunk_rows(csv_file, parse_size(max_memory))
+        batch_bytes = parse_size(max_batch_bytes)
     except FileNotFoundError:
         print(f"Error: File {csv_file} not found")
         return 1
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+
+    # -- Resume from the byte offset of the checkpoint, as long as the file did not change
+    offset = None
+    if is_checkpoint:
+        checkpoint_data = read_checkpoint(checkpoint_file)
+        if checkpoint_data.get('fingerprint', fingerprint) != fingerprint:
+            print(f"Error: File {csv_file} changed since checkpoint file {checkpoint_file} was written")
+            return 1
+        offset = checkpoint_data.get('offset')
 
     # Step 3 and Step 4: Validate the schema, table, and columns, and select/deselect columns to insert
     if is_checkpoint:
-        if not validate_csv_columns(df, columns):
+        if not validate_csv_columns(header, columns):
             print("Error: Columns in the CSV file do not match the columns in the table")
             return 1
         selected_columns = columns
     else:
-        selected_columns = validate_and_select_columns(df, columns)
+        selected_columns = validate_and_select_columns(header, columns)
+    key_columns = [column.strip() for column in conflict_key.split(',')] if conflict_key else []
+    missing_keys = set(key_columns) - {column for column, _ in selected_columns}
+    if missing_keys:
+        print(f"Error: Conflict key columns {', '.join(sorted(missing_keys))} are not selected")
+        return 1
     
+    # -- Check the rows without loading them, only the catalog is read
+    if validate_only:
+        return validate(csv_file, schema, table, selected_columns, chunk_rows, stats_json)
+
     # -- Confirm the columns to insert
     if not skip_verification and not is_checkpoint and not survey.routines.inquire(f'Do you want to continue w/ table {make_bold(table)} in schema {make_bold(schema)}? ', default=False):
         print('Exiting...')
@@ -152,48 +472,159 @@ def main(csv_file: str, skip_verification: bool, clear_table: bool, checkpoint_f
     
     # Step 5: Insert data into the table
     # -- Truncate the table if the flag is set
-    if clear_table:
+    # -- A fast load truncates the table in its own transaction
+    if clear_table and not fast_load:
         print(f"Truncating table {make_bold(table)} in schema {make_bold(schema)}")
         with get_db() as conn:
             truncate_table(conn, schema, table)
-    
-    # -- Ensure the data is in the correct order and handle missing values
-    df: pd.DataFrame = df.where(pd.notnull(df), None)
-    # -- Replace NaN values with 'NULL' for the SQL query
-    df: pd.DataFrame = df.fillna('NULL')
 
-    progress = survey.graphics.MultiLineProgressControl(df.shape[0], value=last_checkpoint + 1, color = survey.colors.basic('blue' ))
-    with survey.graphics.MultiLineProgress([progress], prefix = 'Inserting '):
-        with get_db() as conn:
-            cursor = conn.cursor()
-            batch_size = os.environ.get('BATCH_SIZE', 1000)
-            batch: list[list[Any]] = []
-            for index, row in df.iterrows():
-                if index <= last_checkpoint:
-                    continue  # Skip rows up to the last checkpoint
-                
-                try:
-                    row = generate_row(row, selected_columns)
-                    if not row:
-                        print(f"Skipping row {index}: No data to insert")
-                        continue
-                    batch.append(row)
-                    if len(batch) < batch_size and index < df.shape[0] - 1:
-                        continue
-                    query = generate_query_string(batch, selected_columns, table, schema)
-                    cursor.execute(query)
-                    progress.move(len(batch))
-                    conn.commit()
-                    save_checkpoint(checkpoint_file, index, schema, table, selected_columns)
-                    batch = []
-                except Exception as e:
-                    traceback.print_exc()
-                    print(f"\nError inserting row {index}: {e}")
-                    break
-
-            conn.commit()
-            cursor.close()
-            save_checkpoint(checkpoint_file, index, schema, table, selected_columns)
+    load_options = {
+        'engine': engine, 'chunk_rows': chunk_rows, 'batch_size': batch_size, 'adaptive_batch': adaptive_batch,
+        'target_latency': target_latency, 'max_batch_bytes': batch_bytes, 'pipeline': pipeline, 'in_flight': in_flight, 'fingerprint': fingerprint,
+        'checkpoint_interval': checkpoint_interval, 'checkpoint_rows': checkpoint_rows, 'on_error': on_error, 'error_file': error_file
+    }
+
+    # -- A parallel load is resumed with the byte ranges it was started with
+    parts = load_part_checkpoints(checkpoint_file) if is_checkpoint else []
+    if not parts:
+        remove_part_checkpoints(checkpoint_file)
+    if parts and key_columns:
+        print("Error: A parallel load cannot be resumed with --conflict-key")
+        return 1
+    # -- Rows of a partitioned table are routed on the client and sent to its partitions
+    router = None
+    if partition_routing and not fast_load and not key_columns and not parts:
+        try:
+            with get_db() as conn:
+                partitioning = get_partitioning(conn, schema, table)
+                prepared_limit = get_max_prepared_transactions(conn)
+            router = create_partition_router(partitioning, selected_columns) if partitioning else None
+            # The connections commit together with two-phase commit, one prepared transaction each
+            if router and not prepared_limit:
+                raise ValueError("routing rows commits the partitions with prepared transactions, which are disabled by max_prepared_transactions = 0")
+            if router and (adaptive_batch or engine == 'prepared'):
+                raise ValueError("routing rows sends batches of --batch-size rows and cannot honour --adaptive-batch" if adaptive_batch else
+                                 "routing rows does not send in pipeline mode and cannot honour --in-flight of --engine prepared")
+        except ValueError as e:
+            router = None
+            print(f"Loading through partitioned table {make_bold(table)}, {e}")
+    if router:
+        workers = min(workers, prepared_limit)
+        print(f"Routing rows to {len(router.partitions)} partitions of table {make_bold(table)} over {min(workers, len(router.partitions) + 1)} connections")
+    elif fast_load:
+        if workers > 1:
+            print(f"Loading over a single connection, --workers only sets {workers} parallel workers for each index build")
+    elif not parts and workers > 1 and file_format in COLUMNAR_FORMATS:
+        print(f"Loading {file_format.capitalize()} file {csv_file} with a single worker, its record batches are read in order")
+    elif not parts and workers > 1 and compression:
+        print(f"Loading {compression} compressed file {csv_file} with a single worker, it can only be read from the start")
+    elif not parts and workers > 1 and key_columns:
+        print("Loading with a single worker, rows with the same key would make concurrent upserts wait on each other")
+    elif not parts and workers > 1:
+        save_checkpoint(checkpoint_file, -1, schema, table, selected_columns, fingerprint=fingerprint)
+        parts = [(byte_range, -1, byte_range[0]) for byte_range in split_byte_ranges(csv_file, workers)]
+        for part, (byte_range, _, start) in enumerate(parts):
+            save_checkpoint(part_checkpoint_file(checkpoint_file, part), -1, schema, table, selected_columns, byte_range, start, fingerprint)
+
+    # -- Rows already in the table are found from a client-side index of their hashes
+    run_stats = RunStats(stats_interval)
+    key_filter = None
+    if key_columns:
+        print(f"Reading the rows of table {make_bold(table)} already loaded")
+        try:
+            with get_db() as conn:
+                key_filter = preload_key_filter(conn, schema, table, selected_columns, key_columns, on_conflict, key_index, bloom_error_rate, run_stats)
+        except Exception as e:
+            print(f"Error: {e}")
+            return 1
+        print(f"Indexed {len(key_filter.index)} rows in {key_filter.index.nbytes / 1024 ** 2:.1f} MB")
+
+    profile_file = f"{os.path.splitext(checkpoint_file)[0]}_profile.prof" if profile else None
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    started = time.perf_counter()
+    errors: list[str] = []
+    try:
+        if parts:
+            controls = [
+                survey.graphics.MultiLineProgressControl(max(end - start, 1), value=(part_offset or start) - start, color = survey.colors.basic('blue' ), denominate = lambda value: (1024 ** 2, 'MB'))
+                for (start, end), _, part_offset in parts
+            ]
+            with survey.graphics.MultiLineProgress(controls, prefix = f'Inserting ({len(parts)} workers) '):
+                results, errors = load_parts(csv_file, selected_columns, schema, table, checkpoint_file, parts,
+                                             on_progress=lambda part, size: controls[part].move(size), stats_interval=stats_interval,
+                                             profile_file=profile_file, **load_options)
+            stats = merge_stats([result['stats'] for result in results])
+            batch_sizes = merge_summaries([result['batch_size'] for result in results])
+        else:
+            file_size = os.path.getsize(csv_file)
+            batch_sizes = {}
+            partition_rows = None
+            # The rows of a compressed file before the offset are decompressed again, and counted in the progress,
+            # the offset of a Parquet or Arrow file is a row count and the progress is estimated from the batches read
+            progress = survey.graphics.MultiLineProgressControl(max(file_size, 1), value=0 if compression or file_format in COLUMNAR_FORMATS else offset or 0, color = survey.colors.basic('blue' ), denominate = lambda value: (1024 ** 2, 'MB'))
+            with survey.graphics.MultiLineProgress([progress], prefix = 'Inserting '):
+                with connect(engine) as conn:
+                    try:
+                        if router:
+                            result = load_partitions(csv_file, selected_columns, schema, table, checkpoint_file, router, workers, last_checkpoint, offset,
+                                                     engine=engine, chunk_rows=chunk_rows, batch_size=batch_size, fingerprint=fingerprint,
+                                                     checkpoint_interval=checkpoint_interval, checkpoint_rows=checkpoint_rows, on_error=on_error,
+                                                     error_file=error_file, pipeline=pipeline, stats=run_stats, on_progress=progress.move)
+                        elif fast_load:
+                            result = run_fast_load(conn, fast_load, csv_file, selected_columns, schema, table, checkpoint_file,
+                                                   workers if workers > 1 else None, stats=run_stats, on_progress=progress.move, **load_options)
+                        else:
+                            result = load_rows(conn, csv_file, selected_columns, schema, table, checkpoint_file, last_checkpoint, offset,
+                                               key_filter=key_filter, stats=run_stats, on_progress=progress.move, **load_options)
+                        batch_sizes = result.get('batch_size', {})
+                        partition_rows = result.get('partitions')
+                    except Exception as e:
+                        traceback.print_exc()
+                        errors.append(str(e))
+            stats = run_stats.to_dict()
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+
+    for error in errors:
+        print(f"\n{error}")
+    skipped = stats['counters'].get('skipped', 0)
+    print_load_result(skipped, batch_sizes, error_file, stats['counters'].get('duplicates', 0))
+    if stats_interval:
+        print(format_stats(stats))
+    if stats_json:
+        elapsed = time.perf_counter() - started
+        write_stats_json(stats_json, {
+            'status': 'failed' if errors else 'ok',
+            'errors': errors,
+            'file': csv_file,
+            'compression': compression,
+            'format': file_format,
+            'schema': schema,
+            'table': table,
+            'engine': engine,
+            'fast_load': fast_load,
+            'conflict_key': key_columns or None,
+            'on_conflict': on_conflict if key_columns else None,
+            'workers': len(parts) or (min(workers, len(router.partitions) + 1) if router else 1),
+            'partitions': partition_rows if router else None,
+            'started_at': started_at.isoformat(),
+            'elapsed': elapsed,
+            'rows': stats['counters'].get('rows', 0),
+            'skipped': skipped,
+            'duplicates': stats['counters'].get('duplicates', 0),
+            'rows_per_sec': stats['counters'].get('rows', 0) / elapsed if elapsed else None,
+            'mb_per_sec': stats['counters'].get('input_bytes', 0) / 1024 ** 2 / elapsed if elapsed else None,
+            'batch_size': batch_sizes,
+            'stages': stats['stages'],
+            'counters': stats['counters'],
+            'profile_file': profile_file
+        })
+    return 1 if errors else None
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,102 @@
+import os
+import click
+
+from main import get_db_insert_meta
+from utils.cli import make_bold
+
+
+@click.command()
+@click.option('-o', '--output', 'output_file', type=str, required=True, help='CSV file to write, compressed when it ends with .gz, .bz2, .xz or .zst')
+@click.option('--schema', 'schema', type=str, help='Schema name')
+@click.option('--table', 'table', type=str, help='Table name')
+@click.option('--columns', 'columns', type=str, default=None, help='Comma separated columns to export, in this order, defaults to every column of the table')
+@click.option('--workers', 'workers', type=click.IntRange(min=1), default=1, show_default=True, help='Number of connections exporting ranges of the table in parallel, all seeing the same snapshot')
+@click.option('--split', 'split', type=click.Choice(['auto', 'ctid', 'key', 'none']), default='auto', show_default=True, help='Split the table into ranges of heap blocks, of its integer primary key, or export it in one range; auto uses ctid for tables on PostgreSQL 14 and later, else the key if there is one')
+@click.option('--state-file', 'state_file', type=str, default=None, help='File the ranges and the finished ones are kept in to resume an export, defaults to <output>_export_state.json')
+@click.option('--yes', 'skip_verification', is_flag=True, help='Skip confirmation to overwrite an existing output file')
+@click.option('--stats-interval', 'stats_interval', type=float, default=None, help='Write a stats line to stderr every this many seconds, and a summary at the end')
+@click.option('--stats-json', 'stats_json', type=str, default=None, help='Write the run statistics to this JSON file at the end of the run')
+def main(output_file: str, schema: str|None, table: str|None, columns: str|None, workers: int, split: str, state_file: str|None, skip_verification: bool,
+         stats_interval: float|None, stats_json: str|None):
+    import datetime
+    import time
+    import traceback
+    import survey
+    from db import estimate_rows, get_db
+    from exporter import export_table
+    from utils.compression import EXTENSIONS, strip_compression_extension
+    from utils.file import RunState
+    from utils.stats import RunStats, format_stats, write_stats_json
+
+    compression = EXTENSIONS.get(os.path.splitext(output_file)[1].lower())
+    state_file = state_file or f"{os.path.splitext(strip_compression_extension(output_file))[0]}_export_state.json"
+    try:
+        schema, table, table_columns = get_db_insert_meta(schema, table)
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    selected_columns = table_columns
+    if columns:
+        names = [name.strip() for name in columns.split(',') if name.strip()]
+        types = dict(table_columns)
+        unknown = [name for name in names if name not in types]
+        if unknown:
+            print(f"Error: Columns {', '.join(unknown)} are not in table {schema}.{table}")
+            return 1
+        selected_columns = [(name, types[name]) for name in names]
+
+    if os.path.exists(state_file):
+        if RunState(state_file).get(output_file).get('split') == 'ctid':
+            print(f"Starting the export in {state_file} over, ranges of heap blocks are not resumed under a new snapshot")
+        else:
+            print(f"Resuming the export in {state_file}, the ranges left are exported under a new snapshot")
+    elif os.path.exists(output_file) and not skip_verification and not survey.routines.inquire(f'Overwrite {output_file}? ', default=False):
+        return 1
+    with get_db() as conn:
+        total_rows = estimate_rows(conn, schema, table)
+
+    run_stats = RunStats(interval=stats_interval)
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    started = time.perf_counter()
+    result = None
+    progress = survey.graphics.MultiLineProgressControl(max(total_rows, 1), color = survey.colors.basic('blue' ), denominate = lambda value: (1000, 'K rows'))
+    try:
+        with survey.graphics.MultiLineProgress([progress], prefix = f'Exporting ({workers} workers) ' if workers > 1 else 'Exporting '):
+            result = export_table(output_file, schema, table, selected_columns, workers, split, compression, state_file, run_stats, on_progress=progress.move)
+    except Exception as e:
+        traceback.print_exc()
+        print(f"\nError: {e}")
+        print(f"Rerun the same command to resume, the finished ranges are kept in {state_file}")
+    elapsed = time.perf_counter() - started
+    stats = run_stats.to_dict()
+
+    if result:
+        print(f"\nExported {result['rows']} rows of {make_bold(schema)}.{make_bold(table)} to {output_file} in {elapsed:.1f}s"
+              f", {result['ranges']} ranges" + (f", {result['resumed']} from an earlier run" if result['resumed'] else ''))
+    if stats_interval:
+        print(format_stats(stats))
+    if stats_json:
+        write_stats_json(stats_json, {
+            'status': 'done' if result else 'failed',
+            'file': output_file,
+            'compression': compression,
+            'schema': schema,
+            'table': table,
+            'columns': [column for column, _ in selected_columns],
+            'workers': workers,
+            'split': result['split'] if result else None,
+            'ranges': result['ranges'] if result else None,
+            'resumed': result['resumed'] if result else None,
+            'snapshot': result['snapshot'] if result else None,
+            'started_at': started_at.isoformat(),
+            'elapsed': elapsed,
+            'rows': result['rows'] if result else stats['counters'].get('rows', 0),
+            'rows_per_sec': stats['counters'].get('rows', 0) / elapsed if elapsed else None,
+            'mb_per_sec': stats['counters'].get('output_bytes', 0) / 1024 ** 2 / elapsed if elapsed else None,
+            'stages': stats['stages'],
+            'counters': stats['counters']
+        })
+    return None if result else 1
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import glob
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from db import connect, get_pool, get_table_columns, pooled_connection, truncate_table
+from loader import load_rows
+from utils.catalog import CatalogCache
+from utils.compression import strip_compression_extension
+from utils.file import RunState, RunStateCheckpointer, file_fingerprint
+from utils.reader import read_header
+
+
+def read_manifest(manifest_file: str) -> list[dict[str, Any]]:
+    """
+    Reads the files to load from a JSON or YAML manifest.
+
+    The manifest is a list of entries, or a mapping with a default `schema` and the list under
+    `files`. Each entry has a `file`, which may be a glob, and optionally a `schema` and `table`:
+
+        schema: public
+        files:
+          - file: exports/customers.csv
+            table: customers
+          - file: exports/orders_*.csv
+            table: orders
+
+    Args:
+        manifest_file (str): The path to the manifest, YAML if it ends with .yaml or .yml.
+
+    Returns:
+        list[dict[str, Any]]: The entries, with the default schema filled in.
+    """
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        if manifest_file.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError as e:
+                raise Exception("YAML manifests need PyYAML, install it or use a JSON manifest") from e
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {'files': manifest}
+    entries = []
+    for entry in manifest.get('files') or []:
+        entry = {'file': entry} if isinstance(entry, str) else dict(entry)
+        if 'file' not in entry:
+            raise Exception(f"Manifest entry without a file: {entry}")
+        entry.setdefault('schema', manifest.get('schema'))
+        entries.append(entry)
+    return entries
+
+def table_from_filename(csv_file: str) -> str:
+    """
+    Returns the table name for a file loaded with `--table-from-filename`, its name without extensions.
+    """
+    return os.path.splitext(os.path.basename(strip_compression_extension(csv_file)))[0]
+
+def plan_loads(entries: list[dict[str, Any]], schema: str|None = None, table: str|None = None, from_filename: bool = False) -> list[dict[str, Any]]:
+    """
+    Expands the file globs of the entries into one load per file, largest file first.
+
+    Args:
+        entries (list[dict[str, Any]]): The entries from `read_manifest`, or a single `{'file': pattern}`.
+        schema (str|None): The schema of entries that have none.
+        table (str|None): The table of entries that have none.
+        from_filename (bool): Name the table of entries without one after the file.
+
+    Returns:
+        list[dict[str, Any]]: The `file`, `schema`, `table` and `size` of every load.
+
+    Raises:
+        Exception: If a pattern matches no file, or a file has no schema or table.
+    """
+    loads: dict[str, dict[str, Any]] = {}
+    for entry in entries:
+        files = sorted(glob.glob(entry['file'])) if glob.has_magic(entry['file']) else [entry['file']]
+        if not files:
+            raise Exception(f"No file matches {entry['file']}")
+        for csv_file in files:
+            load = {
+                'file': csv_file,
+                'schema': entry.get('schema') or schema,
+                'table': entry.get('table') or table or (table_from_filename(csv_file) if from_filename else None),
+                'size': os.path.getsize(csv_file)
+            }
+            if not load['schema'] or not load['table']:
+                raise Exception(f"No schema or table for {csv_file}, set them in the manifest or use --schema and --table-from-filename")
+            loads[csv_file] = load
+    return sorted(loads.values(), key=lambda load: load['size'], reverse=True)
+
+def load_file(pool, state: RunState, cache: CatalogCache, load: dict[str, Any], checkpoint_interval: float,
+              checkpoint_rows: int|None, **load_options) -> dict[str, Any]:
+    """
+    Loads one file of a run over a pooled connection, resuming from its checkpoint in the run state.
+
+    The columns of the file header that are in the table are loaded. Errors are not raised, they
+    are returned with the `failed` status and recorded in the run state.
+
+    Args:
+        pool: The connection pool from `get_pool`.
+        state (RunState): The run state.
+        cache (CatalogCache): The cache of table columns.
+        load (dict[str, Any]): The `file`, `schema` and `table` to load, as from `plan_loads`.
+        checkpoint_interval (float): The number of seconds between commits and checkpoints.
+        checkpoint_rows (int|None): The number of rows between commits and checkpoints.
+        **load_options: Passed on to `load_rows`.
+
+    Returns:
+        dict[str, Any]: The load with the result of `load_rows`, its `status`, `elapsed` seconds and `error`.
+    """
+    csv_file = load['file']
+    started = time.perf_counter()
+    try:
+        fingerprint = file_fingerprint(csv_file)
+        entry = state.get(csv_file)
+        if entry.get('fingerprint', fingerprint) != fingerprint:
+            raise Exception(f"File {csv_file} changed since run state file {state.file_path} was written")
+        header = set(read_header(csv_file).columns)
+        with pooled_connection(pool) as conn:
+            columns = [column for column in get_table_columns(conn, load['schema'], load['table'], cache) if column[0] in header]
+            if not columns:
+                raise Exception(f"No column of {load['schema']}.{load['table']} is in {csv_file}")
+            state.update(csv_file, status='running', schema=load['schema'], table=load['table'], fingerprint=fingerprint,
+                         columns=columns, error=None)
+        # The pool holds psycopg2 connections, the prepared engine loads over a psycopg 3 connection of its own
+        engine = load_options.get('engine', 'copy')
+        with pooled_connection(pool) if engine != 'prepared' else connect(engine) as conn:
+            result = load_rows(conn, csv_file, columns, load['schema'], load['table'], state.file_path,
+                               entry.get('checkpoint', -1), entry.get('offset'), fingerprint=fingerprint,
+                               error_file=f"{os.path.splitext(strip_compression_extension(csv_file))[0]}_errors.csv",
+                               checkpointer=RunStateCheckpointer(state, csv_file, checkpoint_interval, checkpoint_rows), **load_options)
+        state.update(csv_file, status='done', rows=result['rows'], skipped=result['skipped'])
+        return {**load, **result, 'status': 'done', 'elapsed': time.perf_counter() - started}
+    except Exception as e:
+        state.update(csv_file, status='failed', error=str(e))
+        return {**load, 'status': 'failed', 'error': f"{traceback.format_exc()}\n{csv_file} failed: {e}",
+                'elapsed': time.perf_counter() - started}
+
+def load_files(loads: list[dict[str, Any]], state: RunState, workers: int, clear_table: bool = False, checkpoint_interval: float = 5.0,
+               checkpoint_rows: int|None = None, on_done: Callable[[dict[str, Any]], None]|None = None, **load_options) -> list[dict[str, Any]]:
+    """
+    Loads many files, each into its table, over a pool of connections shared by worker threads.
+
+    The loads are started in the given order, largest first from `plan_loads`, so the run does not
+    end waiting on one big file. The status and checkpoint of every file are kept in the run state,
+    so a rerun skips the files that finished and resumes the others.
+
+    Args:
+        loads (list[dict[str, Any]]): The loads from `plan_loads`.
+        state (RunState): The run state.
+        workers (int): The number of files loaded at a time, and of connections.
+        clear_table (bool): Truncate every target table once before loading, only on a fresh run.
+        checkpoint_interval (float): The number of seconds between commits and checkpoints.
+        checkpoint_rows (int|None): The number of rows between commits and checkpoints.
+        on_done (Callable[[dict[str, Any]], None]|None): Called with the result of every file as it finishes.
+        **load_options: Passed on to `load_rows`. Failing rows skipped with `on_error='skip'` are written
+            to an error file next to each CSV file.
+
+    Returns:
+        list[dict[str, Any]]: The result of every file that was loaded, with its `status` and `error`.
+    """
+    pending = [load for load in loads if state.get(load['file']).get('status') != 'done']
+    cache = CatalogCache()
+    results: list[dict[str, Any]] = []
+    lock = threading.Lock()
+
+    def run(load: dict[str, Any]):
+        result = load_file(pool, state, cache, load, checkpoint_interval, checkpoint_rows, **load_options)
+        with lock:
+            results.append(result)
+            if on_done:
+                on_done(result)
+
+    with get_pool(max(1, min(workers, len(pending)))) as pool:
+        if clear_table and not state.files:
+            with pooled_connection(pool) as conn:
+                for schema, table in dict.fromkeys((load['schema'], load['table']) for load in pending):
+                    truncate_table(conn, schema, table)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, pending))
+    return results
@@ -0,0 +1,43 @@
+import signal
+import click
+
+from utils.client import default_socket
+
+
+@click.command()
+@click.option('--socket', 'address', type=str, default=None, help='Unix socket to serve the job API on, defaults to $CSV2PG_SOCKET or daemon.sock in the catalog cache directory')
+@click.option('--workers', 'workers', type=click.IntRange(min=1), default=4, show_default=True, help='Number of files loaded at a time, each over one of as many warm connections')
+@click.option('--state-file', 'state_file', type=str, default='csv2pg_daemon_state.json', show_default=True, help='Run state file with the status and checkpoint of every file submitted')
+@click.option('--checkpoint-interval', 'checkpoint_interval', type=float, default=5.0, show_default=True, help='Seconds between commits and checkpoints')
+@click.option('--checkpoint-rows', 'checkpoint_rows', type=click.IntRange(min=1), default=None, help='Rows between commits and checkpoints, whichever of this and --checkpoint-interval comes first')
+def main(address: str|None, workers: int, state_file: str, checkpoint_interval: float, checkpoint_rows: int|None):
+    from daemon import serve
+    from db import get_pool
+
+    address = address or default_socket()
+
+    def on_ready(server):
+        print(f"Loading files submitted on {address} with {workers} connections, run state in {state_file}", flush=True)
+
+    def on_done(job: dict):
+        if job['status'] == 'done':
+            print(f"Job {job['id']}: " + (f"{job['file']} was already loaded" if job.get('already_loaded') else
+                  f"loaded {job['rows']} rows from {job['file']} into {job['schema']}.{job['table']} in {job['elapsed']:.1f}s"
+                  + (f", skipped {job['skipped']}" if job['skipped'] else '')), flush=True)
+        else:
+            print(f"Job {job['id']}: {job['error']}", flush=True)
+
+    # Stop on SIGTERM like on Ctrl-C, after the running jobs
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        with get_pool(workers) as pool:
+            serve(pool, address, state_file, workers, checkpoint_interval, checkpoint_rows, on_ready=on_ready, on_done=on_done)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    print("Stopped")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+from utils.batch import BatchSizer, merge_summaries
+
+
+class TestBatchSizer:
+    def test_fixed_size(self):
+        sizer = BatchSizer(1000)
+        sizer.update(1000, 10000, 5.0)
+        assert sizer.rows == 1000
+        assert sizer.summary() == {'adaptive': False, 'initial': 1000, 'last': 1000, 'min': 1000, 'max': 1000, 'mean': 1000}
+
+    def test_grows_when_fast(self):
+        sizer = BatchSizer(1000, adaptive=True, target_latency=0.5)
+        sizer.update(1000, 10000, 0.01)
+        assert sizer.rows == 2000 # Limited to doubling per batch
+        for _ in range(20):
+            sizer.update(sizer.rows, sizer.rows * 10, sizer.rows / 100000)
+        assert 45000 <= sizer.rows <= 55000
+
+    def test_shrinks_when_slow(self):
+        sizer = BatchSizer(1000, adaptive=True, target_latency=0.5)
+        sizer.update(1000, 10000, 10.0)
+        assert sizer.rows == 500 # Limited to halving per batch
+        for _ in range(20):
+            sizer.update(sizer.rows, sizer.rows * 10, sizer.rows / 200)
+        assert 90 <= sizer.rows <= 110
+
+    def test_byte_limit(self):
+        sizer = BatchSizer(1000, adaptive=True, max_bytes=100000)
+        sizer.update(1000, 1000000, 0.001)
+        assert sizer.rows == 100
+
+    def test_row_limits(self):
+        sizer = BatchSizer(1000, adaptive=True, max_rows=1500)
+        sizer.update(1000, 1000, 0.001)
+        assert sizer.rows == 1500
+        sizer = BatchSizer(2, adaptive=True, min_rows=2)
+        sizer.update(2, 20, 100.0)
+        assert sizer.rows == 2
+
+    def test_summary(self):
+        sizer = BatchSizer(100, adaptive=True)
+        assert sizer.summary()['mean'] is None
+        sizer.update(100, 1000, 0.001)
+        sizer.update(200, 2000, 0.001)
+        assert sizer.summary() == {'adaptive': True, 'initial': 100, 'last': 400, 'min': 100, 'max': 200, 'mean': 150}
+
+
+class TestMergeSummaries:
+    def test_merge(self):
+        first = {'adaptive': True, 'initial': 100, 'last': 400, 'min': 100, 'max': 200, 'mean': 150}
+        second = {'adaptive': True, 'initial': 100, 'last': 50, 'min': 50, 'max': 100, 'mean': 75}
+        unused = {'adaptive': True, 'initial': 100, 'last': 100, 'min': None, 'max': None, 'mean': None}
+        assert merge_summaries([first, second, unused]) == {'adaptive': True, 'initial': 100, 'last': [400, 50], 'min': 50, 'max': 200, 'mean': 112.5}
+
+    def test_empty(self):
+        assert merge_summaries([]) == {}
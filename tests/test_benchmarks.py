@@ -0,0 +1,44 @@
+from benchmarks.generate import create_table_statement, generate_csv, parse_columns
+from benchmarks.results import compare_results
+from utils.reader import read_csv_chunks
+import pytest
+
+
+class TestGenerate:
+    def test_parse_columns(self):
+        assert parse_columns('bigint:2,text') == [('c0', 'bigint'), ('c1', 'bigint'), ('c2', 'text')]
+        with pytest.raises(ValueError):
+            parse_columns('money')
+
+    def test_generate_csv_is_deterministic(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('benchmarks.generate.BLOCK_ROWS', 7)
+        columns = parse_columns('bigint,integer,numeric,double precision,text,boolean,date,timestamp without time zone,jsonb')
+        first, second = tmp_path / "first.csv", tmp_path / "second.csv"
+        size = generate_csv(str(first), columns, 50, seed=1, null_ratio=0.2, quote_ratio=0.3)
+        generate_csv(str(second), columns, 50, seed=1, null_ratio=0.2, quote_ratio=0.3)
+        assert first.read_bytes() == second.read_bytes()
+        assert size == len(first.read_bytes())
+        generate_csv(str(second), columns, 50, seed=2, null_ratio=0.2, quote_ratio=0.3)
+        assert first.read_bytes() != second.read_bytes()
+
+    def test_generate_csv_can_be_read_back(self, tmp_path):
+        columns = parse_columns('bigint,text:2')
+        csv_file = tmp_path / "data.csv"
+        generate_csv(str(csv_file), columns, 100, quote_ratio=0.5, null_ratio=0.1, text_width=8)
+        chunks = list(read_csv_chunks(str(csv_file), 30))
+        assert sum(len(chunk) for chunk, _ in chunks) == 100
+        assert chunks[0][0]['c0'].notna().all()
+        assert chunks[0][0]['c1'].str.contains('\n').any()
+
+    def test_create_table_statement(self):
+        assert create_table_statement([('c0', 'bigint'), ('c1', 'text')], 'bench') == "CREATE TABLE public.bench (c0 bigint, c1 text)"
+
+
+class TestCompareResults:
+    def test_compare_results(self):
+        baseline = {'results': {'copy': {'rows_per_sec': 1000, 'mb_per_sec': 10.0, 'seconds': 1.0}, 'memory': {'peak_rss_mb': 100}}}
+        candidate = {'results': {'copy': {'rows_per_sec': 850, 'mb_per_sec': 9.5, 'seconds': 1.2}, 'memory': {'peak_rss_mb': 50}}}
+        assert compare_results(baseline, candidate, 0.1) == [
+            ('copy.rows_per_sec', 1000, 850, True),
+            ('copy.mb_per_sec', 10.0, 9.5, False)
+        ]
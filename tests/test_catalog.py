@@ -0,0 +1,88 @@
+from db import get_table_columns
+from utils.catalog import CatalogCache, default_cache_file
+import pytest
+
+
+class FakeCursor:
+    """Answers the catalog queries from a marker and the columns of a single table."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params):
+        self.conn.queries.append(query)
+        if isinstance(params, dict):
+            exists = params['table'] == 'table'
+            self.result = (params['schema'] == 'schema', 1 if exists else None, self.conn.marker if exists else None,
+                           self.conn.columns if exists else None)
+        else:
+            self.result = (self.conn.marker,) if params[2] == 'table' else None
+
+    def fetchone(self):
+        return self.result
+
+class FakeConn:
+    def __init__(self):
+        self.queries: list[str] = []
+        self.marker = '10:20'
+        self.columns = [['id', 'integer'], ['name', 'text']]
+
+    def get_dsn_parameters(self):
+        return {'host': 'localhost', 'port': '5432', 'dbname': 'db'}
+
+    def cursor(self):
+        return FakeCursor(self)
+
+class TestGetTableColumns:
+    def test_uses_cache_until_table_changes(self, tmp_path):
+        conn = FakeConn()
+        cache = CatalogCache(str(tmp_path / "catalog.json"))
+        assert get_table_columns(conn, 'schema', 'table', cache) == [('id', 'integer'), ('name', 'text')]
+        assert len(conn.queries) == 1
+        conn.columns = [['id', 'bigint']]
+        assert get_table_columns(conn, 'schema', 'table', CatalogCache(cache.file_path)) == [('id', 'integer'), ('name', 'text')]
+        assert len(conn.queries) == 2
+        conn.marker = '11:20'
+        assert get_table_columns(conn, 'schema', 'table', cache) == [('id', 'bigint')]
+        assert len(conn.queries) == 4
+
+    def test_missing_schema_or_table(self):
+        with pytest.raises(Exception, match="Provided schema does not exist"):
+            get_table_columns(FakeConn(), 'other', 'table')
+        with pytest.raises(Exception, match="Provided table does not exist in schema schema"):
+            get_table_columns(FakeConn(), 'schema', 'other')
+
+class TestCatalogCache:
+    def test_put_and_get(self, tmp_path):
+        cache = CatalogCache(str(tmp_path / "cache" / "catalog.json"))
+        assert cache.get('db', 'schema', 'table') is None
+        cache.put('db', 'schema', 'table', 1, '10:20', [('id', 'integer')])
+        assert CatalogCache(cache.file_path).get('db', 'schema', 'table') == {'oid': 1, 'marker': '10:20', 'columns': [['id', 'integer']]}
+        assert CatalogCache(cache.file_path).get('other', 'schema', 'table') is None
+
+    def test_invalid_cache_file_is_ignored(self, tmp_path):
+        file_path = tmp_path / "catalog.json"
+        file_path.write_text('not json')
+        assert CatalogCache(str(file_path)).get('db', 'schema', 'table') is None
+
+    def test_oldest_entries_are_dropped(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('utils.catalog.MAX_ENTRIES', 2)
+        cache = CatalogCache(str(tmp_path / "catalog.json"))
+        for table in ('a', 'b', 'c'):
+            cache.put('db', 'schema', table, 1, '1:1', [])
+        cache = CatalogCache(cache.file_path)
+        assert [cache.get('db', 'schema', table) is not None for table in ('a', 'b', 'c')] == [False, True, True]
+
+    def test_default_cache_file(self, monkeypatch):
+        monkeypatch.setenv('CSV2PG_CACHE_DIR', '/tmp/csv2pg')
+        assert default_cache_file() == '/tmp/csv2pg/catalog.json'
+        monkeypatch.delenv('CSV2PG_CACHE_DIR')
+        monkeypatch.setenv('XDG_CACHE_HOME', '/tmp/cache')
+        assert default_cache_file() == '/tmp/cache/csv2pg/catalog.json'
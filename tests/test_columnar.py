@@ -0,0 +1,78 @@
+from utils.columnar import read_columnar_chunks, read_columnar_header
+from utils.file import file_fingerprint
+from utils.reader import read_chunks, read_header, split_byte_ranges
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+
+def _frame(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        'id': np.arange(rows, dtype=np.int64),
+        'name': [f'name {i}' if i % 3 else None for i in range(rows)],
+        'ts': pd.date_range('2024-01-01', periods=rows, freq='s'),
+    })
+
+def _write_parquet(tmp_path, rows: int, row_group_size: int = 4) -> str:
+    path = str(tmp_path / "data.parquet")
+    pq.write_table(pa.Table.from_pandas(_frame(rows), preserve_index=False), path, row_group_size=row_group_size)
+    return path
+
+def _write_arrow_stream(tmp_path, rows: int) -> str:
+    path = str(tmp_path / "data.arrow")
+    table = pa.Table.from_pandas(_frame(rows), preserve_index=False)
+    with pa.OSFile(path, 'wb') as f, pa.ipc.new_stream(f, table.schema) as writer:
+        for batch in table.to_batches(3):
+            writer.write_batch(batch)
+    return path
+
+class TestReadColumnarHeader:
+    def test_read_columnar_header(self, tmp_path):
+        assert list(read_columnar_header(_write_parquet(tmp_path, 5), 'parquet').columns) == ['id', 'name', 'ts']
+        assert list(read_header(_write_arrow_stream(tmp_path, 5)).columns) == ['id', 'name', 'ts']
+
+class TestReadColumnarChunks:
+    def test_read_parquet_chunks_across_row_groups(self, tmp_path):
+        chunks = list(read_columnar_chunks(_write_parquet(tmp_path, 10), 'parquet', 6))
+        assert [len(chunk) for chunk, _ in chunks] == [6, 4]
+        assert list(chunks[1][0].index) == [6, 7, 8, 9]
+        assert chunks[1][1].tolist() == [7, 8, 9, 10]
+
+    def test_columns_keep_their_types(self, tmp_path):
+        chunk, _ = next(read_columnar_chunks(_write_parquet(tmp_path, 10), 'parquet', 10))
+        assert chunk['id'].dtype == np.int64
+        assert pd.api.types.is_datetime64_any_dtype(chunk['ts'].dtype)
+        assert chunk['name'].isna().tolist()[:3] == [True, False, False]
+
+    def test_resume_from_offset(self, tmp_path):
+        for path, file_format in ((_write_parquet(tmp_path, 10), 'parquet'), (_write_arrow_stream(tmp_path, 10), 'arrow')):
+            chunks = list(read_columnar_chunks(path, file_format, 4, offset=5))
+            assert [i for chunk, _ in chunks for i in chunk['id']] == [5, 6, 7, 8, 9]
+            assert list(chunks[0][0].index) == [5, 6, 7, 8]
+
+    def test_projection(self, tmp_path):
+        path = str(tmp_path / "data.feather")
+        feather.write_feather(pa.Table.from_pandas(_frame(5), preserve_index=False), path)
+        chunk, _ = next(read_chunks(path, 10, columns=['ts', 'id', 'missing']))
+        assert list(chunk.columns) == ['ts', 'id']
+
+    def test_progress_reaches_file_size(self, tmp_path):
+        path = _write_parquet(tmp_path, 10)
+        positions = []
+        list(read_chunks(path, 3, on_read=positions.append))
+        assert positions == sorted(positions)
+        assert positions[-1] == os.path.getsize(path)
+
+class TestColumnarFiles:
+    def test_split_byte_ranges_is_refused(self, tmp_path):
+        with pytest.raises(ValueError):
+            split_byte_ranges(_write_parquet(tmp_path, 10), 2)
+
+    def test_file_fingerprint(self, tmp_path):
+        path = _write_parquet(tmp_path, 10)
+        assert file_fingerprint(path) == file_fingerprint(path)
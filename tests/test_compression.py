@@ -0,0 +1,102 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from utils.compression import DecompressingReader, detect_compression, input_position, open_input, open_output, strip_compression_extension
+from utils.reader import read_csv_chunks, read_csv_header, read_header_end, split_byte_ranges
+
+CONTENT = b"id,name\n" + b"".join(f'{i},"name\n{i}"\n'.encode() for i in range(5000))
+
+
+def _write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+class TestDetectCompression:
+    def test_by_extension(self, tmp_path):
+        assert detect_compression(_write(tmp_path, "data.csv.gz", gzip.compress(CONTENT))) == 'gzip'
+        assert detect_compression(_write(tmp_path, "data.csv.zst", b'')) == 'zstd'
+
+    def test_by_magic_bytes(self, tmp_path):
+        assert detect_compression(_write(tmp_path, "a.csv", gzip.compress(CONTENT))) == 'gzip'
+        assert detect_compression(_write(tmp_path, "b.csv", bz2.compress(CONTENT))) == 'bz2'
+        assert detect_compression(_write(tmp_path, "c.csv", lzma.compress(CONTENT))) == 'xz'
+
+    def test_plain_file(self, tmp_path):
+        assert detect_compression(_write(tmp_path, "data.csv", CONTENT)) is None
+
+    def test_strip_compression_extension(self):
+        assert strip_compression_extension("exports/orders.csv.gz") == "exports/orders.csv"
+        assert strip_compression_extension("exports/orders.csv") == "exports/orders.csv"
+
+class TestOpenOutput:
+    @pytest.mark.parametrize('compression', [None, 'gzip', 'bz2', 'xz'])
+    def test_concatenated_files_read_as_one(self, tmp_path, compression):
+        paths = [str(tmp_path / name) for name in ("a", "b")]
+        for path, data in zip(paths, (CONTENT[:100], CONTENT[100:])):
+            with open_output(path, compression) as f:
+                f.write(data)
+        joined = _write(tmp_path, "joined", b"".join(open(path, 'rb').read() for path in paths))
+        with open_input(joined, compression) as f:
+            assert f.read() == CONTENT
+
+class TestDecompressingReader:
+    @pytest.mark.parametrize('compression, compress', [('gzip', gzip.compress), ('bz2', bz2.compress), ('xz', lzma.compress)])
+    def test_reads_decompressed_content(self, tmp_path, compression, compress):
+        csv_file = _write(tmp_path, "data.csv", compress(CONTENT))
+        with open_input(csv_file, compression) as f:
+            assert f.read(10) == CONTENT[:10]
+            assert f.read() == CONTENT[10:]
+            assert f.read(10) == b''
+            assert input_position(f) == len(compress(CONTENT))
+
+    def test_reads_concatenated_members(self, tmp_path):
+        csv_file = _write(tmp_path, "data.csv.gz", gzip.compress(CONTENT[:100]) + gzip.compress(CONTENT[100:]))
+        with DecompressingReader(csv_file, 'gzip') as f:
+            assert f.read() == CONTENT
+
+    def test_seeks_forward_only(self, tmp_path):
+        csv_file = _write(tmp_path, "data.csv.gz", gzip.compress(CONTENT))
+        with DecompressingReader(csv_file, 'gzip') as f:
+            assert f.seek(1000) == 1000
+            assert f.read(20) == CONTENT[1000:1020]
+            with pytest.raises(ValueError):
+                f.seek(0)
+
+    def test_close_before_end(self, tmp_path):
+        csv_file = _write(tmp_path, "data.csv.gz", gzip.compress(CONTENT * 50))
+        f = DecompressingReader(csv_file, 'gzip')
+        f.read(10)
+        f.close()
+        assert f.raw.closed
+
+class TestReadCompressedCsv:
+    def test_offsets_are_in_decompressed_content(self, tmp_path):
+        csv_file = _write(tmp_path, "data.csv.gz", gzip.compress(CONTENT))
+        plain_file = _write(tmp_path, "data.csv", CONTENT)
+        assert list(read_csv_header(csv_file).columns) == ['id', 'name']
+        assert read_header_end(csv_file) == read_header_end(plain_file)
+        chunks = list(read_csv_chunks(csv_file, 1000))
+        plain_chunks = list(read_csv_chunks(plain_file, 1000))
+        assert [list(ends) for _, ends in chunks] == [list(ends) for _, ends in plain_chunks]
+        assert chunks[-1][0]['name'].iloc[-1] == "name\n4999"
+
+    def test_resume_from_offset(self, tmp_path):
+        csv_file = _write(tmp_path, "data.csv.gz", gzip.compress(CONTENT))
+        _, ends = next(read_csv_chunks(csv_file, 300))
+        chunks = list(read_csv_chunks(csv_file, 10000, offset=int(ends[-1]), first_row=300))
+        assert chunks[0][0].index[0] == 300
+        assert chunks[0][0]['id'].tolist() == list(range(300, 5000))
+
+    def test_reports_compressed_bytes_read(self, tmp_path):
+        data = gzip.compress(CONTENT)
+        positions = []
+        list(read_csv_chunks(_write(tmp_path, "data.csv.gz", data), 1000, on_read=positions.append))
+        assert positions[-1] == len(data)
+
+    def test_cannot_split(self, tmp_path):
+        with pytest.raises(ValueError):
+            split_byte_ranges(_write(tmp_path, "data.csv.gz", gzip.compress(CONTENT)), 2)
@@ -0,0 +1,87 @@
+from utils.convert import compile_converters, convert_column, compile_converter, encode_copy_buffer, encode_copy_columns, join_copy_columns
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestConvertColumn:
+    def test_integer_from_float_column_with_nulls(self):
+        series = pd.Series([1.0, np.nan, 3.0])
+        assert convert_column(series, compile_converter('bigint')).tolist() == ['1', None, '3']
+
+    def test_integer_from_strings(self):
+        series = pd.Series(['1', 'NULL', ' 42 '])
+        assert convert_column(series, compile_converter('integer')).tolist() == ['1', None, '42']
+
+    def test_integer_rejects_invalid_values(self):
+        with pytest.raises(ValueError):
+            convert_column(pd.Series(['1', 'abc']), compile_converter('integer'))
+
+    def test_integer_keeps_large_values_exact(self):
+        assert convert_column(pd.Series(['9007199254740993', '99999999999999999999']), compile_converter('bigint')).tolist() == \
+            ['9007199254740993', '99999999999999999999']
+
+    @pytest.mark.parametrize('series', [pd.Series(['1', '1.5']), pd.Series([1.0, 1.5]), pd.Series([1, 2.5], dtype=object)])
+    def test_integer_rejects_fractions(self, series):
+        with pytest.raises(ValueError):
+            convert_column(series, compile_converter('integer'))
+
+    def test_numeric(self):
+        series = pd.Series([1.5, 2.0, np.nan])
+        assert convert_column(series, compile_converter('numeric')).tolist() == ['1.5', '2.0', None]
+
+    def test_boolean(self):
+        assert convert_column(pd.Series([True, False]), compile_converter('boolean')).tolist() == ['t', 'f']
+        assert convert_column(pd.Series([1, 0]), compile_converter('boolean')).tolist() == ['t', 'f']
+        assert convert_column(pd.Series(['yes', None]), compile_converter('boolean')).tolist() == ['yes', None]
+
+    def test_timestamp(self):
+        series = pd.Series(pd.to_datetime(['2024-01-02 03:04:05', None]))
+        converted = convert_column(series, compile_converter('timestamp without time zone'))
+        assert converted.tolist() == ['2024-01-02T03:04:05.000000', None]
+
+    def test_date(self):
+        series = pd.Series(pd.to_datetime(['2024-01-02']))
+        assert convert_column(series, compile_converter('date')).tolist() == ['2024-01-02']
+
+    def test_timestamp_with_time_zone(self):
+        series = pd.Series(pd.to_datetime(['2024-01-02 03:04:05+02:00']))
+        converted = convert_column(series, compile_converter('timestamp with time zone'))
+        assert converted.tolist() == ['2024-01-02T01:04:05.000000+00']
+
+    def test_null_value(self):
+        series = pd.Series([1, None])
+        assert convert_column(series, compile_converter('integer'), '\\N').tolist() == ['1', '\\N']
+
+    def test_json(self):
+        series = pd.Series([{'a': 1}, '{"b": 2}', None])
+        assert convert_column(series, compile_converter('jsonb')).tolist() == ['{"a": 1}', '{"b": 2}', None]
+
+    def test_text_writes_whole_floats_as_integers(self):
+        series = pd.Series([45.0, 45.5, np.nan])
+        assert convert_column(series, compile_converter('text')).tolist() == ['45', '45.5', None]
+
+class TestEncodeCopyBuffer:
+    def test_encode_copy_buffer(self):
+        df = pd.DataFrame({'column1': ['value1', None], 'column2': [123, 456], 'column3': [45.0, np.nan]})
+        selected_columns = [('column1', 'text'), ('column2', 'integer'), ('column3', 'bigint'), ('column4', 'text')]
+        buffer = encode_copy_buffer(df, selected_columns, compile_converters(selected_columns))
+        assert buffer == "value1\t123\t45\t\\N\n\\N\t456\t\\N\t\\N\n"
+
+    def test_encode_copy_buffer_escapes_special_characters(self):
+        df = pd.DataFrame({'column1': ["What's up?", 'tab\there', 'line\nbreak', 'back\\slash']})
+        selected_columns = [('column1', 'text')]
+        buffer = encode_copy_buffer(df, selected_columns, compile_converters(selected_columns))
+        assert buffer == "What's up?\ntab\\there\nline\\nbreak\nback\\\\slash\n"
+
+    def test_encode_copy_buffer_with_empty_frame(self):
+        selected_columns = [('column1', 'text')]
+        assert encode_copy_buffer(pd.DataFrame({'column1': []}), selected_columns, compile_converters(selected_columns)) == ''
+
+    def test_encode_copy_columns(self):
+        df = pd.DataFrame({'column1': ['a\tb', None], 'column2': [1.0, np.nan]})
+        selected_columns = [('column1', 'text'), ('column2', 'integer')]
+        columns = encode_copy_columns(df, selected_columns, compile_converters(selected_columns))
+        assert columns == [['a\\tb', '\\N'], ['1', '\\N']]
+        assert join_copy_columns(columns) == "a\\tb\t1\n\\N\t\\N\n"
+        assert join_copy_columns([]) == ''
@@ -0,0 +1,128 @@
+import os
+import stat
+import threading
+
+import pytest
+
+import daemon
+from daemon import LoadDaemon, LoadServer
+from utils.client import daemon_running, request, submit_job, wait_for_job
+from utils.file import RunState
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+
+    def load_file(pool, state, cache, load, checkpoint_interval, checkpoint_rows, **options):
+        calls.append((load, options))
+        if load['table'] == 'broken':
+            state.update(load['file'], status='failed')
+            return {**load, 'status': 'failed', 'error': 'broken failed: no such table', 'elapsed': 0.1}
+        state.update(load['file'], status='done', schema=load['schema'], table=load['table'], fingerprint=daemon.file_fingerprint(load['file']))
+        return {**load, 'status': 'done', 'rows': 3, 'skipped': 0, 'elapsed': 0.5,
+                'stats': {'elapsed': 0.5, 'stages': {'send': {'wall': 0.1, 'cpu': 0.1, 'calls': 1}}, 'counters': {'rows': 3}}}
+
+    monkeypatch.setattr(daemon, 'load_file', load_file)
+    return calls
+
+@pytest.fixture
+def server(tmp_path, loads):
+    load_daemon = LoadDaemon(None, RunState(str(tmp_path / "state.json")), workers=2)
+    with LoadServer(load_daemon, str(tmp_path / "d.sock")) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        yield server
+        server.shutdown()
+        thread.join()
+    load_daemon.close()
+
+def _csv(tmp_path, name: str = "a.csv") -> str:
+    path = tmp_path / name
+    path.write_text("id,name\n1,a\n2,b\n3,c\n")
+    return str(path)
+
+class TestLoadServer:
+    def test_job_runs_and_reports(self, tmp_path, server, loads):
+        address = server.server_address
+        assert daemon_running(address)
+        job = submit_job(address, {'file': _csv(tmp_path), 'schema': 'public', 'table': 't', 'options': {'batch_size': 10}})
+        job = wait_for_job(address, job['id'])
+        assert (job['status'], job['rows'], job['rows_per_sec']) == ('done', 3, 6)
+        assert loads[0][1] == {'batch_size': 10}
+        status, metrics = request(address, 'GET', '/metrics')
+        assert metrics['jobs'] == {'queued': 0, 'running': 0, 'done': 1, 'failed': 0}
+        assert metrics['rows'] == 3 and metrics['stages']['send']['calls'] == 1
+
+    def test_loaded_file_is_not_loaded_again(self, tmp_path, server, loads):
+        address = server.server_address
+        csv_file = _csv(tmp_path)
+        wait_for_job(address, submit_job(address, {'file': csv_file, 'schema': 'public', 'table': 't'})['id'])
+        job = wait_for_job(address, submit_job(address, {'file': csv_file, 'schema': 'public', 'table': 't'})['id'])
+        assert job['already_loaded'] and len(loads) == 1
+        job = wait_for_job(address, submit_job(address, {'file': csv_file, 'schema': 'public', 'table': 'other'})['id'])
+        assert not job.get('already_loaded') and len(loads) == 2
+
+    def test_file_is_loaded_by_one_job_at_a_time(self, tmp_path, server, monkeypatch):
+        address = server.server_address
+        csv_file = _csv(tmp_path)
+        release = threading.Event()
+        calls = []
+
+        def load_file(pool, state, cache, load, checkpoint_interval, checkpoint_rows, **options):
+            calls.append(load)
+            release.wait(5)
+            return {**load, 'status': 'done', 'rows': 3, 'skipped': 0, 'elapsed': 0.1}
+
+        monkeypatch.setattr(daemon, 'load_file', load_file)
+        first = submit_job(address, {'file': csv_file, 'schema': 'public', 'table': 't'})
+        assert submit_job(address, {'file': csv_file, 'schema': 'public', 'table': 't'})['id'] == first['id']
+        with pytest.raises(Exception, match="being loaded into public.t"):
+            submit_job(address, {'file': csv_file, 'schema': 'public', 'table': 'other'})
+        release.set()
+        assert wait_for_job(address, first['id'])['status'] == 'done'
+        assert len(calls) == 1
+
+    def test_job_checkpoint_options(self, tmp_path, server, monkeypatch):
+        address = server.server_address
+        calls = []
+
+        def load_file(pool, state, cache, load, checkpoint_interval, checkpoint_rows, **options):
+            calls.append((checkpoint_interval, checkpoint_rows, options))
+            return {**load, 'status': 'done', 'rows': 3, 'skipped': 0, 'elapsed': 0.1}
+
+        monkeypatch.setattr(daemon, 'load_file', load_file)
+        wait_for_job(address, submit_job(address, {'file': _csv(tmp_path), 'schema': 'public', 'table': 't',
+                                                   'options': {'checkpoint_rows': 100, 'batch_size': 10}})['id'])
+        wait_for_job(address, submit_job(address, {'file': _csv(tmp_path, "b.csv"), 'schema': 'public', 'table': 't'})['id'])
+        assert calls == [(5.0, 100, {'batch_size': 10}), (5.0, None, {})]
+
+    def test_failed_job(self, tmp_path, server):
+        address = server.server_address
+        job = wait_for_job(address, submit_job(address, {'file': _csv(tmp_path), 'schema': 'public', 'table': 'broken'})['id'])
+        assert job['status'] == 'failed' and 'no such table' in job['error']
+
+    @pytest.mark.parametrize('load', [
+        {'schema': 'public', 'table': 't'},
+        {'file': 'missing.csv', 'schema': 'public', 'table': 't'},
+        {'file': 'a.csv', 'schema': 'public', 'table': 't', 'options': {'clear_table': True}},
+    ])
+    def test_rejected_jobs(self, tmp_path, server, load):
+        if load.get('file') == 'a.csv':
+            load['file'] = _csv(tmp_path)
+        with pytest.raises(Exception):
+            submit_job(server.server_address, load)
+
+    def test_unknown_job(self, server):
+        assert request(server.server_address, 'GET', '/jobs/42')[0] == 404
+
+    def test_socket_only_accessible_to_its_user(self, server):
+        assert stat.S_IMODE(os.stat(server.server_address).st_mode) & 0o077 == 0
+
+    def test_second_daemon_on_the_same_socket(self, tmp_path, server):
+        with pytest.raises(Exception, match="already serving"):
+            LoadServer(server.daemon, server.server_address)
+
+class TestDaemonRunning:
+    def test_nothing_listening(self, tmp_path):
+        assert not daemon_running(str(tmp_path / "none.sock"))
@@ -1,4 +1,7 @@
-from utils.db import generate_query_string, generate_row
+import psycopg2
+import pytest
+from db import pooled_connection
+from utils.db import generate_conflict_clause, generate_copy_row, generate_copy_statement, generate_export_query, generate_prepared_insert, generate_query_string, generate_row
 import pandas as pd
 
 class TestGenerateQueryString:
@@ -71,3 +74,122 @@ class TestGenerateRow:
     selected_columns = [('column1', 'text'), ('column2', 'integer')]
     expected_data = [None, None]
     assert generate_row(row, selected_columns) == expected_data
+
+
+class TestGenerateCopyRow:
+  def test_generate_copy_row(self):
+    row = pd.Series({'column1': 'value1', 'column2': 123, 'column3': 45.0, 'column4': None})
+    selected_columns = [('column1', 'text'), ('column2', 'integer'), ('column3', 'bigint'), ('column4', 'text')]
+    assert generate_copy_row(row, selected_columns) == "value1\t123\t45\t\\N\n"
+
+  def test_generate_copy_row_with_null_values(self):
+    row = pd.Series({'column1': 'value1', 'column2': None, 'column3': 'NULL'})
+    selected_columns = [('column1', 'text'), ('column2', 'integer'), ('column3', 'text')]
+    assert generate_copy_row(row, selected_columns) == "value1\t\\N\t\\N\n"
+
+  def test_generate_copy_row_escapes_special_characters(self):
+    row = pd.Series({'column1': "What's up?", 'column2': 'tab\there', 'column3': 'line\nbreak', 'column4': 'back\\slash'})
+    selected_columns = [('column1', 'text'), ('column2', 'text'), ('column3', 'text'), ('column4', 'text')]
+    assert generate_copy_row(row, selected_columns) == "What's up?\ttab\\there\tline\\nbreak\tback\\\\slash\n"
+
+  def test_generate_copy_row_with_missing_column(self):
+    row = pd.Series({'column1': 'value1'})
+    selected_columns = [('column1', 'text'), ('column2', 'integer')]
+    assert generate_copy_row(row, selected_columns) == "value1\t\\N\n"
+
+class TestGenerateCopyStatement:
+  def test_generate_copy_statement(self):
+    selected_columns = [('column1', 'text'), ('column2', 'integer')]
+    expected_statement = "COPY test_schema.test_table (column1,column2) FROM STDIN WITH (FORMAT text)"
+    assert generate_copy_statement(selected_columns, 'test_table', 'test_schema') == expected_statement
+
+class TestGeneratePreparedInsert:
+  def test_generate_prepared_insert(self):
+    selected_columns = [('column1', 'text'), ('column2', 'integer'), ('column3', 'timestamp with time zone')]
+    expected_statement = "INSERT INTO test_schema.test_table (column1,column2,column3) VALUES (%s::text,%s::integer,%s::timestamp with time zone)"
+    assert generate_prepared_insert(selected_columns, 'test_table', 'test_schema') == expected_statement
+
+class TestGenerateConflictClause:
+  def test_skip(self):
+    selected_columns = [('id', 'integer'), ('name', 'text')]
+    assert generate_conflict_clause(selected_columns, ['id'], 'skip', 't') == "ON CONFLICT (id) DO NOTHING"
+
+  def test_update_changed_rows(self):
+    selected_columns = [('a', 'integer'), ('b', 'integer'), ('name', 'text')]
+    assert generate_conflict_clause(selected_columns, ['a', 'b'], 'update', 't') == \
+      "ON CONFLICT (a,b) DO UPDATE SET name=EXCLUDED.name WHERE (t.name) IS DISTINCT FROM (EXCLUDED.name)"
+
+  def test_update_without_other_columns(self):
+    assert generate_conflict_clause([('id', 'integer')], ['id'], 'update', 't') == "ON CONFLICT (id) DO NOTHING"
+
+class TestGenerateExportQuery:
+  def test_whole_table(self):
+    selected_columns = [('id', 'integer'), ('name', 'text')]
+    assert generate_export_query(selected_columns, 't', 's') == "SELECT id,name FROM s.t"
+
+  def test_ctid_range(self):
+    assert generate_export_query([('id', 'integer')], 't', 's', 'ctid', None, 10, 20) == \
+      "SELECT id FROM s.t WHERE ctid >= '(10,0)'::tid AND ctid < '(20,0)'::tid"
+
+  def test_open_key_range(self):
+    assert generate_export_query([('id', 'integer')], 't', 's', 'key', 'id', None, 500) == "SELECT id FROM s.t WHERE id < 500"
+
+class FakeConnection:
+  """Fails every statement once `dropped` is set, like a connection the server closed."""
+
+  def __init__(self):
+    self.dropped = False
+    self.closed = 0
+
+  def cursor(self):
+    conn = self
+
+    class Cursor:
+      def __enter__(self):
+        return self
+
+      def __exit__(self, *args):
+        pass
+
+      def execute(self, query):
+        if conn.dropped:
+          conn.closed = 2
+          raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    return Cursor()
+
+  def rollback(self):
+    pass
+
+class FakePool:
+  def __init__(self, maxconn):
+    self.maxconn = maxconn
+    self.idle: list[FakeConnection] = []
+    self.discarded: list[FakeConnection] = []
+
+  def getconn(self):
+    return self.idle.pop() if self.idle else FakeConnection()
+
+  def putconn(self, conn, close=False):
+    (self.discarded if close else self.idle).append(conn)
+
+class TestPooledConnection:
+  def test_connection_dropped_between_jobs(self):
+    pool = FakePool(2)
+    with pooled_connection(pool) as first:
+      pass
+    first.dropped = True
+    with pooled_connection(pool) as second:
+      assert second is not first
+    assert pool.discarded == [first]
+    assert pool.idle == [second]
+
+  def test_server_down(self):
+    pool = FakePool(2)
+    dropped = FakeConnection()
+    dropped.dropped = True
+    pool.getconn = lambda: dropped
+    with pytest.raises(psycopg2.OperationalError):
+      with pooled_connection(pool):
+        pass
+    assert len(pool.discarded) == 3
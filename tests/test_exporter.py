@@ -0,0 +1,82 @@
+import gzip
+
+import pytest
+
+from exporter import assemble_output, choose_split, encode_header, part_file, plan_ranges, resume_plan
+from utils.file import RunState
+
+
+class TestChooseSplit:
+    def test_auto(self):
+        assert choose_split({'kind': 'r', 'pages': 10, 'key_column': 'id'}) == 'ctid'
+        assert choose_split({'kind': 'r', 'pages': 10, 'key_column': 'id'}, server_version=130008) == 'key'
+        assert choose_split({'kind': 'p', 'pages': 0, 'key_column': 'id'}) == 'key'
+        assert choose_split({'kind': 'v', 'pages': 0, 'key_column': None}) is None
+
+    def test_explicit(self):
+        assert choose_split({'kind': 'r', 'pages': 10, 'key_column': 'id'}, 'key') == 'key'
+        assert choose_split({'kind': 'r', 'pages': 10, 'key_column': 'id'}, 'none') is None
+
+    @pytest.mark.parametrize('layout, split', [
+        ({'kind': 'p', 'pages': 0, 'key_column': 'id'}, 'ctid'),
+        ({'kind': 'r', 'pages': 10, 'key_column': None}, 'key'),
+    ])
+    def test_impossible_split(self, layout, split):
+        with pytest.raises(ValueError):
+            choose_split(layout, split)
+
+class TestPlanRanges:
+    def test_ctid_ranges_are_open_at_both_ends(self):
+        assert plan_ranges('ctid', 4, pages=4096) == [(None, 1024), (1024, 2048), (2048, 3072), (3072, None)]
+
+    def test_small_tables_are_not_split(self):
+        assert plan_ranges('ctid', 8, pages=1500) == [(None, None)]
+        assert plan_ranges('ctid', 8, pages=0) == [(None, None)]
+
+    def test_key_ranges(self):
+        assert plan_ranges('key', 2, key_bounds=(1, 100000)) == [(None, 50001), (50001, None)]
+
+    def test_empty_table_by_key(self):
+        assert plan_ranges('key', 2, key_bounds=(None, None)) == [(None, None)]
+
+    def test_single_range(self):
+        assert plan_ranges(None, 8, pages=100000) == [(None, None)]
+
+class TestResumePlan:
+    def _interrupted(self, tmp_path, split):
+        output_file = str(tmp_path / "orders.csv")
+        state = RunState(str(tmp_path / "orders_export_state.json"))
+        state.update(output_file, schema='public', table='orders', columns=['id'], split=split, key_column='id', ranges=[[None, 10], [10, None]])
+        state.update(part_file(output_file, 0), status='done', rows=10)
+        (tmp_path / "orders.csv.part00000").write_text("1\n")
+        return output_file, state
+
+    def test_key_split_is_resumed(self, tmp_path):
+        output_file, state = self._interrupted(tmp_path, 'key')
+        assert resume_plan(state, output_file, 'public', 'orders', ['id'])['ranges'] == [[None, 10], [10, None]]
+        assert state.get(part_file(output_file, 0))['status'] == 'done'
+
+    def test_ctid_split_starts_over(self, tmp_path):
+        output_file, state = self._interrupted(tmp_path, 'ctid')
+        assert resume_plan(state, output_file, 'public', 'orders', ['id']) == {}
+        assert state.get(output_file) == {} and state.get(part_file(output_file, 0)) == {}
+        assert not (tmp_path / "orders.csv.part00000").exists()
+
+    def test_state_of_another_export(self, tmp_path):
+        output_file, state = self._interrupted(tmp_path, 'key')
+        with pytest.raises(Exception, match="public.orders"):
+            resume_plan(state, output_file, 'public', 'customers', ['id'])
+
+class TestAssembleOutput:
+    def test_header_and_parts(self, tmp_path):
+        output_file = str(tmp_path / "orders.csv.gz")
+        parts = [part_file(output_file, index) for index in range(2)]
+        for path, data in zip(parts, (b'1,a\n', b'2,"b,c"\n')):
+            with gzip.open(path, 'wb') as f:
+                f.write(data)
+        assemble_output(output_file, [('id', 'integer'), ('name, full', 'text')], parts, 'gzip')
+        assert gzip.decompress(open(output_file, 'rb').read()) == b'id,"name, full"\n1,a\n2,"b,c"\n'
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["orders.csv.gz"]
+
+    def test_header(self):
+        assert encode_header([('id', 'integer'), ('note', 'text')]) == b'id,note\n'
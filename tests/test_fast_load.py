@@ -0,0 +1,104 @@
+from db import drop_indexes_and_constraints
+from loader import fast_load
+import pytest
+
+
+class FakeCursor:
+    """Records statements, answers the constraint and index queries and fails COPY when asked to."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        if 'FROM pg_constraint con\n' in query:
+            self.result = [('"f_ref_fkey"', 'FOREIGN KEY (ref) REFERENCES fref(id)'), ('f_pkey', 'PRIMARY KEY (id)')]
+        elif 'FROM pg_index i' in query:
+            self.result = [('public.f_ref_idx', 'CREATE INDEX f_ref_idx ON public.f USING btree (ref)')]
+        else:
+            self.conn.statements.append(query)
+
+    def fetchall(self):
+        return self.result
+
+    def copy_expert(self, sql, buffer):
+        if self.conn.fail_copy:
+            raise ValueError("copy failed")
+        self.conn.statements.append(sql)
+
+class FakeConn:
+    def __init__(self, fail_copy: bool = False):
+        self.statements: list[str] = []
+        self.fail_copy = fail_copy
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+def _write_csv(tmp_path) -> str:
+    path = tmp_path / "f.csv"
+    path.write_text("id,ref\n1,1\n2,2\n")
+    return str(path)
+
+class TestDropIndexesAndConstraints:
+    def test_returns_creates_in_dependency_order(self):
+        conn = FakeConn()
+        creates = drop_indexes_and_constraints(conn, 'public', 'f')
+        assert conn.statements == [
+            'ALTER TABLE public.f DROP CONSTRAINT "f_ref_fkey";',
+            'ALTER TABLE public.f DROP CONSTRAINT f_pkey;',
+            'DROP INDEX public.f_ref_idx;'
+        ]
+        assert creates == [
+            'CREATE INDEX f_ref_idx ON public.f USING btree (ref);',
+            'ALTER TABLE public.f ADD CONSTRAINT f_pkey PRIMARY KEY (id);',
+            'ALTER TABLE public.f ADD CONSTRAINT "f_ref_fkey" FOREIGN KEY (ref) REFERENCES fref(id);'
+        ]
+
+class TestFastLoad:
+    columns = [('id', 'integer'), ('ref', 'integer')]
+
+    def test_rebuild_in_one_transaction(self, tmp_path):
+        conn = FakeConn()
+        result = fast_load(conn, 'rebuild', _write_csv(tmp_path), self.columns, 'public', 'f', str(tmp_path / "checkpoint.txt"))
+        assert result['rows'] == 2
+        assert conn.committed and not conn.rolled_back
+        assert conn.statements[0] == 'TRUNCATE TABLE public.f;'
+        assert conn.statements[-1] == 'ANALYZE public.f;'
+        assert not (tmp_path / "checkpoint.txt").exists()
+
+    def test_staging_copies_into_table(self, tmp_path):
+        conn = FakeConn()
+        fast_load(conn, 'staging', _write_csv(tmp_path), self.columns, 'public', 'f', str(tmp_path / "checkpoint.txt"))
+        assert 'CREATE UNLOGGED TABLE public._csv2pg_staging_f AS SELECT id,ref FROM public.f WITH NO DATA;' in conn.statements
+        assert conn.statements[-10:] == [
+            'TRUNCATE TABLE public.f;',
+            'ALTER TABLE public.f DROP CONSTRAINT "f_ref_fkey";',
+            'ALTER TABLE public.f DROP CONSTRAINT f_pkey;',
+            'DROP INDEX public.f_ref_idx;',
+            'INSERT INTO public.f (id,ref) SELECT id,ref FROM public._csv2pg_staging_f;',
+            'DROP TABLE public._csv2pg_staging_f;',
+            'CREATE INDEX f_ref_idx ON public.f USING btree (ref);',
+            'ALTER TABLE public.f ADD CONSTRAINT f_pkey PRIMARY KEY (id);',
+            'ALTER TABLE public.f ADD CONSTRAINT "f_ref_fkey" FOREIGN KEY (ref) REFERENCES fref(id);',
+            'ANALYZE public.f;'
+        ]
+
+    def test_rolls_back_on_failure(self, tmp_path):
+        conn = FakeConn(fail_copy=True)
+        with pytest.raises(Exception, match='copy failed'):
+            fast_load(conn, 'rebuild', _write_csv(tmp_path), self.columns, 'public', 'f', str(tmp_path / "checkpoint.txt"))
+        assert conn.rolled_back and not conn.committed
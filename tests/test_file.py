@@ -1,6 +1,9 @@
 import json
 from unittest.mock import patch, mock_open
-from utils.file import _load_checkpoint, save_checkpoint, log_error, load_and_confirm_checkpoint
+from utils.file import (
+    _load_checkpoint, save_checkpoint, load_and_confirm_checkpoint, read_checkpoint, file_fingerprint,
+    Checkpointer, part_checkpoint_file, load_part_checkpoints, remove_part_checkpoints, RunState, RunStateCheckpointer
+)
 import os
 
 class TestCheckpoint:
@@ -39,8 +42,10 @@ class TestCheckpoint:
         assert result == expected_result
         mock_file.assert_called_once_with("dummy_path", "r", encoding='utf-8')
 
+    @patch("utils.file.os.replace")
+    @patch("utils.file.os.fsync")
     @patch("utils.file.open", new_callable=mock_open)
-    def test_save_checkpoint(self, mock_file):
+    def test_save_checkpoint(self, mock_file, mock_fsync, mock_replace):
         # Test input values
         file_path = "dummy_path"
         checkpoint = 1999
@@ -65,12 +70,91 @@ class TestCheckpoint:
         # Call the function
         save_checkpoint(file_path, checkpoint, schema, table, columns)
 
-        # Verify that the correct file was opened
-        mock_file.assert_called_once_with(file_path, 'w', encoding='utf-8')
+        # Verify that a temporary file was written and renamed over the checkpoint
+        mock_file.assert_called_once_with(f"{file_path}.tmp", 'w', encoding='utf-8')
+        mock_replace.assert_called_once_with(f"{file_path}.tmp", file_path)
 
         # Verify the correct data was written to the file
         mock_file().write.assert_called_once_with(expected_file_content)
 
+    def test_save_checkpoint_with_offset(self, tmp_path):
+        file_path = str(tmp_path / "checkpoint.txt")
+        fingerprint = {'size': 10, 'mtime': 1, 'header': 'abc'}
+        save_checkpoint(file_path, 9, "schema", "table", [("col1", "text")], (5, 50), 42, fingerprint)
+        assert read_checkpoint(file_path) == {
+            'checkpoint': 9, 'schema': 'schema', 'table': 'table', 'columns': [['col1', 'text']],
+            'byte_range': [5, 50], 'offset': 42, 'fingerprint': fingerprint
+        }
+        assert not os.path.exists(f"{file_path}.tmp")
+
+    def test_save_checkpoint_with_prepared_transactions(self, tmp_path):
+        file_path = str(tmp_path / "checkpoint.txt")
+        save_checkpoint(file_path, 9, "schema", "table", [("col1", "text")], offset=42, prepared=['csv2pg_a_0_1'])
+        assert read_checkpoint(file_path)['prepared'] == ['csv2pg_a_0_1']
+
+class TestFileFingerprint:
+
+    def test_file_fingerprint(self, tmp_path):
+        csv_file = tmp_path / "data.csv"
+        csv_file.write_text("id,name\n1,a\n", encoding='utf-8')
+        fingerprint = file_fingerprint(str(csv_file))
+        assert fingerprint['size'] == 12
+        csv_file.write_text("id,other\n1,a\n", encoding='utf-8')
+        assert file_fingerprint(str(csv_file))['header'] != fingerprint['header']
+
+class TestCheckpointer:
+
+    def test_due_after_rows(self, tmp_path):
+        checkpointer = Checkpointer(str(tmp_path / "checkpoint.txt"), "schema", "table", [], interval=3600, rows=10)
+        checkpointer.add(9)
+        assert not checkpointer.due()
+        checkpointer.add(1)
+        assert checkpointer.due()
+        checkpointer.save(9, 100)
+        assert checkpointer.pending_rows == 0
+        assert read_checkpoint(str(tmp_path / "checkpoint.txt"))['offset'] == 100
+
+    def test_due_after_interval(self, tmp_path):
+        checkpointer = Checkpointer(str(tmp_path / "checkpoint.txt"), "schema", "table", [], interval=0)
+        assert checkpointer.due()
+
+class TestPartCheckpoints:
+
+    def test_load_part_checkpoints(self, tmp_path):
+        checkpoint_file = str(tmp_path / "checkpoint.txt")
+        save_checkpoint(part_checkpoint_file(checkpoint_file, 0), 4, "schema", "table", [], (10, 20), 20)
+        save_checkpoint(part_checkpoint_file(checkpoint_file, 1), -1, "schema", "table", [], (20, 30), 20)
+        assert load_part_checkpoints(checkpoint_file) == [((10, 20), 4, 20), ((20, 30), -1, 20)]
+        remove_part_checkpoints(checkpoint_file)
+        assert load_part_checkpoints(checkpoint_file) == []
+
+class TestRunState:
+
+    def test_update_and_reload(self, tmp_path):
+        state_file = str(tmp_path / "state.json")
+        state = RunState(state_file)
+        assert state.get("a.csv") == {}
+        state.update("a.csv", status="running", table="a")
+        state.update("a.csv", status="done")
+        assert RunState(state_file).get("a.csv") == {"status": "done", "table": "a"}
+
+    def test_remove(self, tmp_path):
+        state_file = str(tmp_path / "state.json")
+        state = RunState(state_file)
+        state.update("a.csv", status="done")
+        state.update("b.csv", status="done")
+        state.remove("a.csv")
+        assert RunState(state_file).files == {"b.csv": {"status": "done"}}
+
+    def test_run_state_checkpointer(self, tmp_path):
+        state = RunState(str(tmp_path / "state.json"))
+        checkpointer = RunStateCheckpointer(state, "a.csv", rows=2)
+        checkpointer.add(2)
+        assert checkpointer.due()
+        checkpointer.save(1, 30)
+        assert not checkpointer.due()
+        assert RunState(state.file_path).get("a.csv") == {"checkpoint": 1, "offset": 30}
+
 class TestLoadAndConfirmCheckpoint:
 
     @patch("utils.file._load_checkpoint")
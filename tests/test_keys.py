@@ -0,0 +1,76 @@
+from utils.convert import compile_converters
+from utils.keys import BloomKeyIndex, HashKeyIndex, KeyFilter, hash_text_columns
+import numpy as np
+import pandas as pd
+
+
+def _hashes(count: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 2 ** 63, count, dtype=np.uint64)
+
+class TestHashTextColumns:
+    def test_nulls_hash_apart_from_strings(self):
+        hashes = hash_text_columns([['a', None, '', 'None']])
+        assert len(set(hashes.tolist())) == 4
+
+    def test_depends_on_every_column(self):
+        assert hash_text_columns([['1'], ['a']])[0] != hash_text_columns([['1'], ['b']])[0]
+        assert hash_text_columns([['1'], ['a']])[0] == hash_text_columns([['1'], ['a']])[0]
+
+class TestHashKeyIndex:
+    def test_contains_added_hashes_across_runs(self):
+        index = HashKeyIndex()
+        added = [_hashes(count, seed) for seed, count in enumerate([1000, 10, 500, 3, 2000])]
+        for hashes in added:
+            index.add(hashes)
+        assert index.contains(np.concatenate(added)).all()
+        assert not index.contains(_hashes(1000, 99)).any()
+        assert len(index) == 3513
+        assert len(index.runs) <= 3
+
+class TestBloomKeyIndex:
+    def test_no_false_negatives_and_few_false_positives(self):
+        index = BloomKeyIndex(10000, 0.01)
+        added = _hashes(10000, 0)
+        index.add(added)
+        assert index.contains(added).all()
+        assert index.contains(_hashes(100000, 1)).mean() < 0.02
+
+class TestKeyFilter:
+    selected_columns = [('id', 'integer'), ('name', 'text')]
+
+    def _filter(self, action: str, existing: list[tuple]) -> KeyFilter:
+        key_filter = KeyFilter(self.selected_columns, ['id'], action, HashKeyIndex())
+        key_filter.add_existing(existing)
+        return key_filter
+
+    def test_skip_drops_existing_and_repeated_keys(self):
+        key_filter = self._filter('skip', [('1',), ('2',)])
+        converters = compile_converters(self.selected_columns)
+        rows = pd.DataFrame({'id': [1, 3, 3, None, None], 'name': ['a', 'b', 'c', 'd', 'e']})
+        kept, hashes = key_filter.filter(rows, converters)
+        assert kept.index.tolist() == [1, 3, 4]
+        assert hashes.index.tolist() == [1]
+        key_filter.add_sent(hashes)
+        later = pd.DataFrame({'id': [3, 4], 'name': ['f', 'g']}, index=[5, 6])
+        assert key_filter.filter(later, converters)[0].index.tolist() == [6]
+
+    def test_skip_adds_keys_once_sent(self):
+        key_filter = self._filter('skip', [])
+        converters = compile_converters(self.selected_columns)
+        rows = pd.DataFrame({'id': [1, 2], 'name': ['a', 'b']})
+        _, hashes = key_filter.filter(rows, converters)
+        assert len(key_filter.filter(rows, converters)[0]) == 2
+        key_filter.add_sent(hashes, failed_rows=[1])
+        assert key_filter.filter(rows, converters)[0].index.tolist() == [1]
+
+    def test_update_drops_identical_rows_only(self):
+        key_filter = self._filter('update', [('1', 'a'), ('2', 'b')])
+        converters = compile_converters(self.selected_columns)
+        rows = pd.DataFrame({'id': [1, 2, 3, 3], 'name': ['a', 'changed', 'x', 'y']})
+        assert key_filter.filter(rows, converters)[0].index.tolist() == [1, 3]
+
+    def test_update_sends_a_key_again_once_it_changed(self):
+        key_filter = self._filter('update', [('1', 'a')])
+        converters = compile_converters(self.selected_columns)
+        assert len(key_filter.filter(pd.DataFrame({'id': [1], 'name': ['b']}), converters)[0]) == 1
+        assert len(key_filter.filter(pd.DataFrame({'id': [1], 'name': ['a']}), converters)[0]) == 1
@@ -0,0 +1,99 @@
+import contextlib
+import loader
+from loader import encode_batch, insert_batch_skipping_errors, prepared_prefix, resolve_prepared
+from utils.file import save_checkpoint
+from utils.convert import compile_converters
+import csv
+import pandas as pd
+
+
+class FakeCursor:
+    """Accepts COPY data unless it contains a row with a negative id."""
+
+    def __init__(self):
+        self.rows: list[str] = []
+        self.statements: list[str] = []
+
+    def execute(self, query):
+        self.statements.append(query)
+
+    def executemany(self, query, rows):
+        if any(row[0].startswith('-') for row in rows):
+            raise ValueError("negative id")
+        self.rows.extend(row[0] for row in rows)
+
+    def copy_expert(self, sql, buffer):
+        lines = buffer.read().splitlines()
+        if any(line.startswith('-') for line in lines):
+            raise ValueError("negative id")
+        self.rows.extend(lines)
+
+class TestInsertBatchSkippingErrors:
+    def test_skips_only_failing_rows(self, tmp_path):
+        error_file = str(tmp_path / "errors.csv")
+        rows = pd.DataFrame({'id': [1, -2, 3, 4, 5, -6, 7, 8]})
+        selected_columns = [('id', 'integer')]
+        cursor = FakeCursor()
+        skipped, size = insert_batch_skipping_errors(cursor, rows, selected_columns, 'table', 'schema', 'copy', compile_converters(selected_columns), error_file)
+        assert skipped == 2
+        assert size == len('1\n3\n4\n5\n7\n8\n')
+        assert sorted(cursor.rows, key=int) == ['1', '3', '4', '5', '7', '8']
+        with open(error_file, newline='', encoding='utf-8') as f:
+            logged = list(csv.reader(f))
+        assert logged == [['id', 'error'], ['-2', 'Row 1: negative id'], ['-6', 'Row 5: negative id']]
+
+    def test_clean_batch_is_sent_once(self, tmp_path):
+        rows = pd.DataFrame({'id': [1, 2, 3]})
+        selected_columns = [('id', 'integer')]
+        cursor = FakeCursor()
+        skipped, size = insert_batch_skipping_errors(cursor, rows, selected_columns, 'table', 'schema', 'copy', compile_converters(selected_columns), str(tmp_path / "errors.csv"))
+        assert (skipped, size) == (0, 6)
+        assert cursor.rows == ['1', '2', '3']
+        assert cursor.statements == ["SAVEPOINT csv2pg_rows", "RELEASE SAVEPOINT csv2pg_rows"]
+
+    def test_prepared_engine(self, tmp_path):
+        error_file = str(tmp_path / "errors.csv")
+        rows = pd.DataFrame({'id': [1, -2, 3]})
+        selected_columns = [('id', 'integer')]
+        cursor = FakeCursor()
+        skipped, size = insert_batch_skipping_errors(cursor, rows, selected_columns, 'table', 'schema', 'prepared', compile_converters(selected_columns), error_file)
+        assert (skipped, size) == (1, 2)
+        assert cursor.rows == ['1', '3']
+
+    def test_copy_engine_merges_on_conflict(self, tmp_path):
+        rows = pd.DataFrame({'id': [1, 2]})
+        selected_columns = [('id', 'integer')]
+        cursor = FakeCursor()
+        insert_batch_skipping_errors(cursor, rows, selected_columns, 'table', 'schema', 'copy', compile_converters(selected_columns),
+                                     str(tmp_path / "errors.csv"), on_conflict="ON CONFLICT (id) DO NOTHING")
+        assert cursor.rows == ['1', '2']
+        assert cursor.statements[1] == ("INSERT INTO schema.table (id) SELECT id FROM pg_temp.csv2pg_merge ON CONFLICT (id) DO NOTHING; "
+                                        "TRUNCATE pg_temp.csv2pg_merge;")
+
+class TestEncodeBatch:
+    def test_prepared_engine_parameters(self):
+        rows = pd.DataFrame({'id': [1.0, None], 'name': ["it's", 'NULL']})
+        selected_columns = [('id', 'integer'), ('name', 'text'), ('missing', 'date')]
+        batch = encode_batch(rows, selected_columns, 'table', 'schema', 'prepared', compile_converters(selected_columns))
+        assert batch == [('1', "it's", None), (None, None, None)]
+
+class TestResolvePrepared:
+    def test_commits_checkpointed_and_rolls_back_others(self, tmp_path, monkeypatch):
+        checkpoint_file = str(tmp_path / "checkpoint.txt")
+        prefix = prepared_prefix(checkpoint_file)
+        save_checkpoint(checkpoint_file, 9, "schema", "table", [("id", "integer")], prepared=[f"{prefix}a_0_2"])
+        finished = []
+
+        @contextlib.contextmanager
+        def get_db():
+            yield type('Connection', (), {'autocommit': False})()
+
+        monkeypatch.setattr(loader, 'get_db', get_db)
+        monkeypatch.setattr(loader, 'list_prepared_transactions', lambda conn, gid_prefix: [f"{gid_prefix}a_0_2", f"{gid_prefix}a_1_3"])
+        monkeypatch.setattr(loader, 'finish_prepared_transaction', lambda conn, gid, commit: finished.append((gid, commit)))
+        assert resolve_prepared(checkpoint_file) == (1, 1)
+        assert finished == [(f"{prefix}a_0_2", True), (f"{prefix}a_1_3", False)]
+
+    def test_prefix_is_per_checkpoint_file(self, tmp_path):
+        assert prepared_prefix(str(tmp_path / "a.txt")) != prepared_prefix(str(tmp_path / "b.txt"))
+        assert len(prepared_prefix(str(tmp_path / "a.txt"))) < 200 - 32
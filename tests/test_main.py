@@ -0,0 +1,28 @@
+import contextlib
+import sys
+from types import SimpleNamespace
+import loader
+import main
+from loader import prepared_prefix
+from utils.file import save_checkpoint
+
+
+class TestHandleCheckpoint:
+    def test_declined_resume_resolves_prepared(self, tmp_path, monkeypatch):
+        checkpoint_file = str(tmp_path / "checkpoint.txt")
+        prefix = prepared_prefix(checkpoint_file)
+        save_checkpoint(checkpoint_file, 9, "schema", "table", [("id", "integer")], prepared=[f"{prefix}a_0_2"])
+        finished = []
+
+        @contextlib.contextmanager
+        def get_db():
+            yield type('Connection', (), {'autocommit': False})()
+
+        monkeypatch.setattr(loader, 'get_db', get_db)
+        monkeypatch.setattr(loader, 'list_prepared_transactions', lambda conn, gid_prefix: [f"{gid_prefix}a_0_2", f"{gid_prefix}a_1_3"])
+        monkeypatch.setattr(loader, 'finish_prepared_transaction', lambda conn, gid, commit: finished.append((gid, commit)))
+        # survey needs a terminal, the user answers no to resuming the checkpoint
+        monkeypatch.setitem(sys.modules, 'survey', SimpleNamespace(routines=SimpleNamespace(inquire=lambda *args, **kwargs: False)))
+        monkeypatch.setattr(main, 'get_db_insert_meta', lambda schema, table: (schema, table, [("id", "integer")]))
+        assert main.handle_checkpoint(checkpoint_file, "schema", "table") == ("schema", "table", [("id", "integer")], -1, False)
+        assert finished == [(f"{prefix}a_0_2", True), (f"{prefix}a_1_3", False)]
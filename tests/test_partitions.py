@@ -0,0 +1,92 @@
+from utils.convert import compile_converter
+from utils.partitions import PartitionRouter, comparable_values, create_partition_router, parse_partition_bound
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def _partition(table: str, bound: str) -> dict:
+    return {'schema': 'public', 'table': table, 'bound': bound}
+
+MONTHS = [
+    _partition('events_old', "FOR VALUES FROM (MINVALUE) TO ('2024-01-01 00:00:00+00')"),
+    _partition('events_2024_02', "FOR VALUES FROM ('2024-02-01 00:00:00+00') TO ('2024-03-01 00:00:00+00')"),
+    _partition('events_2024_01', "FOR VALUES FROM ('2024-01-01 00:00:00+00') TO ('2024-02-01 00:00:00+00')"),
+    _partition('events_default', "DEFAULT"),
+]
+
+class TestParsePartitionBound:
+    def test_range(self):
+        assert parse_partition_bound("FOR VALUES FROM (MINVALUE) TO ('2024-01-01')") == {'kind': 'range', 'from': ['MINVALUE'], 'to': ['2024-01-01']}
+        assert parse_partition_bound("FOR VALUES FROM (-10) TO (1.5e3)") == {'kind': 'range', 'from': ['-10'], 'to': ['1.5e3']}
+
+    def test_list(self):
+        assert parse_partition_bound("FOR VALUES IN ('it''s', 'a, b', NULL)") == {'kind': 'list', 'values': ["it's", 'a, b', None]}
+        assert parse_partition_bound("FOR VALUES IN (true)") == {'kind': 'list', 'values': ['t']}
+
+    def test_default_and_hash(self):
+        assert parse_partition_bound("DEFAULT") == {'kind': 'default'}
+        assert parse_partition_bound("FOR VALUES WITH (modulus 4, remainder 1)") == {'kind': 'hash'}
+
+    def test_unknown_bound(self):
+        with pytest.raises(ValueError):
+            parse_partition_bound("FOR VALUES LIKE ('a')")
+
+class TestComparableValues:
+    def test_integers_too_large_for_floats_are_invalid(self):
+        _, valid = comparable_values(pd.Series(['1', None, 'x', str(2 ** 60)], dtype=object), 'bigint')
+        assert valid.tolist() == [True, False, False, False]
+
+    def test_timestamps_with_time_zone(self):
+        values, valid = comparable_values(pd.Series(['2024-01-01 00:00:00+01', '2024-01-01 00:00', 'infinity'], dtype=object),
+                                          'timestamp with time zone', 'Europe/Paris')
+        assert valid.tolist() == [True, True, False]
+        assert values[0] == values[1] == pd.Timestamp('2024-01-01').value - 3600 * 10 ** 9
+
+    def test_dates_drop_their_time(self):
+        values, _ = comparable_values(pd.Series(['2024-01-31 23:00', '2024-01-31'], dtype=object), 'date')
+        assert values[0] == values[1]
+
+class TestPartitionRouter:
+    def test_range(self):
+        router = PartitionRouter('range', 'ts', 'timestamp with time zone', MONTHS)
+        assert router.partitions == [('public', 'events_old'), ('public', 'events_2024_02'), ('public', 'events_2024_01')]
+        rows = pd.DataFrame({'ts': ['2023-05-01', '2024-01-31 23:59:59', '2024-02-01', '2024-03-01', None, 'garbage']})
+        targets = router.route(rows, compile_converter('timestamp with time zone'))
+        assert targets.tolist() == [0, 2, 1, -1, -1, -1]
+
+    def test_range_on_floats_leaves_bounds_to_the_server(self):
+        router = PartitionRouter('range', 'x', 'double precision', [_partition('low', "FOR VALUES FROM (0) TO (0.5)"), _partition('high', "FOR VALUES FROM (0.5) TO (1)")])
+        targets = router.route(pd.DataFrame({'x': [0.25, 0.5, 0.75]}), compile_converter('double precision'))
+        assert targets.tolist() == [0, -1, 1]
+
+    def test_list(self):
+        router = PartitionRouter('list', 'region', 'text', [
+            _partition('emea', "FOR VALUES IN ('eu', 'africa')"),
+            _partition('other', "FOR VALUES IN ('us', NULL)"),
+        ])
+        targets = router.route(pd.DataFrame({'region': ['eu', 'us', None, 'asia', 'africa']}), compile_converter('text'))
+        assert targets.tolist() == [0, 1, 1, -1, 0]
+
+    def test_list_of_numbers_matches_their_values(self):
+        router = PartitionRouter('list', 'code', 'integer', [_partition('ones', "FOR VALUES IN (1, 11)")])
+        targets = router.route(pd.DataFrame({'code': [1.0, 11, 2]}), compile_converter('integer'))
+        assert np.array_equal(targets, [0, 0, -1])
+
+class TestCreatePartitionRouter:
+    def test_routable(self):
+        partitioning = {'strategy': 'range', 'key_columns': ['ts'], 'time_zone': 'UTC', 'partitions': MONTHS}
+        router = create_partition_router(partitioning, [('id', 'bigint'), ('ts', 'timestamp with time zone')])
+        assert router.key_column == 'ts'
+
+    @pytest.mark.parametrize('partitioning, selected_columns', [
+        ({'strategy': 'hash', 'key_columns': ['id'], 'partitions': []}, [('id', 'bigint')]),
+        ({'strategy': 'range', 'key_columns': ['a', 'b'], 'partitions': []}, [('a', 'bigint'), ('b', 'bigint')]),
+        ({'strategy': 'range', 'key_columns': [None], 'partitions': []}, [('a', 'bigint')]),
+        ({'strategy': 'range', 'key_columns': ['ts'], 'partitions': MONTHS}, [('id', 'bigint')]),
+        ({'strategy': 'range', 'key_columns': ['name'], 'partitions': []}, [('name', 'text')]),
+        ({'strategy': 'list', 'key_columns': ['name'], 'partitions': [_partition('d', "DEFAULT")]}, [('name', 'text')]),
+    ])
+    def test_not_routable(self, partitioning, selected_columns):
+        with pytest.raises(ValueError):
+            create_partition_router(partitioning, selected_columns)
@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+from utils.pipeline import threaded
+
+
+class TestThreaded:
+    def test_keeps_order(self):
+        assert list(threaded(iter(range(100)), 3)) == list(range(100))
+
+    def test_runs_in_another_thread(self):
+        def produce():
+            yield threading.get_ident()
+
+        assert list(threaded(produce(), 1)) != [threading.get_ident()]
+
+    def test_raises_producer_error(self):
+        def produce():
+            yield 1
+            raise ValueError('bad row')
+
+        items = threaded(produce(), 2)
+        assert next(items) == 1
+        with pytest.raises(ValueError, match='bad row'):
+            next(items)
+
+    def test_stops_producer_when_closed(self):
+        produced = []
+        closed = threading.Event()
+
+        def produce():
+            try:
+                for i in range(1000):
+                    produced.append(i)
+                    yield i
+            finally:
+                closed.set()
+
+        items = threaded(produce(), 2)
+        assert next(items) == 0
+        items.close()
+        assert closed.is_set()
+        assert len(produced) < 10
@@ -0,0 +1,153 @@
+from utils.reader import detect_format, estimate_chunk_rows, find_row_ends, read_chunks, read_csv_chunks, read_csv_header, read_header, read_header_end, split_byte_ranges
+import json
+import os
+import pandas as pd
+import pytest
+
+
+def _write_csv(tmp_path, rows: int) -> str:
+    path = tmp_path / "data.csv"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("id,name\n")
+        for i in range(rows):
+            f.write(f"{i},name {i}\n")
+    return str(path)
+
+def _write_ndjson(tmp_path, rows: int) -> str:
+    path = tmp_path / "data.ndjson"
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(rows):
+            f.write(json.dumps({'id': i, 'name': f'name "{i}"'} if i % 2 else {'id': i}) + "\n")
+    return str(path)
+
+class TestDetectFormat:
+    def test_detect_format(self):
+        assert detect_format("data.csv") == 'csv'
+        assert detect_format("data.txt") == 'csv'
+        assert detect_format("data.jsonl.gz") == 'ndjson'
+        assert detect_format("data.PARQUET") == 'parquet'
+        assert detect_format("data.feather") == 'arrow'
+
+class TestReadNdjson:
+    def test_read_header_takes_keys_of_first_rows(self, tmp_path):
+        assert list(read_header(_write_ndjson(tmp_path, 10)).columns) == ['id', 'name']
+
+    def test_read_chunks(self, tmp_path):
+        ndjson_file = _write_ndjson(tmp_path, 10)
+        chunks = list(read_chunks(ndjson_file, 4))
+        assert [len(chunk) for chunk, _ in chunks] == [4, 4, 2]
+        assert pd.isna(chunks[0][0]['name'].iloc[0])
+        assert chunks[0][0]['name'].iloc[1] == 'name "1"'
+        assert chunks[-1][1][-1] == os.path.getsize(ndjson_file)
+
+    def test_read_chunks_from_offset_with_blank_lines(self, tmp_path):
+        path = tmp_path / "data.ndjson"
+        path.write_bytes(b'{"id": 1}\n\n{"id": 2, "day": "2024-01-02"}\r\n{"id": 3}')
+        chunks = list(read_chunks(str(path), 10, columns=['day', 'id', 'missing']))
+        assert list(chunks[0][0].columns) == ['day', 'id']
+        assert chunks[0][0]['day'].iloc[1] == '2024-01-02'
+        assert len(chunks[0][1]) == 3
+        chunks = list(read_chunks(str(path), 10, offset=int(chunks[0][1][0]), first_row=1))
+        assert chunks[0][0]['id'].tolist() == [2, 3]
+
+    def test_split_byte_ranges(self, tmp_path):
+        ndjson_file = _write_ndjson(tmp_path, 100)
+        ranges = split_byte_ranges(ndjson_file, 3)
+        assert ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(ndjson_file)
+        ids = [i for byte_range in ranges for chunk, _ in read_chunks(ndjson_file, 7, byte_range) for i in chunk['id']]
+        assert ids == list(range(100))
+
+class TestReadCsvHeader:
+    def test_read_csv_header(self, tmp_path):
+        header = read_csv_header(_write_csv(tmp_path, 10))
+        assert list(header.columns) == ['id', 'name']
+        assert header.empty
+
+class TestReadCsvChunks:
+    def test_read_csv_chunks(self, tmp_path):
+        csv_file = _write_csv(tmp_path, 10)
+        chunks = list(read_csv_chunks(csv_file, 4))
+        assert [len(chunk) for chunk, _ in chunks] == [4, 4, 2]
+        assert [list(chunk.index) for chunk, _ in chunks][1] == [4, 5, 6, 7]
+        assert chunks[-1][1][-1] == os.path.getsize(csv_file)
+        assert all(len(chunk) == len(ends) for chunk, ends in chunks)
+
+    def test_read_csv_chunks_from_offset(self, tmp_path):
+        csv_file = _write_csv(tmp_path, 10)
+        _, ends = next(read_csv_chunks(csv_file, 3))
+        chunks = list(read_csv_chunks(csv_file, 100, offset=int(ends[-1]), first_row=3))
+        assert chunks[0][0]['id'].tolist() == list(range(3, 10))
+        assert list(chunks[0][0].index) == list(range(3, 10))
+
+    def test_read_csv_chunks_without_trailing_newline_and_blank_lines(self, tmp_path):
+        path = tmp_path / "data.csv"
+        path.write_bytes(b"id,name\n1,a\n\n2,b\r\n\r\n3,c")
+        chunks = list(read_csv_chunks(str(path), 10))
+        assert chunks[0][0]['id'].tolist() == [1, 2, 3]
+        assert chunks[0][1].tolist() == [12, 18, 23]
+
+    def test_read_csv_chunks_with_quote_inside_unquoted_field(self, tmp_path):
+        path = tmp_path / "data.csv"
+        path.write_bytes(b'id,size\n1,5"\n2,6\n')
+        with pytest.raises(ValueError):
+            list(read_csv_chunks(str(path), 10))
+
+class TestEstimateChunkRows:
+    def test_estimate_chunk_rows(self, tmp_path):
+        csv_file = _write_csv(tmp_path, 100)
+        small = estimate_chunk_rows(csv_file, 1024 * 1024)
+        large = estimate_chunk_rows(csv_file, 1024 * 1024 * 1024)
+        assert 1 <= small < large
+
+    def test_estimate_chunk_rows_with_tiny_budget(self, tmp_path):
+        assert estimate_chunk_rows(_write_csv(tmp_path, 100), 1) == 1
+
+class TestFindRowEnds:
+    def test_find_row_ends(self):
+        ends, in_quotes = find_row_ends(b'a,b\n1,"x\ny"\n2,z')
+        assert ends.tolist() == [4, 12]
+        assert not in_quotes
+
+    def test_find_row_ends_inside_quotes(self):
+        ends, in_quotes = find_row_ends(b'still quoted\n",x\n3,"open', in_quotes=True)
+        assert ends.tolist() == [17]
+        assert in_quotes
+
+class TestSplitByteRanges:
+    def test_split_byte_ranges(self, tmp_path):
+        csv_file = _write_csv(tmp_path, 100)
+        ranges = split_byte_ranges(csv_file, 4)
+        assert len(ranges) == 4
+        assert ranges[0][0] == len("id,name\n")
+        assert ranges[-1][1] == os.path.getsize(csv_file)
+        assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+
+    def test_split_byte_ranges_respects_quoted_newlines(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('utils.reader.SCAN_BLOCK_SIZE', 7)
+        path = tmp_path / "quoted.csv"
+        path.write_text('id,note\n' + ''.join(f'{i},"line\none ""{i}""\nend"\n' for i in range(20)), encoding='utf-8')
+        ranges = split_byte_ranges(str(path), 3)
+        rows = []
+        for byte_range in ranges:
+            for chunk, _ in read_csv_chunks(str(path), 7, byte_range):
+                rows.extend(chunk['id'].tolist())
+                assert chunk['note'].str.startswith('line\none').all()
+        assert rows == list(range(20))
+
+    def test_split_byte_ranges_with_header_only(self, tmp_path):
+        assert split_byte_ranges(_write_csv(tmp_path, 0), 4) == []
+
+class TestReadCsvChunksByteRange:
+    def test_read_csv_chunks_byte_range(self, tmp_path):
+        csv_file = _write_csv(tmp_path, 10)
+        ranges = split_byte_ranges(csv_file, 2)
+        chunks = list(read_csv_chunks(csv_file, 100, ranges[1]))
+        chunk, ends = chunks[0]
+        assert list(chunk.columns) == ['id', 'name']
+        assert chunk.index[0] == 0
+        assert chunk['id'].iloc[-1] == 9
+        assert ends[-1] == ranges[1][1]
+
+class TestReadHeaderEnd:
+    def test_read_header_end(self, tmp_path):
+        assert read_header_end(_write_csv(tmp_path, 3)) == len("id,name\n")
@@ -0,0 +1,48 @@
+from scheduler import plan_loads, read_manifest, table_from_filename
+import json
+import pytest
+
+
+class TestReadManifest:
+    def test_mapping_with_default_schema(self, tmp_path):
+        manifest = tmp_path / "load.json"
+        manifest.write_text(json.dumps({'schema': 'public', 'files': [{'file': 'a.csv', 'table': 'a'}, {'file': 'b.csv', 'schema': 'other'}, 'c.csv']}))
+        assert read_manifest(str(manifest)) == [
+            {'file': 'a.csv', 'table': 'a', 'schema': 'public'},
+            {'file': 'b.csv', 'schema': 'other'},
+            {'file': 'c.csv', 'schema': 'public'}
+        ]
+
+    def test_list(self, tmp_path):
+        manifest = tmp_path / "load.json"
+        manifest.write_text(json.dumps([{'file': 'a.csv', 'schema': 's', 'table': 't'}]))
+        assert read_manifest(str(manifest)) == [{'file': 'a.csv', 'schema': 's', 'table': 't'}]
+
+    def test_entry_without_file(self, tmp_path):
+        manifest = tmp_path / "load.json"
+        manifest.write_text(json.dumps([{'table': 't'}]))
+        with pytest.raises(Exception, match="without a file"):
+            read_manifest(str(manifest))
+
+class TestPlanLoads:
+    def test_largest_first(self, tmp_path):
+        for name, size in (('small.csv', 10), ('large.csv', 30), ('medium.csv', 20)):
+            (tmp_path / name).write_text('x' * size)
+        loads = plan_loads([{'file': str(tmp_path / "*.csv")}], schema='public', from_filename=True)
+        assert [(load['table'], load['size']) for load in loads] == [('large', 30), ('medium', 20), ('small', 10)]
+        assert all(load['schema'] == 'public' for load in loads)
+
+    def test_manifest_table_wins(self, tmp_path):
+        (tmp_path / "a.csv").write_text('x')
+        loads = plan_loads([{'file': str(tmp_path / "a.csv"), 'schema': 's', 'table': 't'}], schema='public', from_filename=True)
+        assert [(load['schema'], load['table']) for load in loads] == [('s', 't')]
+
+    def test_missing_table_or_file(self, tmp_path):
+        (tmp_path / "a.csv").write_text('x')
+        with pytest.raises(Exception, match="No schema or table"):
+            plan_loads([{'file': str(tmp_path / "a.csv")}], schema='public')
+        with pytest.raises(Exception, match="No file matches"):
+            plan_loads([{'file': str(tmp_path / "*.txt")}], schema='public', from_filename=True)
+
+    def test_table_from_filename(self):
+        assert table_from_filename('exports/orders_2024.csv') == 'orders_2024'
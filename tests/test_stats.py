@@ -0,0 +1,66 @@
+from utils.stats import RunStats, format_stats, merge_stats, write_stats_json
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+
+class TestRunStats:
+    def test_stage_and_counters(self):
+        stats = RunStats()
+        with stats.stage('convert'):
+            sum(range(1000))
+        with stats.stage('convert'):
+            pass
+        stats.count('rows', 10)
+        stats.count('batches')
+        result = stats.to_dict()
+        assert result['stages']['convert']['calls'] == 2
+        assert result['stages']['convert']['wall'] >= 0
+        assert result['counters'] == {'rows': 10, 'batches': 1}
+
+    def test_iterate(self):
+        stats = RunStats()
+        assert list(stats.iterate('read', [1, None, 3])) == [1, None, 3]
+        assert stats.to_dict()['stages']['read']['calls'] == 4
+
+    def test_report(self, capsys):
+        stats = RunStats(interval=3600, label='part 1')
+        stats.count('rows', 5)
+        stats.report()
+        assert capsys.readouterr().err == ''
+        stats.report(force=True)
+        assert capsys.readouterr().err.startswith('stats part 1 elapsed=')
+
+
+class TestMergeStats:
+    def test_shared_between_threads(self):
+        stats = RunStats()
+
+        def run():
+            for _ in range(10000):
+                with stats.stage('copy'):
+                    stats.count('rows')
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for future in [executor.submit(run) for _ in range(4)]:
+                future.result()
+        result = stats.to_dict()
+        assert result['counters']['rows'] == 40000
+        assert result['stages']['copy']['calls'] == 40000
+
+    def test_merge_stats(self):
+        first = {'elapsed': 2.0, 'stages': {'send': {'wall': 1.0, 'cpu': 0.5, 'calls': 2}}, 'counters': {'rows': 10}}
+        second = {'elapsed': 3.0, 'stages': {'send': {'wall': 2.0, 'cpu': 0.5, 'calls': 1}, 'read': {'wall': 1.0, 'cpu': 1.0, 'calls': 1}}, 'counters': {'rows': 5, 'retries': 1}}
+        assert merge_stats([first, second]) == {
+            'elapsed': 3.0,
+            'stages': {'send': {'wall': 3.0, 'cpu': 1.0, 'calls': 3}, 'read': {'wall': 1.0, 'cpu': 1.0, 'calls': 1}},
+            'counters': {'rows': 15, 'retries': 1}
+        }
+
+    def test_format_stats(self):
+        stats = {'elapsed': 2.0, 'stages': {'send': {'wall': 1.0, 'cpu': 0.5, 'calls': 2}}, 'counters': {'rows': 10}}
+        assert format_stats(stats) == 'stats elapsed=2.0s rows=10 rows_per_sec=5 send=1.00s/0.50cpu'
+
+    def test_write_stats_json(self, tmp_path):
+        file_path = tmp_path / "stats.json"
+        write_stats_json(str(file_path), {'rows': 1})
+        assert json.loads(file_path.read_text()) == {'rows': 1}
@@ -0,0 +1,86 @@
+from utils.validate import Validation, compile_check, format_validation, parse_type, validate_file
+import numpy as np
+import pandas as pd
+
+
+def _failures(data_type: str, values: list) -> dict[str, list[bool]]:
+    return {check: failed.tolist() for check, failed in compile_check(data_type)(pd.Series(values)).items()}
+
+class TestParseType:
+    def test_modifiers(self):
+        assert parse_type('numeric(10,2)') == ('numeric', (10, 2))
+        assert parse_type('character varying(20)') == ('character varying', (20,))
+        assert parse_type('timestamp(3) without time zone') == ('timestamp without time zone', (3,))
+        assert parse_type('integer') == ('integer', ())
+
+class TestChecks:
+    def test_integer_width(self):
+        failures = _failures('smallint', ['1', ' 32767 ', '32768', '-40000', '1.5', 'abc'])
+        assert failures['out of range'] == [False, False, True, True, False, False]
+        assert failures['not a whole number'] == [False, False, False, False, True, False]
+        assert failures['not a number'] == [False, False, False, False, False, True]
+
+    def test_bigint_from_parsed_column(self):
+        assert not any(_failures('bigint', np.array([1, 2 ** 40]))['out of range'])
+
+    def test_bigint_bounds(self):
+        assert _failures('bigint', ['9223372036854775807', '9223372036854775808'])['out of range'] == [False, True]
+        failures = _failures('bigint', ['-9223372036854775808', '-9223372036854775809', '9223372036854775808', '9223372036854775807.5', 'x'])
+        assert failures['out of range'] == [False, True, True, True, False]
+        assert failures['not a whole number'] == [False, False, False, True, False]
+        assert _failures('bigint', np.array([2 ** 63], dtype=np.uint64))['out of range'] == [True]
+        assert _failures('bigint', [9.223372036854775808e18, -9.223372036854775808e18])['out of range'] == [True, False]
+
+    def test_numeric_precision(self):
+        failures = _failures('numeric(5,2)', ['999.99', '999.999', '1000', 'NaN', '1e2', 'x'])
+        assert failures['out of range'] == [False, True, True, False, False, False]
+        assert failures['not a number'] == [False, False, False, False, False, True]
+
+    def test_boolean(self):
+        assert _failures('boolean', ['true', 'F', 'yes', 'off', 'maybe', 'o'])['not a boolean'] == [False, False, False, False, True, True]
+        assert not any(_failures('boolean', [1, 0])['not a boolean'])
+
+    def test_dates(self):
+        values = ['2024-02-29', '2023-02-29', '9999-12-31', '2024-13-01', '01/02/2024', 'infinity', 'soon']
+        assert _failures('date', values)['not a date'] == [False, True, False, True, False, False, True]
+
+    def test_timestamps(self):
+        values = ['2024-01-02 03:04:05.123', '2024-01-02T03:04:05+02:00', '2024-01-02 25:00']
+        assert _failures('timestamp with time zone', values)['not a date'] == [False, False, True]
+
+    def test_varchar_length(self):
+        assert _failures('character varying(3)', ['abc', 'abcd'])['too long'] == [False, True]
+        assert _failures('character varying(3)', [12.0, 1234.0])['too long'] == [False, True]
+        assert _failures('character(2)', ['ab   ', 'abc'])['too long'] == [False, True]
+
+    def test_unchecked_types(self):
+        assert compile_check('text') is None
+        assert compile_check('character varying') is None
+
+class TestValidation:
+    columns = [
+        {'name': 'id', 'type': 'integer', 'not_null': True, 'has_default': False},
+        {'name': 'name', 'type': 'character varying(4)', 'not_null': False, 'has_default': False},
+        {'name': 'created', 'type': 'date', 'not_null': True, 'has_default': True},
+        {'name': 'owner', 'type': 'integer', 'not_null': True, 'has_default': False},
+    ]
+
+    def test_counts_failures_with_samples(self):
+        validation = Validation(self.columns, ['id', 'name'])
+        validation.check(pd.DataFrame({'id': [1, None, 3], 'name': ['ok', 'too long', None]}, index=[10, 11, 12]))
+        validation.check(pd.DataFrame({'id': ['x', None], 'name': ['ok', 'long']}, index=[13, 14]))
+        report = validation.report()
+        assert report['rows'] == 5
+        assert report['missing_columns'] == ['owner']
+        assert report['failed_checks'] == 4
+        assert report['columns']['id']['failures'] == {'null': 2, 'not a number': 1}
+        assert report['columns']['id']['samples']['null'] == [(11, ''), (14, '')]
+        assert report['columns']['name']['samples']['too long'] == [(11, 'too long')]
+        assert 'id integer: 2 null, e.g. row 11, row 14' in format_validation(report)
+
+    def test_validate_file(self, tmp_path):
+        csv_file = tmp_path / "data.csv"
+        csv_file.write_text("id,name\n1,a\n2,b\nx,c\n")
+        report = validate_file(str(csv_file), self.columns[:2], ['id', 'name'], chunk_rows=2)
+        assert report['rows'] == 3
+        assert report['columns'] == {'id': {'type': 'integer', 'failures': {'not a number': 1}, 'samples': {'not a number': [(2, 'x')]}}}
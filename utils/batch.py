@@ -0,0 +1,98 @@
+from typing import Any
+
+# Weight of the newest measurement in the moving averages
+SMOOTHING = 0.3
+# Largest factor the batch size grows or shrinks by after one batch
+MAX_STEP = 2.0
+
+
+class BatchSizer:
+    """
+    Chooses the number of rows per batch.
+
+    With `adaptive` set, the size follows the measured throughput so that sending one batch
+    takes about `target_latency` seconds, without the encoded batch going over `max_bytes`.
+    It changes by at most a factor of two per batch, so one slow batch does not collapse it.
+    Otherwise the size stays at `rows`.
+    """
+
+    def __init__(self, rows: int, adaptive: bool = False, target_latency: float = 0.5, min_rows: int = 1,
+                 max_rows: int|None = None, max_bytes: int|None = None):
+        self.initial = rows
+        self.rows = rows
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rate: float|None = None
+        self.bytes_per_row: float|None = None
+        self.batches = 0
+        self.total_rows = 0
+        self.smallest: int|None = None
+        self.largest: int|None = None
+
+    def _smooth(self, average: float|None, value: float) -> float:
+        return value if average is None else average + SMOOTHING * (value - average)
+
+    def update(self, rows: int, size: int, seconds: float):
+        """
+        Records a sent batch and adjusts the size of the next one.
+
+        Args:
+            rows (int): The number of rows in the batch.
+            size (int): The number of bytes sent for the batch.
+            seconds (float): The time it took to send the batch.
+        """
+        if rows <= 0:
+            return
+        self.batches += 1
+        self.total_rows += rows
+        self.smallest = rows if self.smallest is None else min(self.smallest, rows)
+        self.largest = rows if self.largest is None else max(self.largest, rows)
+        if not self.adaptive:
+            return
+        self.rate = self._smooth(self.rate, rows / max(seconds, 1e-6))
+        self.bytes_per_row = self._smooth(self.bytes_per_row, size / rows)
+        target = self.rate * self.target_latency
+        target = min(max(target, self.rows / MAX_STEP), self.rows * MAX_STEP)
+        if self.max_bytes and self.bytes_per_row:
+            target = min(target, self.max_bytes / self.bytes_per_row)
+        if self.max_rows:
+            target = min(target, self.max_rows)
+        self.rows = max(self.min_rows, int(target))
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Returns the batch sizes used so far, for the run statistics.
+        """
+        return {
+            'adaptive': self.adaptive,
+            'initial': self.initial,
+            'last': self.rows,
+            'min': self.smallest,
+            'max': self.largest,
+            'mean': self.total_rows / self.batches if self.batches else None
+        }
+
+def merge_summaries(summaries: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Combines the `BatchSizer.summary` of several parallel loads.
+
+    Args:
+        summaries (list[dict[str, Any]]): The summaries to combine.
+
+    Returns:
+        dict[str, Any]: One summary, with `last` holding the size each load ended with.
+    """
+    used = [summary for summary in summaries if summary['mean'] is not None]
+    if not used:
+        return summaries[0] if summaries else {}
+    return {
+        'adaptive': used[0]['adaptive'],
+        'initial': used[0]['initial'],
+        'last': [summary['last'] for summary in used],
+        'min': min(summary['min'] for summary in used),
+        'max': max(summary['max'] for summary in used),
+        'mean': sum(summary['mean'] for summary in used) / len(used)
+    }
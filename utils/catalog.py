@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+from typing import Any
+
+# Entries kept in the cache file, the oldest are dropped first
+MAX_ENTRIES = 1000
+
+
+def default_cache_file() -> str:
+    """
+    Returns the catalog cache path, `$CSV2PG_CACHE_DIR` or `$XDG_CACHE_HOME/csv2pg` or `~/.cache/csv2pg`.
+    """
+    directory = os.environ.get('CSV2PG_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'csv2pg')
+    return os.path.join(directory, 'catalog.json')
+
+class CatalogCache:
+    """
+    Caches the columns of tables on disk, so they are not looked up again on every run.
+
+    Entries are keyed by database and table name, and store the relation OID and a DDL change
+    marker (the `xmin` of the `pg_class` row, which changes with every ALTER TABLE). An entry
+    is only used while both still match the database.
+    """
+
+    def __init__(self, file_path: str|None = None):
+        self.file_path = file_path or default_cache_file()
+        self._entries: dict[str, Any]|None = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, Any]:
+        with self._lock:
+            return self._read()
+
+    def _read(self) -> dict[str, Any]:
+        if self._entries is None:
+            try:
+                with open(self.file_path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._entries = {}
+        return self._entries
+
+    @staticmethod
+    def key(database: str, schema: str, table: str) -> str:
+        return json.dumps([database, schema, table])
+
+    def get(self, database: str, schema: str, table: str) -> dict[str, Any]|None:
+        """
+        Returns the cached entry of a table, with its `oid`, `marker` and `columns`, or None.
+        """
+        return self._load().get(self.key(database, schema, table))
+
+    def put(self, database: str, schema: str, table: str, oid: int, marker: str, columns: list[tuple[str, str]]):
+        """
+        Stores the columns of a table. The cache file is replaced atomically, and a cache that
+        cannot be written is ignored.
+        """
+        with self._lock:
+            self._write(self._read(), database, schema, table, oid, marker, columns)
+
+    def _write(self, entries: dict[str, Any], database: str, schema: str, table: str, oid: int, marker: str, columns: list[tuple[str, str]]):
+        key = self.key(database, schema, table)
+        entries.pop(key, None)
+        entries[key] = {'oid': oid, 'marker': marker, 'columns': [list(column) for column in columns]}
+        while len(entries) > MAX_ENTRIES:
+            entries.pop(next(iter(entries)))
+        try:
+            os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+            tmp_path = f"{self.file_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.file_path)
+        except OSError:
+            pass
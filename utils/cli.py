@@ -1,2 +1,21 @@
 def make_bold(text: str):
-    return f"\033[1m{text}\033[0m"
\ No newline at end of file
+    return f"\033[1m{text}\033[0m"
+
+_SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+def parse_size(text: str) -> int:
+    """
+    Parses a human readable size such as `512MB` or `2GB` into bytes.
+
+    Args:
+        text (str): The size, optionally followed by B, KB, MB or GB.
+
+    Returns:
+        int: The size in bytes.
+    """
+    text = text.strip().upper()
+    number = text.rstrip('KMGB')
+    unit = text[len(number):]
+    if unit not in _SIZE_UNITS or not number:
+        raise ValueError(f"Invalid size: {text}")
+    return int(float(number) * _SIZE_UNITS[unit])
@@ -0,0 +1,102 @@
+import http.client
+import json
+import os
+import socket
+from typing import Any
+
+from utils.catalog import default_cache_file
+
+# Seconds a request for the status of a job waits for it to finish, before asking again
+WAIT_SECONDS = 30
+
+
+def default_socket() -> str:
+    """
+    Returns the socket path of the load daemon, `$CSV2PG_SOCKET` or `daemon.sock` next to the catalog cache.
+    """
+    return os.environ.get('CSV2PG_SOCKET') or os.path.join(os.path.dirname(default_cache_file()), 'daemon.sock')
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    An HTTP connection over a Unix socket.
+    """
+
+    def __init__(self, socket_path: str, timeout: float|None = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def request(address: str, method: str, path: str, body: dict[str, Any]|None = None, timeout: float|None = None) -> tuple[int, Any]:
+    """
+    Sends a request to the load daemon.
+
+    Args:
+        address (str): The socket path.
+        method (str): `GET` or `POST`.
+        path (str): The path, such as `/jobs`.
+        body (dict[str, Any]|None): Sent as JSON.
+        timeout (float|None): Seconds to wait for the connection and the response.
+
+    Returns:
+        tuple[int, Any]: The HTTP status and the decoded JSON response.
+
+    Raises:
+        OSError: If the daemon cannot be reached.
+    """
+    conn = UnixHTTPConnection(address, timeout=timeout)
+    try:
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        conn.request(method, path, body=data, headers={'Content-Type': 'application/json'} if data else {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+    finally:
+        conn.close()
+
+def daemon_running(address: str) -> bool:
+    """
+    Returns whether a load daemon answers at an address.
+    """
+    if not os.path.exists(address):
+        return False
+    try:
+        return request(address, 'GET', '/health', timeout=1)[0] == 200
+    except (OSError, http.client.HTTPException, ValueError):
+        return False
+
+def submit_job(address: str, load: dict[str, Any]) -> dict[str, Any]:
+    """
+    Submits a load to the daemon.
+
+    Args:
+        address (str): The daemon address, see `request`.
+        load (dict[str, Any]): The `file`, `schema`, `table` and load `options`.
+
+    Returns:
+        dict[str, Any]: The queued job, with its `id`.
+
+    Raises:
+        Exception: If the daemon rejects the job.
+    """
+    status, job = request(address, 'POST', '/jobs', load)
+    if status != 202:
+        raise Exception(job.get('error') if isinstance(job, dict) else f"The daemon answered with status {status}")
+    return job
+
+def wait_for_job(address: str, job_id: int) -> dict[str, Any]:
+    """
+    Waits for a job of the daemon to finish.
+
+    Returns:
+        dict[str, Any]: The job, with its `status` done or failed.
+    """
+    while True:
+        status, job = request(address, 'GET', f"/jobs/{job_id}?wait={WAIT_SECONDS}")
+        if status != 200:
+            raise Exception(job.get('error') if isinstance(job, dict) else f"The daemon answered with status {status}")
+        if job['status'] in ('done', 'failed'):
+            return job
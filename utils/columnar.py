@@ -0,0 +1,135 @@
+import os
+from typing import Any, Callable, Iterator
+import numpy as np
+import pandas as pd
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise Exception("Parquet and Arrow files need the pyarrow package, install it with pip install pyarrow") from e
+    return pyarrow
+
+def _open_arrow(file_path: str) -> tuple[Any, Any]:
+    # Arrow IPC files come in the random access file format or the streaming format
+    pa = _import_pyarrow()
+    source = pa.memory_map(file_path)
+    try:
+        return source, pa.ipc.open_file(source)
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return source, pa.ipc.open_stream(source)
+
+def read_columnar_header(file_path: str, file_format: str) -> pd.DataFrame:
+    """
+    Reads the schema of a Parquet or Arrow IPC file.
+
+    Args:
+        file_path (str): The path to the file.
+        file_format (str): Either 'parquet' or 'arrow'.
+
+    Returns:
+        pd.DataFrame: An empty DataFrame with the columns of the file.
+    """
+    pa = _import_pyarrow()
+    if file_format == 'parquet':
+        names = pa.parquet.ParquetFile(file_path).schema_arrow.names
+    else:
+        source, reader = _open_arrow(file_path)
+        with source:
+            names = reader.schema.names
+    return pd.DataFrame(columns=names)
+
+def _record_batches(file_path: str, file_format: str, chunk_rows: int, offset: int, columns: list[str]|None,
+                    on_read: Callable[[int], None]|None) -> Iterator[Any]:
+    # Yields the record batches after the first `offset` rows, whole row groups of a Parquet file are not read at all
+    pa = _import_pyarrow()
+    size = os.path.getsize(file_path)
+    if file_format == 'parquet':
+        parquet = pa.parquet.ParquetFile(file_path)
+        metadata = parquet.metadata
+        groups, read = [], 0
+        for group in range(metadata.num_row_groups):
+            rows = metadata.row_group(group).num_rows
+            if groups or read + rows > offset:
+                groups.append(group)
+            else:
+                read += rows
+        offset -= read
+        batches = parquet.iter_batches(batch_size=chunk_rows, row_groups=groups, columns=columns)
+        total = max(metadata.num_rows, 1)
+        source = None
+    else:
+        source, reader = _open_arrow(file_path)
+        if isinstance(reader, pa.ipc.RecordBatchFileReader):
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            total = max(reader.num_record_batches, 1)
+        else:
+            batches = iter(reader)
+            total = None
+        read = 0
+    try:
+        for batch in batches:
+            read += len(batch) if file_format == 'parquet' else 1
+            if on_read:
+                on_read(source.tell() if total is None else size * read // total)
+            if offset:
+                skipped = min(offset, len(batch))
+                batch, offset = batch.slice(skipped), offset - skipped
+            if columns is not None and file_format == 'arrow':
+                batch = batch.select(columns)
+            yield batch
+    finally:
+        if source is not None:
+            source.close()
+
+def read_columnar_chunks(file_path: str, file_format: str, chunk_rows: int, offset: int|None = None, columns: list[str]|None = None,
+                         on_read: Callable[[int], None]|None = None) -> Iterator[tuple[pd.DataFrame, np.ndarray]]:
+    """
+    Streams a Parquet or Arrow IPC file in chunks of at most `chunk_rows` rows.
+
+    Only the `columns` are read. The record batches are converted to pandas with one typed NumPy
+    array per column, integers, floats, booleans, dates and timestamps stay typed all the way to
+    the column converters. The converters format the values for the type of their table column, the
+    same as for CSV rows, rather than Arrow casting them to strings, so the key filter and the error
+    isolation work on the same DataFrame rows for every format. Positions in the file are row counts,
+    the position just past a row is its row number plus one, so a checkpoint resumes after skipping
+    that many rows.
+
+    Args:
+        file_path (str): The path to the file.
+        file_format (str): Either 'parquet' or 'arrow'.
+        chunk_rows (int): The maximum number of rows per chunk.
+        offset (int|None): The number of rows to skip, such as a checkpoint position.
+        columns (list[str]|None): The columns to read, all of them when None.
+        on_read (Callable[[int], None]|None): Called with an estimate of the bytes of the file read so far.
+
+    Yields:
+        tuple[pd.DataFrame, np.ndarray]: The chunk, indexed by row number, and the position just past each of its rows.
+    """
+    pa = _import_pyarrow()
+    first_row = offset or 0
+    pending: list = []
+    rows = 0
+
+    def flush() -> tuple[pd.DataFrame, np.ndarray]:
+        nonlocal first_row
+        chunk = pa.Table.from_batches(pending).to_pandas(date_as_object=False)
+        chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+        first_row += len(chunk)
+        return chunk, np.arange(chunk.index.start + 1, first_row + 1, dtype=np.int64)
+
+    for batch in _record_batches(file_path, file_format, chunk_rows, first_row, columns, on_read):
+        while len(batch):
+            taken = batch.slice(0, chunk_rows - rows)
+            batch = batch.slice(len(taken))
+            pending.append(taken)
+            rows += len(taken)
+            if rows == chunk_rows:
+                yield flush()
+                pending, rows = [], 0
+    if pending:
+        yield flush()
@@ -0,0 +1,171 @@
+import bz2
+import gzip
+import lzma
+import os
+from typing import Any, BinaryIO, Iterator
+
+from utils.pipeline import threaded
+
+# Compression by file extension, named like the `compression` argument of pandas
+EXTENSIONS = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.lzma': 'xz', '.zst': 'zstd', '.zstd': 'zstd'}
+# Compression by the first bytes of the file, for files without a known extension
+MAGIC_BYTES = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'xz', b'\x28\xb5\x2f\xfd': 'zstd'}
+# Size of the blocks decompressed ahead of the reader, and how many of them are buffered
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+DECOMPRESS_BLOCKS = 8
+
+
+def detect_compression(file_path: str) -> str|None:
+    """
+    Detects the compression of a file from its extension, or else from its first bytes.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        str|None: `gzip`, `bz2`, `xz` or `zstd`, or None for an uncompressed file.
+    """
+    compression = EXTENSIONS.get(os.path.splitext(file_path)[1].lower())
+    if compression:
+        return compression
+    with open(file_path, 'rb') as f:
+        start = f.read(max(len(magic) for magic in MAGIC_BYTES))
+    return next((compression for magic, compression in MAGIC_BYTES.items() if start.startswith(magic)), None)
+
+def strip_compression_extension(file_path: str) -> str:
+    """
+    Removes a compression extension from a path, `orders.csv.gz` becomes `orders.csv`.
+    """
+    base, ext = os.path.splitext(file_path)
+    return base if ext.lower() in EXTENSIONS else file_path
+
+def _open_decompressed(raw: BinaryIO, compression: str) -> BinaryIO:
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(raw, 'rb')
+    if compression == 'xz':
+        return lzma.LZMAFile(raw, 'rb')
+    if compression == 'zstd':
+        return _import_zstandard().ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+    raise ValueError(f"Unknown compression {compression}")
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise Exception("Zstandard files need the zstandard package, install it with pip install zstandard") from e
+    return zstandard
+
+class DecompressingReader:
+    """
+    Reads a compressed file as a stream of decompressed bytes.
+
+    Blocks are decompressed in a background thread, a few blocks ahead of the reader, so
+    decompression overlaps parsing and loading. Positions are offsets in the decompressed
+    stream, and the stream can only be read forward: seeking ahead reads and drops the bytes
+    in between. `input_position` is how far the compressed file has been read.
+    """
+
+    def __init__(self, file_path: str, compression: str):
+        self.raw = open(file_path, 'rb')
+        try:
+            self.stream = _open_decompressed(self.raw, compression)
+        except BaseException:
+            self.raw.close()
+            raise
+        self.input_position = 0
+        self._blocks = threaded(self._decompress(), DECOMPRESS_BLOCKS)
+        # Blocks are appended at the end and reads taken off the front, a bytearray does both in place
+        self._buffer = bytearray()
+        self._position = 0
+
+    def _decompress(self) -> Iterator[tuple[bytes, int]]:
+        while True:
+            block = self.stream.read(DECOMPRESS_BLOCK_SIZE)
+            if not block:
+                return
+            yield block, self.raw.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Reads `size` decompressed bytes, fewer only at the end of the stream, or all of them when negative.
+        """
+        while size < 0 or len(self._buffer) < size:
+            block, self.input_position = next(self._blocks, (b'', self.input_position))
+            if not block:
+                break
+            self._buffer += block
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._position += len(data)
+        return data
+
+    def seek(self, offset: int) -> int:
+        if offset < self._position:
+            raise ValueError(f"Cannot seek back to {offset} in a compressed file, at {self._position}")
+        while self._position < offset and self.read(min(offset - self._position, DECOMPRESS_BLOCK_SIZE)):
+            pass
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        self._blocks.close()
+        self.stream.close()
+        self.raw.close()
+
+    def __enter__(self) -> 'DecompressingReader':
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+def open_input(file_path: str, compression: str|None = None) -> 'BinaryIO|DecompressingReader':
+    """
+    Opens a possibly compressed CSV file for reading its decompressed bytes.
+
+    Args:
+        file_path (str): The path to the file.
+        compression (str|None): The compression from `detect_compression`, None for a plain file.
+
+    Returns:
+        BinaryIO|DecompressingReader: The plain file, or a reader decompressing it in the background.
+    """
+    return DecompressingReader(file_path, compression) if compression else open(file_path, 'rb')
+
+def open_output(file_path: str, compression: str|None = None) -> BinaryIO:
+    """
+    Opens a file for writing bytes, compressed on the way.
+
+    The compressed formats all read concatenated streams as one, so files written separately can
+    be joined bytewise into a single compressed file.
+
+    Args:
+        file_path (str): The path to the file.
+        compression (str|None): `gzip`, `bz2`, `xz` or `zstd`, None for a plain file.
+
+    Returns:
+        BinaryIO: The file, closing it finishes the compressed stream.
+    """
+    if compression is None:
+        return open(file_path, 'wb')
+    if compression == 'gzip':
+        # Level 6 compresses almost as well as the default 9 in a fraction of the time
+        return gzip.open(file_path, 'wb', compresslevel=6)
+    if compression == 'bz2':
+        return bz2.open(file_path, 'wb')
+    if compression == 'xz':
+        return lzma.open(file_path, 'wb')
+    if compression == 'zstd':
+        return _import_zstandard().ZstdCompressor().stream_writer(open(file_path, 'wb'), closefd=True)
+    raise ValueError(f"Unknown compression {compression}")
+
+def input_position(f: 'BinaryIO|DecompressingReader') -> int:
+    """
+    Returns how far a file from `open_input` has been read in the file itself, compressed or not.
+    """
+    return f.input_position if isinstance(f, DecompressingReader) else f.tell()
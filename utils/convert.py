@@ -0,0 +1,215 @@
+import json
+from typing import Callable
+import numpy as np
+import pandas as pd
+
+Converter = Callable[[pd.Series], pd.Series]
+
+INTEGER_TYPES = ('smallint', 'integer', 'bigint')
+NUMERIC_TYPES = ('numeric', 'real', 'double precision')
+BOOLEAN_TYPES = ('boolean',)
+DATE_TYPES = ('date',)
+TIMESTAMP_TYPES = ('timestamp without time zone', 'timestamp with time zone')
+JSON_TYPES = ('json', 'jsonb')
+
+COPY_NULL = '\\N'
+_COPY_SPECIAL_CHARACTERS = ('\\', '\t', '\n', '\r')
+
+
+def null_mask(series: pd.Series) -> pd.Series:
+    """
+    Returns a mask of the null values of a column, missing values and 'NULL' strings.
+    """
+    mask = series.isna()
+    if series.dtype == object:
+        mask |= series == 'NULL'
+    return mask
+
+def _float_to_text(values: np.ndarray) -> np.ndarray:
+    # Whole floats are written as integers, like generate_row does for single values
+    whole = np.isfinite(values) & (np.mod(values, 1) == 0) & (np.abs(values) < 2 ** 63)
+    text = np.array(list(map(repr, values.tolist())), dtype=object)
+    text[whole] = values[whole].astype(np.int64).astype(str)
+    return text
+
+def _to_text(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series.map({True: 't', False: 'f'})
+    if pd.api.types.is_float_dtype(series.dtype):
+        return pd.Series(_float_to_text(series.to_numpy(dtype=float)), index=series.index)
+    return series.astype(str)
+
+def _integer_text(value) -> str:
+    # int() is exact for any number of digits and raises on text like '1.5', whole floats are accepted
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"invalid input syntax for type integer: {value!r}")
+    return str(int(value))
+
+def _convert_integer(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return series.astype(str)
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.to_numpy(dtype=float)
+        invalid = ~np.isfinite(values) | (np.mod(values, 1) != 0) | (np.abs(values) >= 2 ** 63)
+        if invalid.any():
+            raise ValueError(f"invalid input syntax for type integer: {values[invalid][0]!r}")
+        return pd.Series(values.astype(np.int64).astype(str), index=series.index)
+    try:
+        numbers = pd.to_numeric(series)
+    except (ValueError, TypeError):
+        numbers = None
+    if numbers is not None and pd.api.types.is_integer_dtype(numbers.dtype):
+        return numbers.astype(str)
+    # Out of the int64 range, parsed as floats or invalid, int() per value is exact and raises on fractions
+    return series.map(_integer_text)
+
+def _convert_numeric(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_float_dtype(series.dtype):
+        return pd.Series(list(map(repr, series.to_numpy(dtype=float).tolist())), index=series.index)
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return series.astype(str)
+    return series.astype(str).str.strip()
+
+def _convert_boolean(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return pd.Series(np.where(series.to_numpy() != 0, 't', 'f'), index=series.index)
+    return series.astype(str).str.strip()
+
+def _make_datetime_converter(unit: str) -> Converter:
+    def convert(series: pd.Series) -> pd.Series:
+        if isinstance(series.dtype, pd.DatetimeTZDtype):
+            values = np.datetime_as_string(series.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(), unit=unit)
+            return pd.Series(np.char.add(values, '+00'), index=series.index)
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return pd.Series(np.datetime_as_string(series.to_numpy(), unit=unit), index=series.index)
+        return _to_text(series)
+    return convert
+
+def _convert_json(series: pd.Series) -> pd.Series:
+    if series.dtype == object:
+        return series.map(lambda value: value if isinstance(value, str) else json.dumps(value))
+    return _to_text(series)
+
+def compile_converter(data_type: str) -> Converter:
+    """
+    Returns a vectorized converter for a Postgres data type.
+
+    The converter maps a whole column to its text representation. Null values are
+    left as missing values so the caller can decide how to write them.
+
+    Args:
+        data_type (str): The `data_type` of the column as returned by `get_table_columns`.
+
+    Returns:
+        Converter: A function converting a pd.Series into a pd.Series of strings.
+    """
+    if data_type in INTEGER_TYPES:
+        return _convert_integer
+    if data_type in NUMERIC_TYPES:
+        return _convert_numeric
+    if data_type in BOOLEAN_TYPES:
+        return _convert_boolean
+    if data_type in DATE_TYPES:
+        return _make_datetime_converter('D')
+    if data_type in TIMESTAMP_TYPES:
+        return _make_datetime_converter('us')
+    if data_type in JSON_TYPES:
+        return _convert_json
+    return _to_text
+
+def compile_converters(selected_columns: list[tuple[str, str]]) -> list[Converter]:
+    """
+    Compiles one converter per selected column.
+
+    Args:
+        selected_columns (list[tuple[str, str]]): A list of tuples where each tuple contains a column name and its data type.
+
+    Returns:
+        list[Converter]: The converters, in the order of `selected_columns`.
+    """
+    return [compile_converter(dtype) for _, dtype in selected_columns]
+
+def convert_column(series: pd.Series, converter: Converter, null: str|None = None) -> pd.Series:
+    """
+    Converts a column to text.
+
+    Args:
+        series (pd.Series): The column to convert.
+        converter (Converter): The converter for the column data type.
+        null (str|None): The value written for nulls.
+
+    Returns:
+        pd.Series: An object series of strings, with `null` for null values.
+    """
+    mask = null_mask(series).to_numpy()
+    converted = np.full(len(series), null, dtype=object)
+    if not mask.all():
+        converted[~mask] = converter(series[~mask]).to_numpy(dtype=object)
+    return pd.Series(converted, index=series.index, dtype=object)
+
+def _escape_copy_text(values: list) -> list:
+    text = [value for value in values if value is not None]
+    joined = '\x00'.join(text)
+    if not any(character in joined for character in _COPY_SPECIAL_CHARACTERS):
+        return values
+    return [value if value is None else
+            value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+            for value in values]
+
+def encode_copy_columns(df: pd.DataFrame, selected_columns: list[tuple[str, str]], converters: list[Converter]) -> list[list[str]]:
+    """
+    Converts and escapes the selected columns of a DataFrame for the COPY text format.
+
+    Columns that are missing from the DataFrame are written as NULL.
+
+    Args:
+        df (pd.DataFrame): The rows to encode.
+        selected_columns (list[tuple[str, str]]): A list of tuples where each tuple contains a column name and its data type.
+        converters (list[Converter]): The converters from `compile_converters`.
+
+    Returns:
+        list[list[str]]: The values of each column, in the order of `selected_columns`.
+    """
+    columns: list[list[str]] = []
+    for (column, _), converter in zip(selected_columns, converters):
+        if column not in df.columns:
+            columns.append([COPY_NULL] * len(df))
+            continue
+        if df[column].dtype != object:
+            columns.append(convert_column(df[column], converter, COPY_NULL).tolist())
+            continue
+        values = _escape_copy_text(convert_column(df[column], converter).tolist())
+        columns.append([COPY_NULL if value is None else value for value in values])
+    return columns
+
+def join_copy_columns(columns: list[list[str]]) -> str:
+    """
+    Joins the values from `encode_copy_columns` into COPY text format rows.
+
+    Args:
+        columns (list[list[str]]): The encoded values of each column.
+
+    Returns:
+        str: Newline terminated, tab separated rows ready to be sent with COPY ... FROM STDIN.
+    """
+    if not columns or not columns[0]:
+        return ''
+    return '\n'.join(map('\t'.join, zip(*columns))) + '\n'
+
+def encode_copy_buffer(df: pd.DataFrame, selected_columns: list[tuple[str, str]], converters: list[Converter]) -> str:
+    """
+    Encodes the selected columns of a DataFrame as COPY text format data.
+
+    Columns that are missing from the DataFrame are written as NULL.
+
+    Args:
+        df (pd.DataFrame): The rows to encode.
+        selected_columns (list[tuple[str, str]]): A list of tuples where each tuple contains a column name and its data type.
+        converters (list[Converter]): The converters from `compile_converters`.
+
+    Returns:
+        str: Newline terminated, tab separated rows ready to be sent with COPY ... FROM STDIN.
+    """
+    if df.empty:
+        return ''
+    return join_copy_columns(encode_copy_columns(df, selected_columns, converters))
@@ -66,4 +66,113 @@ def generate_row(row, selected_columns: list[tuple[str, str]]) -> list[Any]:
             data.append(int(row[column]))
         else:
             data.append(f"'{row[column]}'")
-    return data
\ No newline at end of file
+    return data
+
+def _escape_copy_value(val: str) -> str:
+    return val.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def generate_copy_row(row, selected_columns: list[tuple[str, str]]) -> str:
+    """
+    Generate a line of COPY text format data from a row based on selected columns.
+
+    Args:
+      row (dict): A dictionary representing a row of data with column names as keys.
+      selected_columns (list[tuple[str, str]]): A list of tuples where each tuple contains a column name and its data type.
+
+    Returns:
+      str: A tab separated, newline terminated line with NULLs written as \\N.
+    """
+
+    data: list[str] = []
+    for column, dtype in selected_columns:
+        if column not in row or row[column] in [None, 'NULL']:
+            data.append("\\N")
+        elif dtype == 'bigint' or dtype == 'integer':
+            data.append(str(int(row[column])))
+        elif isinstance(row[column], float) and row[column] % 1 == 0:
+            data.append(str(int(row[column])))
+        else:
+            data.append(_escape_copy_value(str(row[column])))
+    return "\t".join(data) + "\n"
+
+def generate_copy_statement(selected_columns: list[tuple[str, str]], table: str, schema: str) -> str:
+    """
+    Generates a COPY ... FROM STDIN statement for the given columns, table, and schema.
+
+    Args:
+        selected_columns (list[tuple[str, str]]): A list of tuples where each tuple contains a column name and its data type.
+        table (str): The name of the table.
+        schema (str): The name of the schema.
+
+    Returns:
+        str: The generated COPY statement.
+    """
+    columns = ",".join(column for column, _ in selected_columns)
+    return f"COPY {schema}.{table} ({columns}) FROM STDIN WITH (FORMAT text)"
+
+def generate_prepared_insert(selected_columns: list[tuple[str, str]], table: str, schema: str) -> str:
+    """
+    Generates a parameterized INSERT statement for one row, with each parameter cast to the type of its column.
+
+    Args:
+        selected_columns (list[tuple[str, str]]): A list of tuples where each tuple contains a column name and its data type.
+        table (str): The name of the table.
+        schema (str): The name of the schema.
+
+    Returns:
+        str: The statement, with a `%s` placeholder per column.
+    """
+    columns = ",".join(column for column, _ in selected_columns)
+    values = ",".join(f"%s::{dtype}" for _, dtype in selected_columns)
+    return f"INSERT INTO {schema}.{table} ({columns}) VALUES ({values})"
+
+def generate_conflict_clause(selected_columns: list[tuple[str, str]], key_columns: list[str], action: str, table: str) -> str:
+    """
+    Generates the ON CONFLICT clause of an INSERT into a table with a unique key.
+
+    Args:
+        selected_columns (list[tuple[str, str]]): A list of tuples where each tuple contains a column name and its data type.
+        key_columns (list[str]): The columns of the unique key.
+        action (str): 'skip' to keep the rows in the table, 'update' to overwrite their other columns.
+        table (str): The name of the table, without its schema.
+
+    Returns:
+        str: The clause. Updates leave a row alone when none of its values change.
+    """
+    keys = ",".join(key_columns)
+    updated = [column for column, _ in selected_columns if column not in key_columns]
+    if action == 'skip' or not updated:
+        return f"ON CONFLICT ({keys}) DO NOTHING"
+    assignments = ",".join(f"{column}=EXCLUDED.{column}" for column in updated)
+    current = ",".join(f"{table}.{column}" for column in updated)
+    excluded = ",".join(f"EXCLUDED.{column}" for column in updated)
+    return f"ON CONFLICT ({keys}) DO UPDATE SET {assignments} WHERE ({current}) IS DISTINCT FROM ({excluded})"
+
+def generate_export_query(selected_columns: list[tuple[str, str]], table: str, schema: str, split: str|None = None, key_column: str|None = None,
+                          lower: int|None = None, upper: int|None = None) -> str:
+    """
+    Generates the SELECT of the rows of a table within a range, exported with COPY ... TO STDOUT.
+
+    Args:
+        selected_columns (list[tuple[str, str]]): A list of tuples where each tuple contains a column name and its data type.
+        table (str): The name of the table.
+        schema (str): The name of the schema.
+        split (str|None): `ctid` for a range of heap blocks, `key` for a range of `key_column` values, None for every row.
+        key_column (str|None): The integer primary key column with `key`.
+        lower (int|None): The first block or key of the range, None for no lower bound.
+        upper (int|None): The block or key the range stops before, None for no upper bound.
+
+    Returns:
+        str: The query.
+    """
+    columns = ",".join(column for column, _ in selected_columns)
+    conditions = []
+    if split == 'ctid':
+        # TID range scans read only these blocks, from PostgreSQL 14
+        conditions += [f"ctid >= '({int(lower)},0)'::tid"] if lower is not None else []
+        conditions += [f"ctid < '({int(upper)},0)'::tid"] if upper is not None else []
+    elif split == 'key':
+        conditions += [f"{key_column} >= {int(lower)}"] if lower is not None else []
+        conditions += [f"{key_column} < {int(upper)}"] if upper is not None else []
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"SELECT {columns} FROM {schema}.{table}{where}"
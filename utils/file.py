@@ -1,25 +1,52 @@
-from typing import Any
-import pandas as pd
+from typing import TYPE_CHECKING, Any
 import csv
+import hashlib
 import json
 import os
+import threading
+import time
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Bytes hashed in the fingerprint of a Parquet or Arrow file
+FINGERPRINT_BYTES = 64 * 1024
 
 # Function to log errors to a CSV file
-def log_error(error_file: str, row: pd.Series):
+def log_error(error_file: str, row: 'pd.Series', error: str|None = None):
+    is_new = not os.path.exists(error_file)
     with open(error_file, 'a', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
-        writer.writerow(row.tolist())
+        if is_new and error is not None:
+            writer.writerow([*row.index, 'error'])
+        writer.writerow(row.tolist() if error is None else [*row.tolist(), error])
 
-def save_checkpoint(file_path: str, checkpoint: int, schema: str, table: str, columns: list[tuple[str, str]]):
+def save_checkpoint(file_path: str, checkpoint: int, schema: str, table: str, columns: list[tuple[str, str]], byte_range: tuple[int, int]|None = None,
+                    offset: int|None = None, fingerprint: dict[str, Any]|None = None, prepared: list[str]|None = None):
     checkpoint_data: dict[str, Any] = {
         'checkpoint': checkpoint,
         'schema': schema,
         'table': table,
         'columns': columns
     }
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(f"{json.dumps(checkpoint_data)}\n")
+    if byte_range is not None:
+        checkpoint_data['byte_range'] = list(byte_range)
+    if offset is not None:
+        checkpoint_data['offset'] = offset
+    if fingerprint is not None:
+        checkpoint_data['fingerprint'] = fingerprint
+    if prepared:
+        checkpoint_data['prepared'] = prepared
+    _write_json_atomic(file_path, checkpoint_data)
+
+def _write_json_atomic(file_path: str, data: dict[str, Any]):
+    # Write to a temporary file and rename it, so a crash never leaves a partial file
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(f"{json.dumps(data)}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
 
 def _load_checkpoint(file_path: str) -> tuple[int, str, str, list[str], bool]:
     with open(file_path, 'r', encoding='utf-8') as f:
@@ -55,4 +82,159 @@ def load_and_confirm_checkpoint(checkpoint_file: str, schema: str, table: str) -
             print(f"Error: Invalid checkpoint file {checkpoint_file}")
             return "", "", [], -1, False
         return saved_schema, saved_table, [(col[0], col[1]) for col in saved_columns], last_checkpoint, True
-    return "", "", [], -1, False
\ No newline at end of file
+    return "", "", [], -1, False
+
+def read_checkpoint(file_path: str) -> dict[str, Any]:
+    """
+    Reads the raw content of a checkpoint file.
+
+    Returns:
+        dict[str, Any]: The checkpoint data, empty if the file is missing or invalid.
+    """
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        try:
+            return json.loads(f.read())
+        except json.JSONDecodeError:
+            return {}
+
+def file_fingerprint(csv_file: str) -> dict[str, Any]:
+    """
+    Identifies the content of a CSV file by its size, modification time and a hash of its header.
+
+    The size and modification time are those of the file itself, the header is decompressed for
+    a compressed file. For Parquet and Arrow files, the first bytes are hashed.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+
+    Returns:
+        dict[str, Any]: The fingerprint stored in checkpoints.
+    """
+    from utils.compression import detect_compression, open_input
+    from utils.reader import COLUMNAR_FORMATS, detect_format, read_header_end
+
+    stat = os.stat(csv_file)
+    file_format = detect_format(csv_file)
+    if file_format in COLUMNAR_FORMATS:
+        # Binary files have no header line, their first bytes are hashed instead
+        with open(csv_file, 'rb') as f:
+            header = f.read(FINGERPRINT_BYTES)
+    else:
+        with open_input(csv_file, detect_compression(csv_file)) as f:
+            header = f.read(read_header_end(csv_file, quotes=file_format == 'csv'))
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'header': hashlib.sha256(header).hexdigest()
+    }
+
+class Checkpointer:
+    """
+    Decides when the rows sent so far are committed and checkpointed.
+
+    Commits and checkpoints always happen together, so the checkpoint never runs ahead of or
+    behind the committed rows. They are due after `interval` seconds or `rows` rows,
+    whichever comes first.
+    """
+
+    def __init__(self, file_path: str, schema: str, table: str, columns: list[tuple[str, str]], fingerprint: dict[str, Any]|None = None,
+                 byte_range: tuple[int, int]|None = None, interval: float = 5.0, rows: int|None = None):
+        self.file_path = file_path
+        self.schema = schema
+        self.table = table
+        self.columns = columns
+        self.fingerprint = fingerprint
+        self.byte_range = byte_range
+        self.interval = interval
+        self.rows = rows
+        self.pending_rows = 0
+        self.last_save = time.monotonic()
+
+    def add(self, rows: int):
+        self.pending_rows += rows
+
+    def due(self) -> bool:
+        if self.rows and self.pending_rows >= self.rows:
+            return True
+        return time.monotonic() - self.last_save >= self.interval
+
+    def save(self, checkpoint: int, offset: int|None, prepared: list[str]|None = None):
+        save_checkpoint(self.file_path, checkpoint, self.schema, self.table, self.columns, self.byte_range, offset, self.fingerprint, prepared)
+        self.pending_rows = 0
+        self.last_save = time.monotonic()
+
+def part_checkpoint_file(checkpoint_file: str, part: int) -> str:
+    base, ext = os.path.splitext(checkpoint_file)
+    return f"{base}_part{part}{ext}"
+
+def load_part_checkpoints(checkpoint_file: str) -> list[tuple[tuple[int, int], int, int|None]]:
+    """
+    Loads the checkpoints written by the workers of a parallel load.
+
+    Args:
+        checkpoint_file (str): The path to the main checkpoint file.
+
+    Returns:
+        list[tuple[tuple[int, int], int, int|None]]: The byte range, last checkpoint and byte offset of each part,
+            in part order. Empty if the load was not a parallel one.
+    """
+    parts: list[tuple[tuple[int, int], int, int|None]] = []
+    while os.path.exists(part_checkpoint_file(checkpoint_file, len(parts))):
+        data = read_checkpoint(part_checkpoint_file(checkpoint_file, len(parts)))
+        if 'byte_range' not in data:
+            return []
+        parts.append(((data['byte_range'][0], data['byte_range'][1]), data['checkpoint'], data.get('offset')))
+    return parts
+
+def remove_part_checkpoints(checkpoint_file: str):
+    part = 0
+    while os.path.exists(part_checkpoint_file(checkpoint_file, part)):
+        os.remove(part_checkpoint_file(checkpoint_file, part))
+        part += 1
+
+class RunState:
+    """
+    The status and checkpoint of every file of a multi-file run, kept in a single JSON file.
+
+    Entries are keyed by CSV file path. Updates come from the loading threads, so they are
+    serialized and every update rewrites the file atomically.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.files: dict[str, dict[str, Any]] = read_checkpoint(file_path).get('files', {})
+        self._lock = threading.Lock()
+
+    def get(self, csv_file: str) -> dict[str, Any]:
+        with self._lock:
+            return dict(self.files.get(csv_file, {}))
+
+    def update(self, csv_file: str, **values):
+        with self._lock:
+            self.files.setdefault(csv_file, {}).update(values)
+            _write_json_atomic(self.file_path, {'files': self.files})
+
+    def remove(self, csv_file: str):
+        """
+        Forgets a file, so it is loaded again from the start.
+        """
+        with self._lock:
+            if self.files.pop(csv_file, None) is not None:
+                _write_json_atomic(self.file_path, {'files': self.files})
+
+class RunStateCheckpointer(Checkpointer):
+    """
+    A `Checkpointer` saving the checkpoint of a file into the `RunState` instead of its own file.
+    """
+
+    def __init__(self, state: RunState, csv_file: str, interval: float = 5.0, rows: int|None = None):
+        super().__init__(state.file_path, '', '', [], interval=interval, rows=rows)
+        self.state = state
+        self.csv_file = csv_file
+
+    def save(self, checkpoint: int, offset: int|None):
+        self.state.update(self.csv_file, checkpoint=checkpoint, offset=offset)
+        self.pending_rows = 0
+        self.last_save = time.monotonic()
@@ -0,0 +1,204 @@
+import math
+import threading
+from typing import Collection
+import numpy as np
+import pandas as pd
+
+from utils.convert import Converter, convert_column
+
+
+def hash_text_columns(columns: list[list[str|None]]) -> np.ndarray:
+    """
+    Hashes rows given as columns of text values, the way they are sent to Postgres.
+
+    Args:
+        columns (list[list[str|None]]): The text value of every row in each column, None for nulls.
+
+    Returns:
+        np.ndarray: A 64-bit hash per row. A null hashes apart from every string, the empty one included.
+    """
+    frame = pd.DataFrame({i: pd.Series(values, dtype=object) for i, values in enumerate(columns)})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+class HashKeyIndex:
+    """
+    A set of 64-bit row hashes, 8 bytes per row.
+
+    The hashes are kept in sorted runs, searched with binary search. A new batch of hashes is
+    a run of its own, merged with the last run as long as that one is not larger, so runs at least
+    double in size from last to first and there are at most about log2(rows) of them.
+    """
+
+    def __init__(self):
+        self.runs: list[np.ndarray] = []
+
+    def add(self, hashes: np.ndarray):
+        if not len(hashes):
+            return
+        run = np.unique(hashes)
+        while self.runs and len(self.runs[-1]) <= len(run):
+            run = np.union1d(self.runs.pop(), run)
+        self.runs.append(run)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Returns a mask of the hashes in the index.
+        """
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[positions] == hashes
+        return found
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(run.nbytes for run in self.runs)
+
+class BloomKeyIndex:
+    """
+    A Bloom filter of 64-bit row hashes, for tables too large to index every hash.
+
+    It is sized for `capacity` rows with a false positive rate of `error_rate`, about 29 bits per
+    row for one in a million. It never misses a hash that was added, but reports a hash that was not
+    added as present at about that rate once it holds `capacity` rows.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, hashes: np.ndarray) -> list[np.ndarray]:
+        # Double hashing, the i-th bit of a hash is h1 + i * h2 with h2 the hash rotated by 32 bits
+        step = ((hashes >> np.uint64(32)) | (hashes << np.uint64(32))) | np.uint64(1)
+        return [(hashes + np.uint64(i) * step) % np.uint64(self.size) for i in range(self.hash_count)]
+
+    def add(self, hashes: np.ndarray):
+        for positions in self._positions(hashes):
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(hashes)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Returns a mask of the hashes that are probably in the index.
+        """
+        found = np.ones(len(hashes), dtype=bool)
+        for positions in self._positions(hashes):
+            found &= (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1 == 1
+        return found
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+def create_key_index(kind: str, capacity: int = 0, error_rate: float = 1e-6) -> HashKeyIndex|BloomKeyIndex:
+    """
+    Creates an empty key index.
+
+    Args:
+        kind (str): Either 'hash' for a `HashKeyIndex` or 'bloom' for a `BloomKeyIndex`.
+        capacity (int): The number of rows a Bloom filter is sized for.
+        error_rate (float): The false positive rate of a Bloom filter.
+
+    Returns:
+        HashKeyIndex|BloomKeyIndex: The index.
+    """
+    if kind == 'bloom':
+        return BloomKeyIndex(capacity, error_rate)
+    return HashKeyIndex()
+
+class KeyFilter:
+    """
+    Drops the rows of a batch that are already in the table, before they are sent.
+
+    With the 'skip' action, the index holds the hashes of the keys in the table, and a row whose
+    key is there is dropped. With the 'update' action, it holds the hashes of whole rows, and only
+    a row identical to one in the table is dropped, a changed row is sent to update it. Rows are
+    compared on the text form they are sent in. Within a batch, one row is kept per key, the first
+    for 'skip' and the last for 'update', as `ON CONFLICT` cannot change a row twice in a statement.
+    Rows with a null key are always sent, they never conflict.
+
+    The rows that are kept are added to the index with `add_sent` once they are sent, so a key that
+    comes again later in the file is dropped as well with 'skip', while a row that failed and was
+    skipped does not hide a later row with its key. With 'update', a key kept once is not dropped
+    anymore, as the row in the table may no longer match the hash preloaded for it. Keys are marked
+    as kept right away, which can only cause more rows to be sent.
+    """
+
+    def __init__(self, selected_columns: list[tuple[str, str]], key_columns: list[str], action: str, index: HashKeyIndex|BloomKeyIndex):
+        names = [column for column, _ in selected_columns]
+        self.selected_columns = selected_columns
+        self.key_columns = key_columns
+        self.action = action
+        self.index = index
+        self.key_positions = [names.index(column) for column in key_columns]
+        self.sent_keys = HashKeyIndex() if action == 'update' else None
+        # Batches may be filtered in one thread while the rows sent are added in another
+        self.lock = threading.Lock()
+
+    @property
+    def indexed_columns(self) -> list[str]:
+        """
+        The columns whose text values make up the hashes of the index, in order.
+        """
+        return self.key_columns if self.action == 'skip' else [column for column, _ in self.selected_columns]
+
+    def add_existing(self, rows: list[tuple[str|None, ...]]):
+        """
+        Adds rows of the table, with the text values of `indexed_columns`, to the index.
+        """
+        if rows:
+            self.index.add(hash_text_columns([list(column) for column in zip(*rows)]))
+
+    def filter(self, rows: pd.DataFrame, converters: list[Converter]) -> tuple[pd.DataFrame, pd.Series]:
+        """
+        Returns the rows of a batch that have to be sent, and the hashes to add to the index once they are.
+
+        Args:
+            rows (pd.DataFrame): The rows of the batch.
+            converters (list[Converter]): The converters of the selected columns.
+
+        Returns:
+            tuple[pd.DataFrame, pd.Series]: The rows to send, with their original index, and the hashes of
+                those with a key, indexed by their row, for `add_sent`.
+        """
+        texts = [convert_column(rows[column], converter).tolist() if column in rows.columns else [None] * len(rows)
+                 for (column, _), converter in zip(self.selected_columns, converters)]
+        keys = [texts[position] for position in self.key_positions]
+        has_key = ~np.any([pd.isna(pd.Series(values, dtype=object)).to_numpy() for values in keys], axis=0)
+        key_hashes = hash_text_columns(keys)
+        with self.lock:
+            if self.action == 'skip':
+                hashes = key_hashes
+                known = self.index.contains(hashes)
+                duplicate = pd.Series(key_hashes).duplicated(keep='first').to_numpy()
+            else:
+                hashes = hash_text_columns(texts)
+                known = self.index.contains(hashes) & ~self.sent_keys.contains(key_hashes)
+                duplicate = pd.Series(key_hashes).duplicated(keep='last').to_numpy()
+            keep = ~((known | duplicate) & has_key)
+            added = keep & has_key
+            if self.sent_keys is not None:
+                self.sent_keys.add(key_hashes[added])
+        return rows[keep], pd.Series(hashes[added], index=rows.index[added])
+
+    def add_sent(self, hashes: pd.Series, failed_rows: Collection = ()):
+        """
+        Adds the hashes returned by `filter` to the index once their rows are sent.
+
+        Args:
+            hashes (pd.Series): The hashes from `filter`.
+            failed_rows (Collection): The rows that failed and were skipped, left out of the index.
+        """
+        if len(failed_rows):
+            hashes = hashes.drop(failed_rows, errors='ignore')
+        with self.lock:
+            self.index.add(hashes.to_numpy())
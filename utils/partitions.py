@@ -0,0 +1,266 @@
+import re
+from typing import Any
+import numpy as np
+import pandas as pd
+
+from utils.convert import BOOLEAN_TYPES, DATE_TYPES, INTEGER_TYPES, NUMERIC_TYPES, TIMESTAMP_TYPES, Converter, convert_column
+
+# Key types whose values can be ordered on the client, range partitions of other types are left to the server
+RANGE_TYPES = INTEGER_TYPES + NUMERIC_TYPES + DATE_TYPES + TIMESTAMP_TYPES
+# Integers above this lose precision as floats
+_MAX_EXACT_FLOAT = 2 ** 53
+_TRUE_VALUES = {'t', 'tr', 'tru', 'true', 'y', 'ye', 'yes', 'on', '1'}
+_FALSE_VALUES = {'f', 'fa', 'fal', 'fals', 'false', 'n', 'no', 'of', 'off', '0'}
+
+_BOUND_TOKEN = re.compile(r"\s*(?:'((?:[^']|'')*)'|(MINVALUE|MAXVALUE|NULL|true|false)|(-?[0-9][0-9.e+-]*))\s*,?", re.IGNORECASE)
+_RANGE_BOUND = re.compile(r'^FOR VALUES FROM \((.*)\) TO \((.*)\)$', re.DOTALL)
+_LIST_BOUND = re.compile(r'^FOR VALUES IN \((.*)\)$', re.DOTALL)
+_TIME_ZONE_OFFSET = r'(?:\s*(?:Z|[+-]\d{1,2}(?::?\d{2}){0,2}))$'
+
+MINVALUE = 'MINVALUE'
+MAXVALUE = 'MAXVALUE'
+
+
+def _parse_bound_values(values: str) -> list[str|None]:
+    parsed: list[str|None] = []
+    position = 0
+    while position < len(values):
+        match = _BOUND_TOKEN.match(values, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Cannot parse partition bound values {values}")
+        text, keyword, number = match.groups()
+        if text is not None:
+            parsed.append(text.replace("''", "'"))
+        elif keyword is not None:
+            keyword = keyword.upper()
+            parsed.append(None if keyword == 'NULL' else {'TRUE': 't', 'FALSE': 'f'}.get(keyword, keyword))
+        else:
+            parsed.append(number)
+        position = match.end()
+    return parsed
+
+def parse_partition_bound(bound: str) -> dict[str, Any]:
+    """
+    Parses a partition bound, as written by `pg_get_expr` on `pg_class.relpartbound`.
+
+    `FOR VALUES FROM ('2024-01-01') TO ('2024-02-01')` becomes
+    `{'kind': 'range', 'from': ['2024-01-01'], 'to': ['2024-02-01']}`, `FOR VALUES IN ('a', NULL)`
+    becomes `{'kind': 'list', 'values': ['a', None]}`. Values are kept as text, with `MINVALUE`
+    and `MAXVALUE` for unbounded ranges.
+
+    Args:
+        bound (str): The partition bound.
+
+    Returns:
+        dict[str, Any]: The bound, of kind 'range', 'list', 'hash' or 'default'.
+
+    Raises:
+        ValueError: If the bound cannot be parsed.
+    """
+    bound = bound.strip()
+    if bound == 'DEFAULT':
+        return {'kind': 'default'}
+    if bound.startswith('FOR VALUES WITH'):
+        return {'kind': 'hash'}
+    match = _RANGE_BOUND.match(bound)
+    if match:
+        return {'kind': 'range', 'from': _parse_bound_values(match.group(1)), 'to': _parse_bound_values(match.group(2))}
+    match = _LIST_BOUND.match(bound)
+    if match:
+        return {'kind': 'list', 'values': _parse_bound_values(match.group(1))}
+    raise ValueError(f"Cannot parse partition bound {bound}")
+
+def _datetime_values(text: pd.Series, key_type: str, time_zone: str) -> np.ndarray:
+    # Nanoseconds since the epoch, in UTC for timestamps with time zone, with the smallest int64 for values that cannot be parsed
+    if key_type == 'timestamp with time zone' and time_zone in ('UTC', 'Etc/UTC', 'GMT'):
+        # Values without an offset are in UTC as well
+        values = pd.to_datetime(text, format='ISO8601', errors='coerce', utc=True).dt.tz_localize(None).dt.round('us')
+        return values.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    # Only the values with a sign or a Z after the date are matched against the offset pattern
+    has_offset = ((text.str.rfind('-') > 9) | text.str.contains('+', regex=False) | text.str.endswith('Z')).to_numpy()
+    if has_offset.any():
+        has_offset[has_offset] = text[has_offset].str.contains(_TIME_ZONE_OFFSET, regex=True).to_numpy()
+    wall = text.copy()
+    if has_offset.any():
+        wall[has_offset] = text[has_offset].str.replace(_TIME_ZONE_OFFSET, '', regex=True)
+    if key_type == 'timestamp with time zone':
+        values = pd.Series(pd.NaT, index=text.index, dtype='datetime64[ns, UTC]')
+        if has_offset.any():
+            values[has_offset] = pd.to_datetime(text[has_offset], format='ISO8601', errors='coerce', utc=True)
+        if not has_offset.all():
+            # Values without an offset are in the time zone of the session, like the server reads them
+            local = pd.to_datetime(wall[~has_offset], format='ISO8601', errors='coerce')
+            values[~has_offset] = local.dt.tz_localize(time_zone, ambiguous='NaT', nonexistent='NaT').dt.tz_convert('UTC')
+        values = values.dt.tz_localize(None)
+    else:
+        # The offset of a timestamp without time zone is ignored, a date drops its time
+        values = pd.to_datetime(wall, format='ISO8601', errors='coerce')
+    values = values.dt.floor('D') if key_type in DATE_TYPES else values.dt.round('us')
+    return values.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+def comparable_values(text: pd.Series, key_type: str, time_zone: str = 'UTC') -> tuple[np.ndarray, np.ndarray]:
+    """
+    Maps the text values of a partition key to values that compare like they do in Postgres.
+
+    Numbers become floats and dates and timestamps nanoseconds since the epoch. Values that
+    cannot be compared exactly on the client are left out, such as integers too large for a float,
+    special values like `infinity`, or dates outside the range pandas handles.
+
+    Args:
+        text (pd.Series): The text values, None for nulls.
+        key_type (str): The data type of the partition key, one of `RANGE_TYPES`.
+        time_zone (str): The `TimeZone` of the session, for timestamps with time zone written without an offset.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The comparable values and a mask of those that are valid.
+    """
+    text = text.astype(object)
+    if key_type in DATE_TYPES + TIMESTAMP_TYPES:
+        values = _datetime_values(text.fillna('').astype(str).str.strip(), key_type, time_zone)
+        return values, values != np.iinfo(np.int64).min
+    values = pd.to_numeric(text, errors='coerce').to_numpy(dtype=float)
+    valid = np.isfinite(values)
+    if key_type in INTEGER_TYPES:
+        valid &= np.abs(np.nan_to_num(values)) < _MAX_EXACT_FLOAT
+    return values, valid
+
+class PartitionRouter:
+    """
+    Routes rows to the partitions of a range or list partitioned table, from the value of their key.
+
+    Keys are compared on the text form the rows are sent in. Range partitions are found with a
+    binary search over their lower bounds. List partitions are matched on the text of their values,
+    or, for numbers, dates and timestamps, on their comparable values. Rows whose partition cannot be
+    determined on the client are routed to the parent table, which routes them on the server. These
+    are the rows of the default partition, rows with a null key unless a list partition holds nulls,
+    and rows with values that cannot be compared exactly. For floats, rows equal to a range bound
+    go to the parent too, as they may fall on either side of it.
+
+    Args:
+        strategy (str): Either 'range' or 'list'.
+        key_column (str): The partition key column.
+        key_type (str): The data type of the key column.
+        partitions (list[dict[str, Any]]): The partitions, with their `schema`, `table` and `bound`, as
+            returned by `db.get_partitioning`.
+        time_zone (str): The `TimeZone` of the session, in which the bounds are written.
+    """
+
+    def __init__(self, strategy: str, key_column: str, key_type: str, partitions: list[dict[str, Any]], time_zone: str = 'UTC'):
+        self.strategy = strategy
+        self.key_column = key_column
+        self.key_type = key_type
+        self.time_zone = time_zone
+        bounds = [(partition, parse_partition_bound(partition['bound'])) for partition in partitions]
+        bounds = [(partition, bound) for partition, bound in bounds if bound['kind'] == strategy]
+        self.partitions = [(partition['schema'], partition['table']) for partition, _ in bounds]
+        if strategy == 'range':
+            self._init_range([bound for _, bound in bounds])
+        else:
+            self._init_list([bound for _, bound in bounds])
+
+    def _comparable_bound(self, values: list[str|None]) -> tuple[np.ndarray, np.ndarray]:
+        return comparable_values(pd.Series(values, dtype=object), self.key_type, self.time_zone)
+
+    def _init_range(self, bounds: list[dict[str, Any]]):
+        low = -np.inf if self.key_type not in DATE_TYPES + TIMESTAMP_TYPES else np.iinfo(np.int64).min + 1
+        high = np.inf if low == -np.inf else np.iinfo(np.int64).max
+        lowers, lowers_valid = self._comparable_bound([bound['from'][0] for bound in bounds])
+        uppers, uppers_valid = self._comparable_bound([bound['to'][0] for bound in bounds])
+        for i, bound in enumerate(bounds):
+            if bound['from'][0] == MINVALUE:
+                lowers[i], lowers_valid[i] = low, True
+            if bound['to'][0] == MAXVALUE:
+                uppers[i], uppers_valid[i] = high, True
+        # Partitions with bounds that cannot be compared are left to the server
+        usable = np.flatnonzero(lowers_valid & uppers_valid)
+        order = usable[np.argsort(lowers[usable], kind='stable')]
+        self.targets = order
+        self.lowers = lowers[order]
+        self.uppers = uppers[order]
+        self.float_bounds = np.concatenate((self.lowers, self.uppers)) if self.key_type in NUMERIC_TYPES else None
+
+    def _init_list(self, bounds: list[dict[str, Any]]):
+        self.null_target = -1
+        self.text_targets: dict[str, int] = {}
+        for target, bound in enumerate(bounds):
+            for value in bound['values']:
+                if value is None:
+                    self.null_target = target
+                else:
+                    self.text_targets[self._canonical_text(pd.Series([value], dtype=object)).iloc[0]] = target
+        self.comparable = self.key_type in RANGE_TYPES
+        if self.comparable:
+            values, valid = self._comparable_bound(list(self.text_targets))
+            self.value_index = pd.Index(values[valid])
+            self.value_targets = np.array(list(self.text_targets.values()), dtype=np.int64)[valid]
+
+    def _canonical_text(self, text: pd.Series) -> pd.Series:
+        if self.key_type in BOOLEAN_TYPES:
+            lower = text.str.strip().str.lower()
+            return lower.map(lambda value: 't' if value in _TRUE_VALUES else 'f' if value in _FALSE_VALUES else value)
+        if self.key_type == 'character':
+            return text.str.rstrip(' ') # Trailing spaces of char(n) values are not significant
+        return text
+
+    def route(self, rows: pd.DataFrame, converter: Converter) -> np.ndarray:
+        """
+        Finds the partition of every row.
+
+        Args:
+            rows (pd.DataFrame): The rows, with the key column.
+            converter (Converter): The converter of the key column.
+
+        Returns:
+            np.ndarray: The position of the partition of each row in `partitions`, -1 for the parent table.
+        """
+        text = convert_column(rows[self.key_column], converter)
+        nulls = text.isna().to_numpy()
+        if self.strategy == 'range':
+            values, valid = comparable_values(text, self.key_type, self.time_zone)
+            if self.float_bounds is not None:
+                valid &= ~np.isin(values, self.float_bounds)
+            position = np.searchsorted(self.lowers, values, side='right') - 1
+            inside = valid & (position >= 0)
+            inside[inside] &= values[inside] < self.uppers[position[inside]]
+            targets = np.full(len(rows), -1, dtype=np.int64)
+            targets[inside] = self.targets[position[inside]]
+            return targets
+        targets = self._canonical_text(text.fillna('')).map(self.text_targets).fillna(-1).to_numpy(dtype=np.int64)
+        if self.comparable and len(self.value_index):
+            missed = (targets < 0) & ~nulls
+            values, valid = comparable_values(text[missed], self.key_type, self.time_zone)
+            found = self.value_index.get_indexer(values)
+            found[~valid] = -1
+            targets[np.flatnonzero(missed)[found >= 0]] = self.value_targets[found[found >= 0]]
+        targets[nulls] = self.null_target
+        return targets
+
+def create_partition_router(partitioning: dict[str, Any], selected_columns: list[tuple[str, str]]) -> PartitionRouter:
+    """
+    Creates the router of a partitioned table, for the columns loaded from the file.
+
+    Args:
+        partitioning (dict[str, Any]): The partitioning of the table, from `db.get_partitioning`.
+        selected_columns (list[tuple[str, str]]): The columns loaded from the file.
+
+    Returns:
+        PartitionRouter: The router.
+
+    Raises:
+        ValueError: If the rows cannot be routed on the client, with the reason.
+    """
+    strategy, key_columns = partitioning['strategy'], partitioning['key_columns']
+    if strategy == 'hash':
+        raise ValueError("hash partitions are routed with the hash functions of the server")
+    if len(key_columns) != 1 or key_columns[0] is None:
+        raise ValueError("only partition keys of a single column are routed")
+    types = dict(selected_columns)
+    key_column = key_columns[0]
+    if key_column not in types:
+        raise ValueError(f"the partition key column {key_column} is not loaded")
+    if strategy == 'range' and types[key_column] not in RANGE_TYPES:
+        raise ValueError(f"range partitions on {types[key_column]} values are compared with the collations or operators of the server")
+    router = PartitionRouter(strategy, key_column, types[key_column], partitioning['partitions'], partitioning.get('time_zone', 'UTC'))
+    if not router.partitions:
+        raise ValueError("no partition has bounds that can be compared on the client")
+    return router
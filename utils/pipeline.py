@@ -0,0 +1,64 @@
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+_DONE = object()
+# Seconds a blocked stage waits before checking whether the consumer is gone
+_POLL_INTERVAL = 0.1
+
+
+def _put(handoff: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            handoff.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def threaded(items: Iterable[T], maxsize: int) -> Iterator[T]:
+    """
+    Produces items in a background thread, handing them over through a bounded queue.
+
+    The producer runs at most `maxsize` items ahead of the consumer, which blocks it when the
+    consumer falls behind. An exception raised by the producer is raised again in the consumer.
+    When the consumer stops early, the producer stops at its next item and `items` is closed.
+
+    Args:
+        items (Iterable[T]): The items to produce, such as a generator doing the work of a stage.
+        maxsize (int): The number of items buffered between the two threads.
+
+    Yields:
+        T: The items, in order.
+    """
+    handoff: queue.Queue = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if not _put(handoff, (item, None), stop):
+                    return
+            _put(handoff, (_DONE, None), stop)
+        except BaseException as e:
+            _put(handoff, (_DONE, e), stop)
+        finally:
+            close = getattr(items, 'close', None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = handoff.get()
+            if item is _DONE:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
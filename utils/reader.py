@@ -0,0 +1,326 @@
+import io
+import json
+import os
+from typing import Callable, Iterator
+import numpy as np
+import pandas as pd
+
+from utils.compression import detect_compression, input_position, open_input, strip_compression_extension
+
+# Rough number of copies of a chunk alive at once while it is cleaned and converted
+CHUNK_MEMORY_FACTOR = 3
+# Size of the blocks scanned when looking for row boundaries
+SCAN_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Rows of a newline-delimited JSON file whose keys make up its columns
+HEADER_SAMPLE_ROWS = 1000
+# Input formats by file extension, after removing a compression extension. Other files are read as CSV
+FORMATS = {'.parquet': 'parquet', '.pq': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+# Formats read with pyarrow, whose positions are row counts rather than byte offsets
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+_QUOTE = ord('"')
+_NEWLINE = ord('\n')
+
+def detect_format(file_path: str) -> str:
+    """
+    Detects the format of an input file from its extension, `csv`, `ndjson`, `parquet` or `arrow`.
+    """
+    return FORMATS.get(os.path.splitext(strip_compression_extension(file_path))[1].lower(), 'csv')
+
+def read_header(file_path: str) -> pd.DataFrame:
+    """
+    Reads the columns of an input file of any format, without its rows.
+
+    The columns of a newline-delimited JSON file are the keys of its first objects, in the order they
+    first appear. Keys that only appear later in the file are not loaded.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        pd.DataFrame: An empty DataFrame with the columns of the file.
+    """
+    file_format = detect_format(file_path)
+    if file_format in COLUMNAR_FORMATS:
+        from utils.columnar import read_columnar_header
+        return read_columnar_header(file_path, file_format)
+    if file_format == 'ndjson':
+        names: dict[str, None] = {}
+        with open_input(file_path, detect_compression(file_path)) as f:
+            block = f.read(SCAN_BLOCK_SIZE)
+        lines = block.split(b'\n')
+        if len(block) == SCAN_BLOCK_SIZE and len(lines) > 1:
+            lines.pop() # The last line may be cut
+        for line in lines[:HEADER_SAMPLE_ROWS]:
+            if line.strip():
+                names.update(dict.fromkeys(json.loads(line)))
+        return pd.DataFrame(columns=list(names))
+    return read_csv_header(file_path)
+
+def read_csv_header(csv_file: str) -> pd.DataFrame:
+    """
+    Reads only the header of the CSV file, which may be compressed.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+
+    Returns:
+        pd.DataFrame: An empty DataFrame with the CSV columns.
+    """
+    return pd.read_csv(csv_file, nrows=0, compression=detect_compression(csv_file))
+
+def estimate_chunk_rows(csv_file: str, max_memory: int, sample_rows: int = 1000) -> int:
+    """
+    Estimates how many rows can be read per chunk while staying under a memory budget.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        max_memory (int): The memory budget in bytes.
+        sample_rows (int): The number of rows sampled to measure the in-memory row size.
+
+    Returns:
+        int: The number of rows per chunk, at least 1.
+    """
+    if detect_format(csv_file) == 'csv':
+        sample = pd.read_csv(csv_file, nrows=sample_rows, compression=detect_compression(csv_file))
+    else:
+        sample = next(read_chunks(csv_file, sample_rows), (pd.DataFrame(),))[0]
+    if sample.empty:
+        return 1
+    row_size = sample.memory_usage(deep=True).sum() / len(sample)
+    return max(1, int(max_memory / (row_size * CHUNK_MEMORY_FACTOR)))
+
+def find_row_ends(block: bytes, in_quotes: bool = False, quotes: bool = True) -> tuple[np.ndarray, bool]:
+    """
+    Finds the end of every CSV row in a block of bytes.
+
+    A newline only ends a row when it is outside a quoted field. Doubled quotes inside a
+    quoted field toggle the state twice, so they need no special handling.
+
+    Args:
+        block (bytes): The bytes to scan.
+        in_quotes (bool): Whether the block starts inside a quoted field.
+        quotes (bool): Whether newlines can be quoted, without it every newline ends a row as in
+            newline-delimited JSON.
+
+    Returns:
+        tuple[np.ndarray, bool]: The offsets in the block just past each row ending newline,
+            and whether the block ends inside a quoted field.
+    """
+    if not block:
+        return np.empty(0, dtype=np.int64), in_quotes
+    data = np.frombuffer(block, dtype=np.uint8)
+    if quotes is False:
+        return np.flatnonzero(data == _NEWLINE) + 1, False
+    quoted = np.logical_xor.accumulate(data == _QUOTE)
+    if in_quotes:
+        quoted = ~quoted
+    ends = np.flatnonzero((data == _NEWLINE) & ~quoted) + 1
+    return ends, bool(quoted[-1])
+
+def split_byte_ranges(csv_file: str, parts: int) -> list[tuple[int, int]]:
+    """
+    Splits the rows of a CSV or newline-delimited JSON file into byte ranges of roughly equal size.
+
+    Every range starts at the beginning of a row and ends just past a row ending newline,
+    so quoted fields with embedded newlines are never cut. The header row is excluded.
+    The file is scanned once to track the quoting state up to each split point.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        parts (int): The number of ranges wanted.
+
+    Returns:
+        list[tuple[int, int]]: Non-empty `(start, end)` byte ranges covering every data row.
+
+    Raises:
+        ValueError: If the file is compressed, as it can only be read from the start, or columnar.
+    """
+    file_format = detect_format(csv_file)
+    if file_format in COLUMNAR_FORMATS:
+        raise ValueError(f"{file_format.capitalize()} file {csv_file} cannot be split into byte ranges")
+    if detect_compression(csv_file):
+        raise ValueError(f"Compressed file {csv_file} cannot be split into byte ranges")
+    header = file_format == 'csv'
+    with open(csv_file, 'rb') as f:
+        size = f.seek(0, io.SEEK_END)
+        f.seek(0)
+        boundaries: list[int] = []
+        targets: list[int] = []
+        if not header and size:
+            boundaries.append(0)
+            targets = [int(size / parts * i) for i in range(1, parts)]
+        in_quotes = False
+        offset = 0
+        while True:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            ends, in_quotes = find_row_ends(block, in_quotes, quotes=header)
+            ends += offset
+            if not boundaries and len(ends):
+                # The first row end closes the header, the data is split evenly after it
+                boundaries.append(int(ends[0]))
+                step = (size - boundaries[0]) / parts
+                targets = [boundaries[0] + int(step * i) for i in range(1, parts)]
+            while targets and len(ends):
+                position = int(np.searchsorted(ends, targets[0]))
+                if position == len(ends):
+                    break
+                boundaries.append(int(ends[position]))
+                targets.pop(0)
+            offset += len(block)
+    if not boundaries:
+        return []
+    boundaries.append(size)
+    boundaries = sorted(set(boundaries))
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:])]
+
+def read_header_end(csv_file: str, quotes: bool = True) -> int:
+    """
+    Finds the byte offset of the first data row, just past the header.
+
+    Args:
+        csv_file (str): The path to the CSV file, offsets in a compressed file are in its decompressed content.
+        quotes (bool): Whether newlines can be quoted, False to find the end of the first line of any text file.
+
+    Returns:
+        int: The offset of the first data row, or the file size if there is none.
+    """
+    with open_input(csv_file, detect_compression(csv_file)) as f:
+        in_quotes = False
+        offset = 0
+        while True:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                return offset
+            ends, in_quotes = find_row_ends(block, in_quotes, quotes)
+            if len(ends):
+                return offset + int(ends[0])
+            offset += len(block)
+
+def _parse_rows(data: bytes|memoryview, ends: np.ndarray, names: list[str], first_row: int, file_format: str = 'csv') -> tuple[pd.DataFrame, np.ndarray]:
+    # pd.read_csv and pd.read_json skip blank lines, so their ends are dropped to keep one end per row
+    starts = np.concatenate(([0], ends[:-1]))
+    lengths = ends - starts
+    content = np.frombuffer(data, dtype=np.uint8)
+    blank = (lengths == 1) | ((lengths == 2) & (content[np.minimum(starts, len(content) - 1)] == ord('\r')))
+    ends = ends[~blank]
+    if not len(ends):
+        return pd.DataFrame(columns=names), ends
+    if file_format == 'ndjson':
+        # Values keep their JSON types and strings are not parsed as dates. Keys missing from a row are nulls
+        chunk = pd.read_json(io.BytesIO(data), lines=True, dtype=False, convert_dates=False).reindex(columns=names)
+    else:
+        chunk = pd.read_csv(io.BytesIO(data), header=None, names=names)
+    if len(chunk) != len(ends):
+        raise ValueError(f"Could not split rows {first_row}-{first_row + len(ends) - 1} on row boundaries, "
+                         "check for quote characters inside unquoted fields")
+    chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+    return chunk, ends
+
+def read_csv_chunks(csv_file: str, chunk_rows: int, byte_range: tuple[int, int]|None = None, offset: int|None = None,
+                    first_row: int = 0, on_read: Callable[[int], None]|None = None) -> Iterator[tuple[pd.DataFrame, np.ndarray]]:
+    """
+    Streams the CSV file in chunks of at most `chunk_rows` rows.
+
+    The file is read in blocks and cut on row boundaries, so the byte offset of every row is
+    known. The index of the chunks counts rows from `first_row`. A compressed file is
+    decompressed in a background thread, and its offsets are in the decompressed content.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        chunk_rows (int): The maximum number of rows per chunk.
+        byte_range (tuple[int, int]|None): The `(start, end)` byte range from `split_byte_ranges`,
+            the whole file when None.
+        offset (int|None): The byte offset to start reading at, such as a checkpoint offset.
+            Defaults to the start of the range or the first data row.
+        first_row (int): The row number of the first row read.
+        on_read (Callable[[int], None]|None): Called with the position in the file itself after every
+            block read, which for a compressed file is the number of compressed bytes read.
+
+    Yields:
+        tuple[pd.DataFrame, np.ndarray]: The chunk and, for each of its rows, the byte offset
+            in the file just past the row.
+    """
+    return _read_text_chunks(csv_file, 'csv', chunk_rows, byte_range, offset, first_row, on_read)
+
+def _read_text_chunks(file_path: str, file_format: str, chunk_rows: int, byte_range: tuple[int, int]|None, offset: int|None,
+                      first_row: int, on_read: Callable[[int], None]|None) -> Iterator[tuple[pd.DataFrame, np.ndarray]]:
+    header = file_format == 'csv'
+    names = list(read_header(file_path).columns)
+    start, end = byte_range if byte_range else (read_header_end(file_path) if header else 0, None)
+    position = offset if offset is not None else start
+    with open_input(file_path, detect_compression(file_path)) as f:
+        f.seek(position)
+        # Rows not parsed yet start at `consumed` in `data`, followed by the blocks read since it was joined.
+        # Chunks are cut from `data` without copying the rest, it is joined again once new blocks are needed
+        data = memoryview(b'')
+        consumed = 0
+        blocks: list[bytes] = []
+        size = 0
+        ends = np.empty(0, dtype=np.int64)
+        in_quotes = False
+        while True:
+            block = f.read(SCAN_BLOCK_SIZE if end is None else min(SCAN_BLOCK_SIZE, end - position - size))
+            if on_read:
+                on_read(input_position(f))
+            if block:
+                block_ends, in_quotes = find_row_ends(block, in_quotes, quotes=header)
+                ends = np.concatenate((ends, block_ends + size))
+                blocks.append(block)
+                size += len(block)
+            if not block and size and (not len(ends) or ends[-1] != size):
+                # The last row has no trailing newline
+                ends = np.append(ends, size)
+            while len(ends) >= chunk_rows or (not block and len(ends)):
+                cut = int(ends[min(chunk_rows, len(ends)) - 1])
+                if blocks:
+                    data = memoryview(b''.join([data[consumed:], *blocks]))
+                    consumed, blocks = 0, []
+                chunk, chunk_ends = _parse_rows(data[consumed:consumed + cut], ends[:chunk_rows], names, first_row, file_format)
+                consumed += cut
+                size -= cut
+                ends = ends[chunk_rows:] - cut
+                if len(chunk):
+                    yield chunk, chunk_ends + position
+                first_row += len(chunk)
+                position += cut
+            if not block:
+                return
+
+def read_chunks(file_path: str, chunk_rows: int, byte_range: tuple[int, int]|None = None, offset: int|None = None,
+                first_row: int = 0, on_read: Callable[[int], None]|None = None,
+                columns: list[str]|None = None) -> Iterator[tuple[pd.DataFrame, np.ndarray]]:
+    """
+    Streams an input file of any format in chunks of at most `chunk_rows` rows.
+
+    CSV and newline-delimited JSON files are read as in `read_csv_chunks`, with byte offsets as
+    positions. Parquet and Arrow IPC files are read by record batch with `read_columnar_chunks`,
+    only the `columns` are read and positions are row counts.
+
+    Args:
+        file_path (str): The path to the file.
+        chunk_rows (int): The maximum number of rows per chunk.
+        byte_range (tuple[int, int]|None): The `(start, end)` byte range from `split_byte_ranges`,
+            the whole file when None. Not supported for Parquet and Arrow files.
+        offset (int|None): The position to start reading at, such as a checkpoint position.
+        first_row (int): The row number of the first row read, the offset itself for Parquet and Arrow files.
+        on_read (Callable[[int], None]|None): Called with the position in the file itself as it is read.
+        columns (list[str]|None): The columns needed, all of them when None. Those not in the file are
+            left out. Text formats are parsed whole and the other columns dropped.
+
+    Yields:
+        tuple[pd.DataFrame, np.ndarray]: The chunk, indexed by row number, and the position just past each of its rows.
+    """
+    file_format = detect_format(file_path)
+    if columns is not None:
+        names = set(read_header(file_path).columns)
+        columns = [column for column in columns if column in names]
+    if file_format in COLUMNAR_FORMATS:
+        from utils.columnar import read_columnar_chunks
+        yield from read_columnar_chunks(file_path, file_format, chunk_rows, offset, columns, on_read)
+        return
+    for chunk, ends in _read_text_chunks(file_path, file_format, chunk_rows, byte_range, offset, first_row, on_read):
+        yield (chunk if columns is None else chunk[columns]), ends
@@ -0,0 +1,149 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+
+class RunStats:
+    """
+    Collects the wall and CPU time spent in each stage of a load, and counters such as rows and bytes.
+
+    CPU time is the time of the calling thread, so stages running in other threads are not counted twice.
+    Threads may share one instance, its totals are updated under a lock. With `interval` set, a line with the totals so far is written to stderr at most every `interval` seconds.
+    """
+
+    def __init__(self, interval: float|None = None, label: str = ''):
+        self.started = time.perf_counter()
+        self.stages: dict[str, dict[str, float]] = {}
+        self.counters: dict[str, int] = {}
+        self.interval = interval
+        self.label = label
+        self.reported = self.started
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Times the code run inside the block as part of a stage.
+
+        Args:
+            name (str): The stage name.
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            with self.lock:
+                totals = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+                totals['wall'] += wall
+                totals['cpu'] += cpu
+                totals['calls'] += 1
+
+    def iterate(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """
+        Yields from `items`, timing the production of every item as part of a stage.
+
+        Args:
+            name (str): The stage name.
+            items (Iterable[T]): The items, such as chunks read from a file.
+        """
+        iterator = iter(items)
+        while True:
+            with self.stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def count(self, name: str, value: int = 1):
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): The counter name.
+            value (int): The amount to add.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self, force: bool = False):
+        """
+        Writes a stats line to stderr if the interval has passed since the last one.
+
+        Args:
+            force (bool): Write the line even if the interval has not passed or is not set.
+        """
+        now = time.perf_counter()
+        if not force and (not self.interval or now - self.reported < self.interval):
+            return
+        self.reported = now
+        print(format_stats(self.to_dict(), self.label), file=sys.stderr, flush=True)
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Returns the elapsed time, stage times and counters.
+        """
+        with self.lock:
+            return {
+                'elapsed': time.perf_counter() - self.started,
+                'stages': {name: dict(totals) for name, totals in self.stages.items()},
+                'counters': dict(self.counters)
+            }
+
+def merge_stats(stats: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Combines the `RunStats.to_dict` of loads that ran in parallel.
+
+    Stage times and counters are added up, the elapsed time is the longest one.
+
+    Args:
+        stats (list[dict[str, Any]]): The stats to combine.
+
+    Returns:
+        dict[str, Any]: The combined stats.
+    """
+    merged: dict[str, Any] = {'elapsed': 0.0, 'stages': {}, 'counters': {}}
+    for item in stats:
+        merged['elapsed'] = max(merged['elapsed'], item['elapsed'])
+        for name, totals in item['stages'].items():
+            stage = merged['stages'].setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            for key, value in totals.items():
+                stage[key] += value
+        for name, value in item['counters'].items():
+            merged['counters'][name] = merged['counters'].get(name, 0) + value
+    return merged
+
+def format_stats(stats: dict[str, Any], label: str = '') -> str:
+    """
+    Formats stats as a single `key=value` line.
+
+    Args:
+        stats (dict[str, Any]): The stats from `RunStats.to_dict` or `merge_stats`.
+        label (str): Written at the start of the line, such as the part number.
+
+    Returns:
+        str: The line.
+    """
+    elapsed = max(stats['elapsed'], 1e-9)
+    fields = [f"elapsed={stats['elapsed']:.1f}s"]
+    fields += [f"{name}={value}" for name, value in stats['counters'].items()]
+    if 'rows' in stats['counters']:
+        fields.append(f"rows_per_sec={stats['counters']['rows'] / elapsed:.0f}")
+    fields += [f"{name}={totals['wall']:.2f}s/{totals['cpu']:.2f}cpu" for name, totals in stats['stages'].items()]
+    return ' '.join(['stats' + (f" {label}" if label else '')] + fields)
+
+def write_stats_json(file_path: str, stats: dict[str, Any]):
+    """
+    Writes the run statistics to a JSON file.
+
+    Args:
+        file_path (str): The JSON file path.
+        stats (dict[str, Any]): The statistics.
+    """
+    with open(file_path, 'w') as f:
+        json.dump(stats, f, indent=2, default=str)
@@ -0,0 +1,268 @@
+import decimal
+import re
+from typing import Any, Callable
+import numpy as np
+import pandas as pd
+
+from utils.convert import BOOLEAN_TYPES, DATE_TYPES, INTEGER_TYPES, NUMERIC_TYPES, TIMESTAMP_TYPES, compile_converter, null_mask
+from utils.pipeline import threaded
+from utils.reader import read_chunks
+
+INTEGER_RANGES = {'smallint': (-2 ** 15, 2 ** 15 - 1), 'integer': (-2 ** 31, 2 ** 31 - 1), 'bigint': (-2 ** 63, 2 ** 63 - 1)}
+REAL_MAX = 3.4028235e38
+# Boolean literals Postgres accepts, in lower case, including the unambiguous prefixes of the words
+BOOLEAN_VALUES = {'t', 'tr', 'tru', 'true', 'y', 'ye', 'yes', 'on', '1', 'f', 'fa', 'fal', 'fals', 'false', 'n', 'no', 'of', 'off', '0'}
+SPECIAL_NUMBERS = {'nan', 'infinity', '+infinity', '-infinity', 'inf', '+inf', '-inf'}
+SPECIAL_DATETIMES = {'infinity', '+infinity', '-infinity', 'epoch', 'now', 'today', 'tomorrow', 'yesterday'}
+LENGTH_TYPES = ('character varying', 'character')
+# Sample rows kept per column and check
+SAMPLE_ROWS = 5
+
+_TYPE_MODIFIERS = re.compile(r'^([^(]*)\((\d+)(?:,(\d+))?\)(.*)$')
+_ISO_DATETIME = (r'^(\d{4,})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?)?'
+                 r'\s*(?:Z|[+-]\d{1,2}(?::?\d{2})?)?(?:\s*BC)?$')
+
+Check = Callable[[pd.Series], dict[str, np.ndarray]]
+
+
+def parse_type(data_type: str) -> tuple[str, tuple[int, ...]]:
+    """
+    Splits a type with modifiers, as written by `format_type`, into its name and modifiers.
+
+    `numeric(10,2)` becomes `('numeric', (10, 2))` and `timestamp(3) without time zone`
+    becomes `('timestamp without time zone', (3,))`.
+    """
+    match = _TYPE_MODIFIERS.match(data_type)
+    if not match:
+        return data_type, ()
+    name, first, second, rest = match.groups()
+    return f"{name}{rest}", tuple(int(value) for value in (first, second) if value is not None)
+
+def _text(values: pd.Series) -> pd.Series:
+    return values.astype(str).str.strip()
+
+def _check_integer(name: str) -> Check:
+    low, high = INTEGER_RANGES[name]
+
+    def check(values: pd.Series) -> dict[str, np.ndarray]:
+        text = None if pd.api.types.is_numeric_dtype(values.dtype) else _text(values)
+        numbers = values if text is None else pd.to_numeric(text, errors='coerce')
+        invalid = numbers.isna().to_numpy()
+        valid = ~invalid
+        if pd.api.types.is_integer_dtype(numbers.dtype):
+            # Compared as integers, 2 ** 63 parses as uint64 and is out of the bigint range
+            integers = numbers.fillna(0).to_numpy()
+            return {
+                'not a number': invalid,
+                'not a whole number': np.zeros(len(values), dtype=bool),
+                'out of range': valid & ((integers < low) | (integers > high)),
+            }
+        floats = numbers.to_numpy(dtype=float)
+        fraction = valid & (np.mod(np.nan_to_num(floats), 1) != 0)
+        # The bounds are powers of two, exact as floats
+        overflow = valid & ((floats < low) | (floats >= high + 1))
+        if text is not None:
+            # Text is rounded to the nearest float past 2 ** 53, those values are checked again exactly
+            for row in np.flatnonzero(valid & (np.abs(floats) >= 2 ** 53)):
+                number = decimal.Decimal(text.iat[row])
+                fraction[row] = number != number.to_integral_value()
+                overflow[row] = not low <= number <= high
+        return {'not a number': invalid, 'not a whole number': fraction, 'out of range': overflow}
+    return check
+
+def _check_numeric(name: str, modifiers: tuple[int, ...]) -> Check:
+    def check(values: pd.Series) -> dict[str, np.ndarray]:
+        if pd.api.types.is_bool_dtype(values.dtype):
+            return {'not a number': np.ones(len(values), dtype=bool)}
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            numbers, special = values, np.zeros(len(values), dtype=bool)
+        else:
+            text = _text(values)
+            numbers = pd.to_numeric(text, errors='coerce')
+            special = text.str.lower().isin(SPECIAL_NUMBERS).to_numpy()
+        floats = numbers.to_numpy(dtype=float)
+        invalid = numbers.isna().to_numpy() & ~special
+        finite = np.isfinite(floats) & ~special
+        if name == 'real':
+            overflow = finite & (np.abs(floats) > REAL_MAX)
+        elif name == 'numeric' and modifiers:
+            precision, scale = modifiers[0], modifiers[1] if len(modifiers) > 1 else 0
+            overflow = finite & (np.round(np.abs(np.nan_to_num(floats)), scale) >= 10.0 ** (precision - scale))
+        else:
+            overflow = np.zeros(len(values), dtype=bool)
+        return {'not a number': invalid, 'out of range': overflow}
+    return check
+
+def _check_boolean(values: pd.Series) -> dict[str, np.ndarray]:
+    if pd.api.types.is_bool_dtype(values.dtype) or pd.api.types.is_numeric_dtype(values.dtype):
+        return {'not a boolean': np.zeros(len(values), dtype=bool)}
+    return {'not a boolean': ~_text(values).str.lower().isin(BOOLEAN_VALUES).to_numpy()}
+
+def _days_in_month(years: np.ndarray, months: np.ndarray) -> np.ndarray:
+    leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+    days = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(months, 1, 12) - 1]
+    return days + (leap & (months == 2))
+
+def _check_datetime(values: pd.Series) -> dict[str, np.ndarray]:
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return {'not a date': np.zeros(len(values), dtype=bool)}
+    text = _text(values)
+    valid = pd.to_datetime(text, format='ISO8601', errors='coerce', utc=True).notna().to_numpy()
+    if valid.all():
+        return {'not a date': ~valid}
+    # The fast parser misses dates past the year 2262, special values and other formats
+    rest = text[~valid]
+    parts = rest.str.extract(_ISO_DATETIME).apply(pd.to_numeric).fillna(0).to_numpy(dtype=np.int64)
+    year, month, day, hour, minute, second = parts.T
+    iso = rest.str.match(_ISO_DATETIME).to_numpy()
+    rest_valid = iso & (month >= 1) & (month <= 12) & (day >= 1) & (day <= _days_in_month(year, month)) & (hour <= 24) & (minute < 60) & (second <= 60)
+    rest_valid |= rest.str.lower().isin(SPECIAL_DATETIMES).to_numpy()
+    other = ~iso & ~rest_valid
+    if other.any():
+        # Formats such as 01/02/2024 are left to the slower parser of pandas
+        rest_valid[other] = pd.to_datetime(rest[other], format='mixed', errors='coerce').notna().to_numpy()
+    valid[~valid] = rest_valid
+    return {'not a date': ~valid}
+
+def _check_length(name: str, length: int) -> Check:
+    convert = compile_converter(name)
+
+    def check(values: pd.Series) -> dict[str, np.ndarray]:
+        text = convert(values)
+        if name == 'character':
+            text = text.str.rstrip(' ') # Trailing spaces of char(n) values are dropped
+        return {'too long': (text.str.len() > length).to_numpy()}
+    return check
+
+def compile_check(data_type: str) -> Check|None:
+    """
+    Returns a vectorized check of the values of a Postgres data type.
+
+    Args:
+        data_type (str): The type of the column with its modifiers, such as `numeric(10,2)` or `character varying(20)`.
+
+    Returns:
+        Check|None: A function mapping the non-null values of a column to a boolean failure mask
+            per check, or None for types that are not checked.
+    """
+    name, modifiers = parse_type(data_type)
+    if name in INTEGER_TYPES:
+        return _check_integer(name)
+    if name in NUMERIC_TYPES:
+        return _check_numeric(name, modifiers)
+    if name in BOOLEAN_TYPES:
+        return _check_boolean
+    if name in DATE_TYPES + TIMESTAMP_TYPES:
+        return _check_datetime
+    if name in LENGTH_TYPES and modifiers:
+        return _check_length(name, modifiers[0])
+    return None
+
+class Validation:
+    """
+    Checks chunks of CSV rows against the types and NOT NULL constraints of their columns.
+
+    Failures are counted per column and check, with the row numbers and values of the first few.
+    Columns of the table that are not loaded fail as a whole when they are NOT NULL without a default.
+
+    Args:
+        columns (list[dict[str, Any]]): Every column of the table, from `db.get_column_details`.
+        selected (list[str]): The columns loaded from the file.
+    """
+
+    def __init__(self, columns: list[dict[str, Any]], selected: list[str]):
+        self.columns = [column for column in columns if column['name'] in selected]
+        self.checks = {column['name']: compile_check(column['type']) for column in self.columns}
+        self.missing = [column['name'] for column in columns
+                        if column['name'] not in selected and column['not_null'] and not column['has_default']]
+        self.rows = 0
+        self.failures: dict[str, dict[str, int]] = {column['name']: {} for column in self.columns}
+        self.samples: dict[str, dict[str, list[tuple[int, str]]]] = {column['name']: {} for column in self.columns}
+
+    def _record(self, column: str, check: str, values: pd.Series):
+        if not len(values):
+            return
+        self.failures[column][check] = self.failures[column].get(check, 0) + len(values)
+        samples = self.samples[column].setdefault(check, [])
+        for row, value in values.iloc[:SAMPLE_ROWS - len(samples)].items():
+            samples.append((int(row), str(value)))
+
+    def check(self, chunk: pd.DataFrame):
+        """
+        Checks a chunk of rows, indexed by their row numbers.
+        """
+        self.rows += len(chunk)
+        for column in self.columns:
+            series = chunk[column['name']]
+            nulls = null_mask(series).to_numpy()
+            if column['not_null']:
+                self._record(column['name'], 'null', pd.Series('', index=series.index[nulls]))
+            check = self.checks[column['name']]
+            if check and not nulls.all():
+                values = series[~nulls]
+                for name, failed in check(values).items():
+                    self._record(column['name'], name, values[failed])
+
+    def report(self) -> dict[str, Any]:
+        """
+        Returns the rows checked, the missing columns and the failures of every column that has some.
+        """
+        types = {column['name']: column['type'] for column in self.columns}
+        return {
+            'rows': self.rows,
+            'missing_columns': self.missing,
+            'failed_checks': sum(sum(failures.values()) for failures in self.failures.values()),
+            'columns': {column: {'type': types[column], 'failures': failures, 'samples': self.samples[column]}
+                        for column, failures in self.failures.items() if failures},
+        }
+
+def validate_file(csv_file: str, columns: list[dict[str, Any]], selected: list[str], chunk_rows: int = 100000,
+                  on_progress: Callable[[int], None]|None = None) -> dict[str, Any]:
+    """
+    Checks every row of a file against the columns of a table, without loading it.
+
+    The file is read in chunks in a background thread while the previous chunk is checked.
+    Progress is counted in bytes of the file itself, compressed bytes for a compressed file.
+
+    Args:
+        csv_file (str): The path to the file, in any format `read_chunks` reads.
+        columns (list[dict[str, Any]]): Every column of the table, from `db.get_column_details`.
+        selected (list[str]): The columns loaded from the file.
+        chunk_rows (int): The number of CSV rows read into memory at a time.
+        on_progress (Callable[[int], None]|None): Called with the number of bytes read after each chunk.
+
+    Returns:
+        dict[str, Any]: The `Validation.report`, with `failed_checks` counting the failures of every check.
+    """
+    read = reported = 0
+
+    def on_read(position: int):
+        nonlocal read
+        read = position
+
+    validation = Validation(columns, selected)
+    chunks = threaded(read_chunks(csv_file, chunk_rows, on_read=on_read, columns=selected), 2)
+    try:
+        for chunk, _ in chunks:
+            validation.check(chunk)
+            if on_progress:
+                on_progress(read - reported)
+            reported = read
+    finally:
+        chunks.close()
+    return validation.report()
+
+def format_validation(report: dict[str, Any]) -> str:
+    """
+    Formats a validation report as lines of text, one per column and check with sample rows.
+    """
+    lines = [f"Checked {report['rows']} rows"]
+    for column in report['missing_columns']:
+        lines.append(f"  {column}: NOT NULL without a default, and not in the file")
+    for column, result in report['columns'].items():
+        for check, count in result['failures'].items():
+            samples = ', '.join(f"row {row} ({value[:40]!r})" if value else f"row {row}" for row, value in result['samples'][check])
+            lines.append(f"  {column} {result['type']}: {count} {check}, e.g. {samples}")
+    if not report['missing_columns'] and not report['columns']:
+        lines.append("  No problems found")
+    return '\n'.join(lines)